@@ -0,0 +1,114 @@
+"""
+Incrementally updated evaluation statistics for the live Results page.
+New rows from `evaluations` are folded into running counters, so a refresh
+costs one small query for rows newer than the last one seen instead of a
+full reload.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+Z_95 = 1.96
+
+
+def wilson_interval(successes: int, total: int, z: float = Z_95) -> tuple[float, float]:
+    """Wilson score interval for a binomial proportion."""
+    if total == 0:
+        return 0.0, 1.0
+    p = successes / total
+    denom = 1 + z ** 2 / total
+    center = (p + z ** 2 / (2 * total)) / denom
+    margin = z * math.sqrt(p * (1 - p) / total + z ** 2 / (4 * total ** 2)) / denom
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+class LiveStats:
+    """Running win/loss/tie counters, head-to-head matrix and win-rate history."""
+
+    def __init__(self):
+        self.variant_wins = Counter()
+        self.variant_losses = Counter()
+        self.variant_ties = Counter()
+        self.head_to_head = Counter()  # (winner, loser) -> count
+        self.evaluators = Counter()
+        self.total_evaluations = 0
+        self.history = []  # One point per applied evaluation: {"n", "created_at", variant: win rate}
+        self.last_created_at = None
+        self.last_refresh = 0.0
+        self._seen_ids = set()
+        self._unresolved = []  # Evaluations whose interpretations are not in the variant map yet
+        self._lock = threading.Lock()
+
+    def apply(self, evaluations: list[dict], variant_map: dict):
+        """Fold new evaluation rows (ordered by created_at) into the counters."""
+        pending, self._unresolved = self._unresolved, []
+
+        for e in pending + evaluations:
+            if e["id"] in self._seen_ids:
+                continue
+
+            winner_variant = variant_map.get(e["interpretation_id"])
+            loser_id = e.get("preferred_over")
+            loser_variant = variant_map.get(loser_id) if loser_id else None
+
+            if not winner_variant or (loser_id and not loser_variant):
+                self._unresolved.append(e)
+                continue
+
+            if loser_id:
+                self.variant_wins[winner_variant] += 1
+                self.variant_losses[loser_variant] += 1
+                self.head_to_head[(winner_variant, loser_variant)] += 1
+            else:
+                self.variant_ties[winner_variant] += 1
+
+            self._seen_ids.add(e["id"])
+            self.evaluators[e["evaluator_name"]] += 1
+            self.total_evaluations += 1
+            if self.last_created_at is None or e["created_at"] > self.last_created_at:
+                self.last_created_at = e["created_at"]
+            self._record_history(e["created_at"])
+
+    def _record_history(self, created_at: str):
+        point = {"n": self.total_evaluations, "created_at": created_at}
+        for v in self.variants():
+            total = self.variant_wins[v] + self.variant_losses[v] + self.variant_ties[v]
+            point[v] = self.variant_wins[v] / total * 100 if total else None
+        self.history.append(point)
+
+    def refresh(self, fetch_since, variant_map: dict, min_interval: float = 0.0) -> bool:
+        """
+        Pull evaluations newer than the last one seen and apply them.
+        Concurrent callers share one fetch; returns True if a fetch happened.
+        """
+        with self._lock:
+            if time.monotonic() - self.last_refresh < min_interval:
+                return False
+            self.apply(fetch_since(self.last_created_at), variant_map)
+            self.last_refresh = time.monotonic()
+            return True
+
+    def variants(self) -> list[str]:
+        return sorted(set(self.variant_wins) | set(self.variant_losses) | set(self.variant_ties))
+
+    def win_rate(self, variant: str) -> tuple[float, float, float]:
+        """Win rate with its 95% Wilson interval, all in percent."""
+        wins = self.variant_wins[variant]
+        total = wins + self.variant_losses[variant] + self.variant_ties[variant]
+        low, high = wilson_interval(wins, total)
+        return (wins / total * 100 if total else 0.0), low * 100, high * 100
+
+    def snapshot(self) -> dict:
+        """Copy of the counters in the same shape the Results page renders."""
+        with self._lock:
+            return {
+                "total_evaluations": self.total_evaluations,
+                "variant_wins": dict(self.variant_wins),
+                "variant_losses": dict(self.variant_losses),
+                "variant_ties": dict(self.variant_ties),
+                "head_to_head": dict(self.head_to_head),
+                "evaluators": Counter(self.evaluators),
+                "win_rates": {v: self.win_rate(v) for v in self.variants()},
+                "history": list(self.history),
+            }
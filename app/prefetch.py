@@ -0,0 +1,177 @@
+"""
+Background helpers for the evaluation app.
+PairPrefetcher keeps the next pairs ready in a per-session buffer and
+EvaluationWriter saves votes behind the user's back, so a click never waits
+for Supabase round trips. Votes it cannot save, after all retries or still
+queued when the server stops, are appended to a local spool file and sent
+again when the next writer starts, so an acknowledged vote is never lost.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+PREFETCH_SIZE = 3  # Pairs kept ready per session
+EMPTY_POLL_SECONDS = 5.0  # Wait before asking again when there is nothing to compare
+IDLE_TIMEOUT_SECONDS = 1800  # Stop the prefetch thread of an abandoned session
+WRITE_MAX_RETRIES = 5
+WRITE_BACKOFF_SECONDS = 0.5
+SHUTDOWN_FLUSH_SECONDS = 10.0  # Time to finish queued writes at exit before spooling the rest
+
+logger = logging.getLogger(__name__)
+
+
+def pair_key(pair: list[dict]) -> frozenset:
+    """Order-independent identity of a pair."""
+    return frozenset(p["id"] for p in pair)
+
+
+class PairPrefetcher:
+    """Per-session buffer of the next pairs, refilled by a background thread."""
+
+    def __init__(self, fetch_pair, size: int = PREFETCH_SIZE):
+        self.fetch_pair = fetch_pair
+        self.buffer = queue.Queue(maxsize=size)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._last_used = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        # Let the thread use the app's st.cache_data functions without warnings
+        add_script_run_ctx(self._thread, get_script_run_ctx())
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if time.monotonic() - self._last_used > IDLE_TIMEOUT_SECONDS:
+                break
+
+            if self.buffer.full():
+                self._wakeup.wait(timeout=EMPTY_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            try:
+                pair = self.fetch_pair()
+            except Exception:
+                logger.exception("Prefetch failed")
+                self._stopped.wait(EMPTY_POLL_SECONDS)
+                continue
+
+            if not pair:
+                self._stopped.wait(EMPTY_POLL_SECONDS)
+                continue
+
+            # Skip a pair that is already waiting in the buffer; with few pairs left every
+            # fetch may return one, so wait for the buffer to be drawn from before trying again
+            if any(pair_key(p) == pair_key(pair) for p in list(self.buffer.queue)):
+                self._wakeup.wait(timeout=EMPTY_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            self.buffer.put(pair)
+
+    def next_pair(self) -> list[dict] | None:
+        """Return a ready pair, or fetch one synchronously if the buffer is empty."""
+        self._last_used = time.monotonic()
+        try:
+            pair = self.buffer.get_nowait()
+        except queue.Empty:
+            pair = self.fetch_pair()
+        self._wakeup.set()
+        return pair
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+
+class EvaluationWriter:
+    """
+    Write-behind queue for evaluation inserts with retry and exponential backoff.
+    Records must have a client-side id, so a record sent twice is saved once.
+    """
+
+    def __init__(self, insert, spool_path: Path, max_retries: int = WRITE_MAX_RETRIES,
+                 backoff: float = WRITE_BACKOFF_SECONDS):
+        self.insert = insert
+        self.spool_path = spool_path
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failed = []  # Records that could not be saved after all retries (spooled)
+        self._queue = queue.Queue()
+        self._spool_lock = threading.Lock()
+        self._in_flight = None
+        for record in self._take_spool():
+            self._queue.put(record)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record: dict):
+        self._queue.put(record)
+
+    def pending(self) -> int:
+        """Number of records not yet saved (queued or in flight)."""
+        return self._queue.unfinished_tasks
+
+    def failed_count(self, evaluator_name: str) -> int:
+        """Records of one evaluator that could not be saved in this process."""
+        return sum(1 for r in list(self.failed) if r.get("evaluator_name") == evaluator_name)
+
+    def close(self, timeout: float = SHUTDOWN_FLUSH_SECONDS):
+        """Give queued writes up to `timeout` to finish, then spool what is left."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # A record still in flight may yet be saved; spooling it too is safe (same id)
+        left = [self._in_flight] if self.pending() and self._in_flight else []
+        while True:
+            try:
+                left.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if left:
+            logger.warning("Spooling %d unsaved evaluations to %s", len(left), self.spool_path)
+            self._spool(left)
+
+    def _spool(self, records: list[dict]):
+        with self._spool_lock:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spool_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _take_spool(self) -> list[dict]:
+        """Records spooled by earlier writers; the spool is emptied."""
+        with self._spool_lock:
+            if not self.spool_path.exists():
+                return []
+            records = [json.loads(line) for line in self.spool_path.read_text().splitlines() if line.strip()]
+            self.spool_path.unlink()
+        if records:
+            logger.warning("Resending %d spooled evaluations from %s", len(records), self.spool_path)
+        return records
+
+    def _run(self):
+        while True:
+            record = self._in_flight = self._queue.get()
+            try:
+                for attempt in range(self.max_retries):
+                    try:
+                        self.insert(record)
+                        break
+                    except Exception as e:
+                        logger.warning("Evaluation save failed (attempt %d/%d): %s", attempt + 1, self.max_retries, e)
+                        time.sleep(self.backoff * 2 ** attempt)
+                else:
+                    logger.error("Evaluation %s not saved after %d attempts, spooled to %s",
+                                 record.get("id"), self.max_retries, self.spool_path)
+                    self._spool([record])
+                    self.failed.append(record)
+            finally:
+                self._in_flight = None
+                self._queue.task_done()
@@ -2,45 +2,31 @@
 Streamlit app for blind A/B evaluation of diagnostic interpretations.
 """
 import os
+import sys
+import json
 import random
+import time
+import uuid
+from pathlib import Path
 import streamlit as st
-from supabase import create_client
-from collections import Counter
-
-# User profiles with full data
-USER_PROFILES = {
-    1: {
-        "name": "Ania", "age": 28, "gender": "K", "work_type": "umysłowa", "is_leader": False,
-        "subtopics": ["Zarządzanie stresem", "Poprawa snu", "Uważność na co dzień", "Relacje z partnerem",
-                      "Poczucie własnej wartości", "Syndrom Oszusta", "Efektywna komunikacja w pracy",
-                      "Motywacja i produktywność", "Zdrowa dieta", "Ćwiczenia oddechowe", "Trening cardio",
-                      "Inteligencja emocjonalna", "Budowanie zdolności kredytowej", "Wyciszenie przed snem", "Higiena cyfrowa"]
-    },
-    2: {
-        "name": "Tomek", "age": 38, "gender": "M", "work_type": "umysłowa", "is_leader": True,
-        "subtopics": ["Wypalenie zawodowe", "Efektywne zarządzanie czasem", "Motywowanie pracowników",
-                      "Efektywny feedback", "Zarządzanie zmianą", "Rozwiązywanie konfliktów w zespole",
-                      "Zarządzanie stresem", "Radzenie sobie z lękiem", "Poprawa snu", "Relacje z nastolatkami (13-18)",
-                      "Wczesne rodzicielstwo (0-5)", "Planowanie emerytury", "Podstawy inwestowania",
-                      "Neuroróżnorodność w zespole", "Coaching i mentoring"]
-    },
-    3: {
-        "name": "Magda", "age": 42, "gender": "K", "work_type": "fizyczna", "is_leader": False,
-        "subtopics": ["Higiena snu dla pracowników zmianowych", "Radzenie sobie z lękiem", "Życie z chorobą przewlekłą",
-                      "Odżywianie dla pracowników zmianowych", "Bezpieczeństwo i zapobieganie urazom",
-                      "Ćwiczenia dla pracowników fizycznych", "Opieka nad seniorami", "Opieka nad chorymi i niepełnosprawnymi",
-                      "Żałoba i Strata", "Radzenie sobie z traumą", "Zarządzanie domowym budżetem", "Zdrowie kobiety",
-                      "Relacje z dziećmi (6-12)", "Wypalenie rodzicielskie", "Depresja"]
-    },
-    4: {
-        "name": "Marek", "age": 50, "gender": "M", "work_type": "fizyczna", "is_leader": True,
-        "subtopics": ["Ćwiczenia dla pracowników fizycznych", "Zarządzanie wypaleniem w zespole", "Zdrowe nawyki",
-                      "Rozciąganie i mobilność", "Trening siłowy", "Zdrowie mężczyzny", "Ograniczanie alkoholu",
-                      "Rzucanie palenia", "Zarządzanie zespołami zdalnymi", "Różnorodność pokoleniowa w zespole",
-                      "Efektywna praca zdalna i hybrydowa", "Rozwiązywanie konfliktów w pracy", "Wychodzenie z długów",
-                      "Strategie oszczędzania", "Kryzys w pracy", "Relacje z partnerem"]
-    },
-}
+from supabase import create_client, ClientOptions
+from prefetch import PairPrefetcher, EvaluationWriter
+from live_stats import LiveStats, wilson_interval
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.append(str(BASE_DIR / "scripts"))
+
+from sequential import SequentialMonitor, STATUS_PL  # noqa: E402
+from dedup import MinHashLSH, index_path, update_index, SIMILARITY_THRESHOLD  # noqa: E402
+from cube import DIMENSIONS, DIMENSION_PL, PAIR_SEPARATOR, StratifiedCube, build_cube  # noqa: E402
+from transport import build_http_client  # noqa: E402
+from db import fetch_all  # noqa: E402
+from text_store import METADATA_COLUMNS, TextLoader  # noqa: E402
+
+DATA_VERSION_TTL = 30  # Seconds between checks for new interpretations
+LIVE_REFRESH_SECONDS = 5  # Results page polling interval
+JUDGE_VERDICTS_TTL = 300  # Seconds; verdicts change only when judge_pairs.py runs
+UNSAVED_EVALUATIONS_PATH = BASE_DIR / ".cache/unsaved_evaluations.jsonl"  # Votes the writer could not save
 
 LEVEL_PL = {
     "minimal": "Minimalny",
@@ -99,7 +85,97 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     st.error("Brak konfiguracji Supabase.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+@st.cache_resource
+def get_supabase():
+    """One Supabase client (and its tuned HTTP connection pool, see transport.py) shared by all sessions."""
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=build_http_client()))
+
+
+@st.cache_resource
+def get_text_loader() -> TextLoader:
+    """Texts fetched on demand, with one LRU cache of decompressed texts shared by all sessions."""
+    return TextLoader(get_supabase)
+
+
+@st.cache_resource
+def get_evaluation_writer():
+    """Write-behind queue shared by all sessions."""
+    return EvaluationWriter(insert_evaluation, UNSAVED_EVALUATIONS_PATH)
+
+
+@st.cache_resource
+def get_live_stats(experiment_id: str):
+    """Live statistics of one experiment, shared by all sessions viewing the Results page."""
+    return LiveStats()
+
+
+@st.cache_data(show_spinner=False)
+def load_user_profiles() -> dict:
+    """User profiles keyed by id."""
+    with open(BASE_DIR / "data/user_profiles_v2.json") as f:
+        return {p["id"]: p for p in json.load(f)}
+
+
+@st.cache_data(ttl=DATA_VERSION_TTL, show_spinner=False)
+def get_active_experiment() -> str:
+    """Id of the active experiment; switching experiments is picked up within DATA_VERSION_TTL."""
+    return get_supabase().rpc("current_experiment_id").execute().data
+
+
+@st.cache_data(ttl=DATA_VERSION_TTL, show_spinner=False)
+def get_data_version() -> tuple:
+    """Cheap fingerprint of the active experiment's interpretations: (experiment, row count, newest created_at)."""
+    experiment_id = get_active_experiment()
+    result = get_supabase().table("interpretations").select(
+        "created_at", count="exact"
+    ).eq("experiment_id", experiment_id).order("created_at", desc=True).limit(1).execute()
+    newest = result.data[0]["created_at"] if result.data else None
+    return experiment_id, result.count, newest
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_interpretation_index(version: tuple) -> list[dict]:
+    """Metadata (no text) of all non-empty interpretations, cached per data version."""
+    return fetch_all(lambda: get_supabase().table("interpretations").select(
+        "id, instrument_code, score, level, user_profile_id, prompt_variant, text_storage"
+    ).eq("experiment_id", version[0]).gt("text_length", 0).order("id"))
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_near_duplicate_pairs(version: tuple) -> set[frozenset]:
+    """Id pairs of near-identical interpretations; they make useless A/B pairs."""
+    path = index_path(version[0])
+    index = MinHashLSH.load(path)  # Kept up to date by the generators and dedup.py
+    new_rows = [r for r in load_interpretation_index(version) if r["id"] not in index.signatures]
+    if update_index(index, get_text_loader().with_texts(new_rows)):  # Bulk read, kept out of the LRU cache
+        index.save(path)
+    return set(index.near_duplicate_pairs(SIMILARITY_THRESHOLD))
+
+
+@st.cache_data(ttl=JUDGE_VERDICTS_TTL, show_spinner=False)
+def load_judged_pairs(experiment_id: str) -> set[frozenset]:
+    """Id pairs the LLM judge decided the same way in both orderings (see judge_pairs.py)."""
+    from judge_pairs import JUDGE_MODEL, combine_verdicts
+
+    verdicts = fetch_all(lambda: get_supabase().table("judge_verdicts").select(
+        "interpretation_a, interpretation_b, winner_id"
+    ).eq("experiment_id", experiment_id).eq("judge_model", JUDGE_MODEL).order("id"))
+    return {pair for pair, verdict in combine_verdicts(verdicts).items() if verdict != "ambiguous"}
+
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def load_interpretation(interpretation_id: str) -> dict | None:
+    """Interpretation metadata (text via get_text_loader). Rows are immutable, so they are cached for good."""
+    result = get_supabase().table("interpretations").select(METADATA_COLUMNS).eq("id", interpretation_id).execute()
+    return result.data[0] if result.data else None
+
+
+def get_variant_map() -> dict:
+    """Interpretation id -> prompt variant."""
+    return {r["id"]: r["prompt_variant"] for r in load_interpretation_index(get_data_version())}
+
 
 # Page config - wide layout, no sidebar
 st.set_page_config(
@@ -129,19 +205,14 @@ if "page" not in st.session_state:
 
 
 def get_random_pair():
-    """Get two random interpretations for the same instrument/score/profile to compare."""
-    # Get all non-empty interpretations
-    result = supabase.table("interpretations").select(
-        "id, instrument_code, score, level, user_profile_id, interpretation_text"
-    ).in_("instrument_code", ["PHQ-9", "GAD-7"]).execute()
-
-    if not result.data:
-        return None
-
-    # Filter out empty interpretations
+    """
+    Get two random interpretations for the same instrument/score/profile to compare.
+    Pairs the LLM judge has not judged, or judged differently in the two orderings,
+    go first; consistently judged pairs are shown only when no other pair is left.
+    """
     valid_interpretations = [
-        r for r in result.data
-        if r.get("interpretation_text") and r["interpretation_text"].strip()
+        r for r in load_interpretation_index(get_data_version())
+        if r["instrument_code"] in ["PHQ-9", "GAD-7"]
     ]
 
     if not valid_interpretations:
@@ -156,6 +227,11 @@ def get_random_pair():
     if not combinations:
         return None
 
+    settled = get_sequential_monitor().settled()
+    near_duplicates = load_near_duplicate_pairs(get_data_version())
+    judged = load_judged_pairs(get_active_experiment())
+    judged_candidates = []
+
     # Shuffle and try combinations until we find one with 2+ interpretations
     random.shuffle(combinations)
 
@@ -168,68 +244,95 @@ def get_random_pair():
             and r["user_profile_id"] == user_profile_id
         ]
 
-        if len(matching) >= 2:
-            # Fetch full data for the pair
-            pair_ids = [m["id"] for m in random.sample(matching, 2)]
-            full_data = supabase.table("interpretations").select("*").in_("id", pair_ids).execute()
-            if len(full_data.data) == 2:
-                pair = full_data.data
-                random.shuffle(pair)
-                return pair
+        # Skip variant comparisons the sequential test has already settled and near-duplicate texts
+        candidates = [
+            (a, b) for i, a in enumerate(matching) for b in matching[i + 1:]
+            if frozenset((a["prompt_variant"], b["prompt_variant"])) not in settled
+            and frozenset((a["id"], b["id"])) not in near_duplicates
+        ]
+
+        open_candidates = [(a, b) for a, b in candidates if frozenset((a["id"], b["id"])) not in judged]
+        judged_candidates += [(a, b) for a, b in candidates if frozenset((a["id"], b["id"])) in judged]
+        pair = load_pair(open_candidates)
+        if pair:
+            return pair
+
+    return load_pair(judged_candidates)
 
-    return None
+
+def load_pair(candidates: list[tuple[dict, dict]]) -> list[dict] | None:
+    """One random candidate pair in random order, or None."""
+    if not candidates:
+        return None
+    # Fetch the pair's metadata, and its texts into the cache before the pair is shown
+    pair = [load_interpretation(m["id"]) for m in random.choice(candidates)]
+    if not all(pair):
+        return None
+    get_text_loader().texts(pair)
+    random.shuffle(pair)
+    return pair
+
+
+def insert_evaluation(record: dict):
+    """Write a single evaluation row; its client-side id makes the writer's retries idempotent."""
+    get_supabase().table("evaluations").upsert(record, on_conflict="id", ignore_duplicates=True).execute()
 
 
 def save_evaluation(winner_id: str, loser_id: str | None):
-    """Save evaluation to Supabase."""
-    supabase.table("evaluations").insert({
+    """Queue evaluation for a background write to Supabase, with the shown order and time to decide."""
+    pair = st.session_state.current_pair
+    get_evaluation_writer().submit({
+        "id": str(uuid.uuid4()),
+        # The pair's own experiment, even if the active one was switched since it was shown
+        "experiment_id": load_interpretation(winner_id)["experiment_id"],
         "interpretation_id": winner_id,
         "evaluator_name": st.session_state.evaluator_name,
         "rating": 3,
         "preferred_over": loser_id,
+        "shown_a": pair[0]["id"],
+        "shown_b": pair[1]["id"],
+        "response_time_ms": int((time.time() - st.session_state.pair_shown_at) * 1000),
         "feedback": ""
-    }).execute()
+    })
+
+
+def next_pair():
+    """Take the next pair from this session's prefetch buffer."""
+    if "prefetcher" not in st.session_state:
+        st.session_state.prefetcher = PairPrefetcher(get_random_pair)
+    return st.session_state.prefetcher.next_pair()
+
+
+def fetch_evaluations_since(created_at: str | None) -> list[dict]:
+    """Evaluations created at or after `created_at`, oldest first, paged past the API row limit."""
+    def build_query():
+        query = get_supabase().table("evaluations").select("*").eq(
+            "experiment_id", get_active_experiment()
+        ).order("created_at").order("id")
+        return query.gte("created_at", created_at) if created_at else query
+
+    return fetch_all(build_query)
+
+
+def get_sequential_monitor() -> SequentialMonitor:
+    """Sequential test state built from the shared live head-to-head counts."""
+    live = get_live_stats(get_active_experiment())
+    live.refresh(fetch_evaluations_since, get_variant_map(), min_interval=LIVE_REFRESH_SECONDS)
+    return SequentialMonitor.from_head_to_head(live.snapshot()["head_to_head"])
 
 
 def get_stats():
-    """Get detailed statistics."""
-    # Get all evaluations
-    evals = supabase.table("evaluations").select("*").execute()
-
-    # Get all interpretations for variant mapping
-    interps = supabase.table("interpretations").select("id, prompt_variant").execute()
-    variant_map = {i["id"]: i["prompt_variant"] for i in interps.data}
-
-    # Count wins per variant
-    variant_wins = Counter()
-    variant_losses = Counter()
-    variant_ties = Counter()
-    head_to_head = {}  # (winner, loser) -> count
-
-    for e in evals.data:
-        winner_variant = variant_map.get(e["interpretation_id"])
-        loser_id = e.get("preferred_over")
-
-        if loser_id:
-            loser_variant = variant_map.get(loser_id)
-            if winner_variant and loser_variant:
-                variant_wins[winner_variant] += 1
-                variant_losses[loser_variant] += 1
-                key = (winner_variant, loser_variant)
-                head_to_head[key] = head_to_head.get(key, 0) + 1
-        else:
-            # Tie
-            if winner_variant:
-                variant_ties[winner_variant] += 1
-
-    return {
-        "total_evaluations": len(evals.data),
-        "variant_wins": dict(variant_wins),
-        "variant_losses": dict(variant_losses),
-        "variant_ties": dict(variant_ties),
-        "head_to_head": head_to_head,
-        "evaluators": Counter(e["evaluator_name"] for e in evals.data)
-    }
+    """Get detailed statistics, refreshed incrementally from new evaluations only."""
+    live = get_live_stats(get_active_experiment())
+    live.refresh(fetch_evaluations_since, get_variant_map(), min_interval=LIVE_REFRESH_SECONDS)
+    return live.snapshot()
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_cube(version: tuple, total_evaluations: int) -> StratifiedCube:
+    """Stratified cube, rebuilt only when interpretations or the evaluation count change."""
+    interpretations = {r["id"]: r for r in load_interpretation_index(version)}
+    return build_cube(fetch_evaluations_since(None), interpretations, load_user_profiles())
 
 
 # === LOGIN ===
@@ -274,13 +377,18 @@ with col_h5:
     if st.button("🚪", help="Wyloguj"):
         st.session_state.evaluator_name = None
         st.session_state.current_pair = None
+        if "prefetcher" in st.session_state:
+            st.session_state.prefetcher.stop()
+            del st.session_state.prefetcher
         st.rerun()
 
 st.markdown("---")
 
 
 # === RESULTS PAGE ===
-if st.session_state.page == "results":
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_results():
+    """Statistics section, re-rendered in place as new evaluations arrive."""
     stats = get_stats()
 
     st.markdown("## Statystyki ewaluacji")
@@ -307,8 +415,7 @@ if st.session_state.page == "results":
             wins = stats["variant_wins"].get(v, 0)
             losses = stats["variant_losses"].get(v, 0)
             ties = stats["variant_ties"].get(v, 0)
-            total = wins + losses + ties
-            win_rate = (wins / total * 100) if total > 0 else 0
+            win_rate, ci_low, ci_high = stats["win_rates"][v]
 
             desc = PROMPT_DESCRIPTIONS.get(v, {})
             rows.append({
@@ -318,7 +425,8 @@ if st.session_state.page == "results":
                 "Wygrane": wins,
                 "Przegrane": losses,
                 "Remisy": ties,
-                "Win Rate": f"{win_rate:.1f}%"
+                "Win Rate": f"{win_rate:.1f}%",
+                "95% CI": f"{ci_low:.0f}–{ci_high:.0f}%"
             })
 
         # Sort by win rate descending
@@ -353,7 +461,8 @@ if st.session_state.page == "results":
                     row_total_matches += total
                     if total > 0:
                         pct = wins / total * 100
-                        row[col_var] = f"{pct:.0f}%"
+                        ci_low, ci_high = wilson_interval(wins, total)
+                        row[col_var] = f"{pct:.0f}% [{ci_low * 100:.0f}–{ci_high * 100:.0f}]"
                     else:
                         row[col_var] = "—"
             # Add row totals
@@ -391,6 +500,95 @@ if st.session_state.page == "results":
 
     st.markdown("---")
 
+    # Sequential test status
+    st.markdown("### Test sekwencyjny")
+    st.caption("Rozstrzygnięte porównania nie są już pokazywane ewaluatorom")
+
+    sequential_rows = []
+    for (var_a, var_b), r in SequentialMonitor.from_head_to_head(stats["head_to_head"]).report().items():
+        verdict = STATUS_PL[r["status"]]
+        if r["status"] == "winner":
+            verdict += f" → {r['winner']}"
+        sequential_rows.append({
+            "Porównanie": f"{var_a} vs {var_b}",
+            "Wynik": f"{r['wins']}-{r['losses']}",
+            "P(pierwszy wygrywa)": f"{r['low']:.2f}–{r['high']:.2f}",
+            "Status": verdict,
+        })
+
+    if sequential_rows:
+        st.dataframe(sequential_rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("Brak pojedynków do wyświetlenia.")
+
+    st.markdown("---")
+
+    # Convergence over time
+    st.markdown("### Zbieżność win rate")
+    st.caption("Skumulowany win rate wariantów po kolejnych ocenach")
+
+    if stats["history"]:
+        chart_data = {"Liczba ocen": [p["n"] for p in stats["history"]]}
+        for v in sorted(all_variants):
+            chart_data[v] = [p.get(v) for p in stats["history"]]
+        st.line_chart(chart_data, x="Liczba ocen", y=sorted(all_variants))
+    else:
+        st.info("Brak danych do wyświetlenia.")
+
+
+def render_drilldown():
+    """Win rates within a slice of the stratified cube, grouped by one dimension."""
+    st.markdown("## Analiza warstwowa")
+    st.caption("Win rate w wybranym wycinku: wariant vs pozostałe lub każda para wariantów osobno")
+
+    cube = load_cube(get_data_version(), get_stats()["total_evaluations"])
+    if not cube.judgments:
+        st.info("Brak danych do wyświetlenia.")
+        return
+
+    c1, c2 = st.columns(2)
+    with c1:
+        by = st.selectbox("Grupuj wg", [d for d in DIMENSIONS if d != "pair"], index=1,
+                          format_func=DIMENSION_PL.get)
+    with c2:
+        variant = st.selectbox("Wariant", ["Wszystkie pary"] + sorted(
+            {v for p in cube.values("pair") for v in p.split(PAIR_SEPARATOR)}
+        ))
+
+    filters = {}
+    filter_dims = [d for d in DIMENSIONS if d not in ("pair", by)]
+    for column, dimension in zip(st.columns(len(filter_dims)), filter_dims):
+        with column:
+            value = st.selectbox(DIMENSION_PL[dimension], ["Wszystkie"] + cube.values(dimension),
+                                 key=f"cube_{dimension}")
+            if value != "Wszystkie":
+                filters[dimension] = value
+
+    rows = cube.query(by, None if variant == "Wszystkie pary" else variant, **filters)
+    if not rows:
+        st.info("Brak ocen w tym wycinku.")
+        return
+
+    st.dataframe([{
+        "Porównanie": r["pair"],
+        DIMENSION_PL[by]: r[by],
+        "Wygrane": r["wins"],
+        "Przegrane": r["losses"],
+        "Remisy": r["ties"],
+        "Win Rate": "—" if r["win_rate"] is None else f"{r['win_rate']:.1f}%",
+        "95% CI": f"{r['low']:.0f}–{r['high']:.0f}%",
+    } for r in sorted(rows, key=lambda r: (r["pair"], r[by]))], use_container_width=True, hide_index=True)
+
+
+if st.session_state.page == "results":
+    render_live_results()
+
+    st.markdown("---")
+
+    render_drilldown()
+
+    st.markdown("---")
+
     # Prompt details
     st.markdown("### Szczegóły wariantów promptów (V3)")
 
@@ -408,16 +606,22 @@ if st.session_state.page == "results":
 
 # Load pair
 if st.session_state.current_pair is None:
-    st.session_state.current_pair = get_random_pair()
+    st.session_state.current_pair = next_pair()
+    st.session_state.pair_shown_at = time.time()
 
 pair = st.session_state.current_pair
 
+unsaved = get_evaluation_writer().failed_count(st.session_state.evaluator_name)
+if unsaved:
+    st.warning(f"⚠️ {unsaved} ocen nie udało się zapisać w bazie. Są zachowane na serwerze "
+               f"i zostaną wysłane ponownie po jego restarcie.")
+
 if not pair:
     st.warning("Brak interpretacji do oceny.")
     st.stop()
 
 # Context
-profile = USER_PROFILES.get(pair[0].get("user_profile_id"), {})
+profile = load_user_profiles().get(pair[0].get("user_profile_id"), {})
 level_pl = LEVEL_PL.get(pair[0]["level"], pair[0]["level"])
 gender_pl = GENDER_PL.get(profile.get("gender", ""), "")
 leader_txt = "Tak" if profile.get("is_leader") else "Nie"
@@ -438,11 +642,11 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.markdown("#### Interpretacja A")
-    st.info(pair[0]["interpretation_text"])
+    st.info(get_text_loader().text(pair[0]))
 
 with col2:
     st.markdown("#### Interpretacja B")
-    st.info(pair[1]["interpretation_text"])
+    st.info(get_text_loader().text(pair[1]))
 
 # Evaluation buttons
 st.markdown("---")
@@ -0,0 +1,82 @@
+"""
+streamlit_app.py with per-session timing: the wall time of every rerun and of
+every Supabase call made during it (see scripts/profiling.py). Each session
+sees its own reruns in the sidebar. The server log gets one line per rerun
+(unless PV_PROFILE_LOG=0, e.g. under scripts/bench_app.py).
+Calls made by background threads (prefetch, evaluation writer) are not part of
+a rerun and are not counted. The app's code is compiled once per server
+process, so restart the server after editing streamlit_app.py.
+
+Usage:
+    streamlit run app/streamlit_app_profiled.py
+"""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+APP_PATH = Path(__file__).parent / "streamlit_app.py"
+sys.path.append(str(APP_PATH.parent.parent / "scripts"))
+
+import profiling  # noqa: E402
+
+RERUNS_KEPT = 100  # Per session
+RERUNS_SHOWN = 10
+LOG_RERUNS = os.environ.get("PV_PROFILE_LOG", "1") != "0"
+
+profiling.enable()
+
+
+@st.cache_resource
+def app_code():
+    return compile(APP_PATH.read_text(), str(APP_PATH), "exec")
+
+
+def summarize(trace: list[tuple[str, float]], seconds: float) -> dict:
+    db_calls = [(name[3:], s) for name, s in trace if name.startswith("db ")]
+    return {
+        "ms": seconds * 1000,
+        "db_calls": len(db_calls),
+        "db_ms": sum(s for _, s in db_calls) * 1000,
+        "calls": [f"{name} {s * 1000:.0f} ms" for name, s in db_calls],
+    }
+
+
+def render_panel(reruns: list[dict]):
+    durations = [r["ms"] for r in reruns]
+    last = reruns[-1]
+    with st.sidebar.expander("⏱ Profil sesji", expanded=False):
+        st.caption(
+            f"Ostatni rerun: {last['ms']:.0f} ms, zapytania DB: {last['db_calls']} ({last['db_ms']:.0f} ms)  \n"
+            f"{len(reruns)} rerunów: p50 {statistics.median(durations):.0f} ms, "
+            f"max {max(durations):.0f} ms, średnio {statistics.mean(r['db_calls'] for r in reruns):.1f} zapytań DB"
+        )
+        st.dataframe(
+            [
+                {"rerun": r["n"], "ms": round(r["ms"]), "DB": r["db_calls"], "DB ms": round(r["db_ms"]),
+                 "zapytania": ", ".join(r["calls"])}
+                for r in reversed(reruns[-RERUNS_SHOWN:])
+            ],
+            hide_index=True,
+        )
+
+
+reruns = st.session_state.setdefault("profile_reruns", [])
+ctx = get_script_run_ctx()
+session = ctx.session_id[:8] if ctx else "-"
+start = time.perf_counter()
+with profiling.traced() as trace:
+    try:
+        exec(app_code(), {"__name__": "__main__", "__file__": str(APP_PATH)})
+    finally:
+        # st.stop() and st.rerun() end a rerun by raising; it is timed either way
+        rerun = {"n": (reruns[-1]["n"] + 1) if reruns else 1, **summarize(trace, time.perf_counter() - start)}
+        reruns.append(rerun)
+        del reruns[:-RERUNS_KEPT]
+        if LOG_RERUNS:
+            print(f"[profil] sesja {session} rerun {rerun['n']}: {rerun['ms']:.0f} ms, "
+                  f"DB {rerun['db_calls']} ({rerun['db_ms']:.0f} ms): {', '.join(rerun['calls'])}", flush=True)
+        render_panel(reruns)
@@ -3,35 +3,32 @@
 Analysis script for prompt validation evaluations.
 Calculates win rates, generates ranking, and produces summary report.
 """
-import os
 from collections import defaultdict
-from supabase import create_client
-
-# Config
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+from db import select_active
+from sequential import SequentialMonitor, print_sequential_report
+from evaluator_quality import evaluator_quality, print_quality_report
+from profiling import stage
 
 
 def fetch_evaluations():
     """Fetch all evaluations from Supabase."""
-    result = supabase.table("evaluations").select("*").execute()
+    result = select_active("evaluations", "*").execute()
     return result.data
 
 
 def fetch_interpretations():
     """Fetch all interpretations from Supabase."""
-    result = supabase.table("interpretations").select(
-        "id, prompt_variant, instrument_code, score, level"
+    result = select_active("interpretations",
+        "id, prompt_variant, instrument_code, score, level, user_profile_id"
     ).execute()
     return {i["id"]: i for i in result.data}
 
 
-def calculate_win_rates(evaluations, interpretations):
+def calculate_win_rates(evaluations, interpretations, weights=None):
     """
     Calculate win rate for each prompt variant.
     Win rate = (wins) / (wins + losses)
+    With `weights` (evaluator name -> weight), each judgment counts with its evaluator's weight.
     """
     variant_wins = defaultdict(int)
     variant_losses = defaultdict(int)
@@ -49,17 +46,18 @@ def calculate_win_rates(evaluations, interpretations):
             continue
 
         winner_variant = winner_interp["prompt_variant"]
+        weight = weights.get(eval_record.get("evaluator_name"), 1.0) if weights else 1
 
         if loser_id:
             # Clear winner
             loser_interp = interpretations.get(loser_id)
             if loser_interp:
                 loser_variant = loser_interp["prompt_variant"]
-                variant_wins[winner_variant] += 1
-                variant_losses[loser_variant] += 1
+                variant_wins[winner_variant] += weight
+                variant_losses[loser_variant] += weight
         else:
             # Tie
-            variant_ties[winner_variant] += 1
+            variant_ties[winner_variant] += weight
 
     # Calculate win rates
     all_variants = set(variant_wins.keys()) | set(variant_losses.keys()) | set(variant_ties.keys())
@@ -261,12 +259,25 @@ def print_report(win_rates, h2h, evaluator_stats, instrument_breakdown, total_ev
     print()
 
 
+def print_weighted_ranking(win_rates, weighted_win_rates):
+    """Ranking with each judgment weighted by its evaluator's agreement with consensus."""
+    print("-" * 60)
+    print("RANKING WAŻONY JAKOŚCIĄ OCENIAJĄCYCH:")
+    print("-" * 60)
+    ranked = sorted(weighted_win_rates.items(), key=lambda x: x[1]["win_rate"], reverse=True)
+    for rank, (variant, stats) in enumerate(ranked, 1):
+        change = stats["win_rate"] - win_rates[variant]["win_rate"]
+        print(f"{rank:<5} {variant:<20} {stats['win_rate']:>6.1f}%    ({change:+.1f} pp vs bez wag)")
+    print()
+
+
 def main():
     """Run analysis."""
     print("Pobieranie danych...")
 
-    evaluations = fetch_evaluations()
-    interpretations = fetch_interpretations()
+    with stage("fetch"):
+        evaluations = fetch_evaluations()
+        interpretations = fetch_interpretations()
 
     print(f"Znaleziono {len(evaluations)} ocen i {len(interpretations)} interpretacji")
 
@@ -275,10 +286,11 @@ def main():
         return
 
     # Calculate metrics
-    win_rates = calculate_win_rates(evaluations, interpretations)
-    h2h = calculate_head_to_head(evaluations, interpretations)
-    evaluator_stats = get_evaluator_stats(evaluations)
-    instrument_breakdown = get_instrument_breakdown(evaluations, interpretations)
+    with stage("win rates"):
+        win_rates = calculate_win_rates(evaluations, interpretations)
+        h2h = calculate_head_to_head(evaluations, interpretations)
+        evaluator_stats = get_evaluator_stats(evaluations)
+        instrument_breakdown = get_instrument_breakdown(evaluations, interpretations)
 
     # Print report
     print_report(
@@ -289,6 +301,19 @@ def main():
         len(evaluations)
     )
 
+    with stage("evaluator quality"):
+        quality = evaluator_quality(evaluations)
+        weighted_win_rates = calculate_win_rates(evaluations, interpretations, quality["weights"])
+    print_quality_report(quality)
+    print_weighted_ranking(win_rates, weighted_win_rates)
+
+    with stage("sequential test"):
+        monitor = SequentialMonitor()
+        for (var_a, var_b), stats in h2h.items():
+            monitor.add(var_a, var_b, stats["a_wins"])
+            monitor.add(var_b, var_a, stats["b_wins"])
+    print_sequential_report(monitor)
+
 
 if __name__ == "__main__":
     main()
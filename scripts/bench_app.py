@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Load test of the Streamlit evaluation app: --users simulated evaluators click
+through the app at the same time, each in its own session, against a seeded
+local PostgREST stand-in (postgrest_stub.py, in a separate process).
+
+Sessions are driven headlessly with Streamlit's AppTest in threads of this
+process, the way a Streamlit server runs one script thread per session, so
+they share st.cache_data / st.cache_resource, the HTTP pool and the GIL like
+real sessions do. The app runs through streamlit_app_profiled.py, which times
+every rerun and its DB calls per session.
+
+Each evaluator logs in, then clicks --clicks times: A / B / Remis / Pomiń on
+the shown pair, or with probability --results opens the Results page and goes
+back. The report has:
+  - latency percentiles per action: of the click (until its reruns finished,
+    including AppTest's own processing) and of the app script's reruns alone
+  - reruns and DB queries per click (background writes of evaluations excluded)
+  - all requests the stub served during the measured clicks, including
+    background writes (the warm-up session's requests are not counted)
+  - resident memory of this process (all sessions, no stub): after a warm-up
+    session (imports, shared caches), at the end and at peak
+
+Usage:
+    python scripts/bench_app.py                               # 10 evaluators x 20 clicks
+    python scripts/bench_app.py --users=50 --clicks=30 --think=2   # Mean pause between clicks (s)
+    python scripts/bench_app.py --latency=20 --handshake=60   # Remote database (ms)
+    python scripts/bench_app.py --samples=3 --evaluations=5000 --results=0.1
+"""
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).parent
+APP_PATH = SCRIPTS_DIR.parent / "app/streamlit_app_profiled.py"
+
+DEFAULT_USERS = 10
+DEFAULT_CLICKS = 20
+DEFAULT_SAMPLES = 1  # Interpretations per cell
+DEFAULT_EVALUATIONS = 1000  # Evaluations already stored when the test starts
+DEFAULT_RESULTS_SHARE = 0.05  # Share of clicks that open the Results page
+TEXT_WORDS = 450  # About one interpretation (~3000 characters)
+SESSION_TIMEOUT_SECONDS = 120  # Per rerun, under load
+STUB_START_SECONDS = 10
+
+CHOICES = ["🅰️ A jest lepsza", "🅱️ B jest lepsza", "🟰 Remis", "⏭️ Pomiń"]
+CHOICE_WEIGHTS = [4, 4, 1, 1]
+
+VOCABULARY = (
+    "wynik wskazuje objawy nastrój energia sen koncentracja praca zespół odpoczynek wsparcie psycholog "
+    "rozmowa codzienność tydzień trudności stres napięcie relacje bliscy ruch oddech uważność kontakt "
+    "specjalista sygnały zmęczenie motywacja pomoc warto spróbować możesz zauważyć obserwuj poziom "
+    "umiarkowany łagodny ciężki objawów lęku depresji screening diagnoza zalecenia plan drobne kroki"
+).split()
+
+
+def synthetic_tables(samples: int, evaluations: int, seed: int = 0) -> dict[str, list[dict]]:
+    """Interpretations of every test cell x variant x profile (x samples) and evaluations of their pairs."""
+    from experiment import PROMPT_VARIANTS, test_scores, user_profiles
+
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(days=7)
+    interpretations, cells = [], defaultdict(list)
+    for instrument_code, scores in test_scores().items():
+        for score_info in scores:
+            for variant in [v for v in PROMPT_VARIANTS if instrument_code in v["instruments"]]:
+                for profile in user_profiles():
+                    for _ in range(samples):
+                        row = {
+                            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                            "instrument_code": instrument_code,
+                            "score": score_info["score"],
+                            "level": score_info["level"],
+                            "prompt_variant": variant["id"],
+                            "user_profile_id": profile["id"],
+                            "interpretation_text": " ".join(rng.choices(VOCABULARY, k=TEXT_WORDS)),
+                            "model": "gpt-5.1",
+                            "created_at": start.isoformat(),
+                        }
+                        interpretations.append(row)
+                        cells[instrument_code, score_info["score"], profile["id"]].append(row["id"])
+
+    rows = []
+    pairs = [ids for ids in cells.values() if len(ids) > 1]
+    for i in range(evaluations):
+        shown = rng.sample(rng.choice(pairs), 2)
+        winner = rng.choice(shown + [None])
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "interpretation_id": winner or shown[0],
+            "preferred_over": None if winner is None else next(s for s in shown if s != winner),
+            "evaluator_name": f"oceniający {rng.randrange(20)}",
+            "rating": 3,
+            "shown_a": shown[0],
+            "shown_b": shown[1],
+            "response_time_ms": rng.randrange(5000, 60000),
+            "feedback": "",
+            "created_at": (start + timedelta(seconds=60 * i)).isoformat(),
+        })
+    return {"interpretations": interpretations, "evaluations": rows}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(tables: dict, latency_ms: float, handshake_ms: float) -> tuple[subprocess.Popen, str]:
+    """The stub in its own process (so it neither shares the GIL nor counts in memory), seeded from a file."""
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(tables, f)
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(SCRIPTS_DIR / "postgrest_stub.py"), f"--port={port}", f"--seed={f.name}",
+         f"--latency={latency_ms}", f"--handshake={handshake_ms}"],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + STUB_START_SECONDS
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("PostgREST stub did not start")
+            time.sleep(0.05)
+    os.unlink(f.name)  # Loaded by now
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stub_requests(url: str) -> int:
+    """Requests the stub has served, this one included."""
+    import httpx
+
+    return httpx.post(f"{url}/rest/v1/rpc/stub_requests", json={}).json()
+
+
+def settled_stub_requests(url: str, quiet: float = 0.2, timeout: float = 5.0) -> int:
+    """
+    Requests the stub has served, not counting these calls, once no other
+    request arrived for `quiet` seconds (background writes have landed).
+    """
+    deadline = time.monotonic() + timeout
+    latest, calls = stub_requests(url), 1
+    while time.monotonic() < deadline:
+        time.sleep(quiet)
+        count, latest, calls = latest, stub_requests(url), calls + 1
+        if latest == count + 1:  # Only this call
+            break
+    return latest - calls
+
+
+def rss_mb() -> float:
+    """Current resident memory of this process (Linux)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def share_server_state():
+    """
+    Let AppTest sessions run concurrently, sharing what a Streamlit server
+    shares between its sessions:
+      - the Runtime: AppTest installs a mock Runtime singleton for each run and
+        clears it when the run ends, pulling it from under sessions still
+        running in other threads; the last one installed keeps being served
+      - the compiled script: AppTest compiles it again for each run, and
+        concurrent ast.parse calls are not thread-safe (CPython 3.11)
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    installed = {}
+    compiled = {}
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def shared_bytecode(self, script_path: str):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = get_bytecode(self, script_path)
+            return compiled[script_path]
+
+    def current(cls):
+        if cls._instance is not None:
+            installed["runtime"] = cls._instance
+        return installed.get("runtime")
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    ScriptCache.get_bytecode = shared_bytecode
+
+
+class Evaluator:
+    """One simulated evaluator: a session of the app and the timings of its clicks."""
+
+    def __init__(self, name: str, think: float, results_share: float, rng: random.Random):
+        import logging
+        from streamlit.testing.v1 import AppTest
+
+        # AppTest sets up session state outside a script thread, which logs a warning per session
+        logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+        self.name = name
+        self.think = think
+        self.results_share = results_share
+        self.rng = rng
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=SESSION_TIMEOUT_SECONDS)
+        self.clicks = []  # {"action", "ms", "script_ms", "reruns", "db_queries"}
+        self.errors = []
+
+    def button(self, label: str):
+        return next((b for b in self.app.button if b.label == label), None)
+
+    def timed(self, action: str, run):
+        reruns_before = len(self.app.session_state["profile_reruns"]) if "profile_reruns" in self.app.session_state else 0
+        start = time.perf_counter()
+        run()
+        ms = (time.perf_counter() - start) * 1000
+        if self.app.exception:
+            self.errors.append(self.app.exception[0].message)
+        new = self.app.session_state["profile_reruns"][reruns_before:]
+        self.clicks.append({
+            "action": action, "ms": ms, "script_ms": sum(r["ms"] for r in new), "reruns": len(new),
+            "db_queries": sum(r["db_calls"] for r in new),
+        })
+
+    def pause(self):
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+    def click(self, action: str, label: str):
+        button = self.button(label)
+        if button is None:  # An exception on the page, or no pair left to show
+            raise LookupError(f"brak przycisku {label!r}")
+        self.timed(action, button.click().run)
+
+    def log_in(self):
+        self.timed("wejście", self.app.run)
+        self.app.text_input[0].input(self.name)
+        self.click("logowanie", "Rozpocznij ocenianie")
+
+    def run(self, clicks: int, start: threading.Barrier = None):
+        if start:
+            start.wait()
+        try:
+            self.log_in()
+            for _ in range(clicks):
+                self.pause()
+                if self.rng.random() < self.results_share:
+                    self.click("wyniki", "📊 Wyniki")
+                    self.click("powrót", "📝 Ocenianie")
+                    continue
+                label = self.rng.choices(CHOICES, CHOICE_WEIGHTS)[0]
+                self.click("ocena" if label != "⏭️ Pomiń" else "pominięcie", label)
+        except Exception as e:
+            self.errors.append(str(e))
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def print_report(evaluators: list[Evaluator], elapsed: float, requests: int, memory: dict):
+    clicks = [c for e in evaluators for c in e.clicks]
+    by_action = defaultdict(list)
+    for c in clicks:
+        by_action[c["action"]].append(c)
+
+    print(f"\n{'':<25}{'Kliknięcie (ms)':^36}{'Skrypt (ms)':^18}")
+    print(f"{'Akcja':<14}{'Kliknięcia':>11}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'p50':>9}{'p95':>9}"
+          f"{'Reruny':>8}{'DB/klik':>9}{'DB max':>8}")
+    print("-" * 104)
+    for action, rows in [*by_action.items(), ("RAZEM", clicks)]:
+        ordered = sorted(c["ms"] for c in rows)
+        script = sorted(c["script_ms"] for c in rows)
+        print(f"{action:<14}{len(rows):>11}{statistics.median(ordered):>9.0f}{percentile(ordered, 0.95):>9.0f}"
+              f"{percentile(ordered, 0.99):>9.0f}{ordered[-1]:>9.0f}"
+              f"{statistics.median(script):>9.0f}{percentile(script, 0.95):>9.0f}"
+              f"{statistics.mean(c['reruns'] for c in rows):>8.1f}"
+              f"{statistics.mean(c['db_queries'] for c in rows):>9.1f}{max(c['db_queries'] for c in rows):>8}")
+
+    errors = [error for e in evaluators for error in e.errors]
+    print(f"\n{len(evaluators)} oceniających, {len(clicks)} kliknięć w {elapsed:.1f} s "
+          f"({len(clicks) / elapsed:.1f} kliknięć/s)")
+    print(f"Zapytania obsłużone przez stub (z zapisami w tle): {requests} ({requests / len(clicks):.1f} na kliknięcie)")
+    print(f"Pamięć procesu aplikacji: po rozgrzewce {memory['before']:.0f} MB, na końcu {memory['after']:.0f} MB, "
+          f"szczyt {memory['peak']:.0f} MB (~{(memory['after'] - memory['before']) / len(evaluators):.1f} MB na sesję)")
+    if errors:
+        print(f"⚠️  Błędy: {len(errors)}, np. {errors[0]}")
+
+
+def main(users: int = DEFAULT_USERS, clicks: int = DEFAULT_CLICKS, think: float = 0.0,
+         results_share: float = DEFAULT_RESULTS_SHARE, samples: int = DEFAULT_SAMPLES,
+         evaluations: int = DEFAULT_EVALUATIONS, latency_ms: float = 0.0, handshake_ms: float = 0.0):
+    tables = synthetic_tables(samples, evaluations)
+    print(f"Stub: {len(tables['interpretations'])} interpretacji, {len(tables['evaluations'])} ocen; "
+          f"opóźnienie {latency_ms:g} ms, nawiązanie połączenia {handshake_ms:g} ms")
+    stub, url = start_stub(tables, latency_ms, handshake_ms)
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_KEY"] = "stub"
+    os.environ["PV_PROFILE_LOG"] = "0"  # The report sums the reruns instead
+    os.environ["STREAMLIT_LOGGER_LEVEL"] = "error"  # Bare-mode and deprecation warnings of every session
+    try:
+        share_server_state()
+        # One session first: imports and the shared caches (index, near-duplicate pairs)
+        # are paid once per server, not per session
+        warmup = Evaluator("rozgrzewka", 0, 0, random.Random(-1))
+        warmup.run(clicks=1)
+        print("Rozgrzewka (pierwsza sesja na zimnym serwerze): " + ", ".join(
+            f"{c['action']} {c['ms']:.0f} ms" for c in warmup.clicks
+        ) + (f"; błąd: {warmup.errors[0]}" if warmup.errors else ""))
+
+        memory = {"before": rss_mb()}
+        baseline = settled_stub_requests(url)
+        start = threading.Barrier(users)
+        evaluators = [Evaluator(f"obciążenie {i}", think, results_share, random.Random(i)) for i in range(users)]
+        threads = [threading.Thread(target=e.run, args=(clicks, start), daemon=True) for e in evaluators]
+        print(f"{users} oceniających x {clicks} kliknięć...")
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        memory.update(after=rss_mb(), peak=peak_rss_mb())
+        print_report(evaluators, elapsed, settled_stub_requests(url) - baseline, memory)
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    main(
+        users=int(options.get("users", DEFAULT_USERS)),
+        clicks=int(options.get("clicks", DEFAULT_CLICKS)),
+        think=float(options.get("think", 0)),
+        results_share=float(options.get("results", DEFAULT_RESULTS_SHARE)),
+        samples=int(options.get("samples", DEFAULT_SAMPLES)),
+        evaluations=int(options.get("evaluations", DEFAULT_EVALUATIONS)),
+        latency_ms=float(options.get("latency", 0)),
+        handshake_ms=float(options.get("handshake", 0)),
+    )
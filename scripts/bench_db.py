@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Per-call latency of Supabase access against the local PostgREST stand-in
+(postgrest_stub.py), with supabase-py's default HTTP client ("domyślny") and
+the tuned shared client from transport.py ("dostrojony").
+The stub emulates a remote host: --latency (ms) is added to every request and
+--handshake (ms) once per new connection (TCP + TLS setup). Reusing a connection
+is what the tuned client does better, so the difference shows mostly on the
+first call, under concurrency and after idle gaps. With --idle=6, calls are spaced
+further apart than httpx's default 5 s keep-alive, as writes between LLM calls are.
+
+Usage:
+    python scripts/bench_db.py                       # 50 calls per scenario
+    python scripts/bench_db.py --calls=200 --latency=2 --handshake=60
+    python scripts/bench_db.py --idle=6              # Also calls spaced by idle gaps (slow)
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CALLS = 50
+DEFAULT_LATENCY_MS = 1.0
+DEFAULT_HANDSHAKE_MS = 30.0
+CONCURRENT_THREADS = 8
+IDLE_CALLS = 3
+TEXT_BYTES = 3000  # About one interpretation
+
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    """(p50, p95) in ms."""
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def interpretation_row(i: int) -> dict:
+    return {
+        "instrument_code": "PHQ-9", "score": i % 28, "level": "moderate", "prompt_variant": "profile",
+        "user_profile_id": i % 4 + 1, "interpretation_text": ("Wynik wskazuje na umiarkowane objawy. " * 100)[:TEXT_BYTES],
+    }
+
+
+def scenarios(client, calls: int) -> dict[str, list[float]]:
+    """Samples (ms) of each access pattern; the first call includes connecting."""
+    table = lambda: client.table("interpretations")  # noqa: E731
+    results = {"pierwsze wywołanie": [timed(lambda: client.rpc("current_experiment_id").execute())]}
+    ids = [r["id"] for r in table().insert([interpretation_row(i) for i in range(20)]).execute().data]
+    results["rpc"] = [timed(lambda: client.rpc("current_experiment_id").execute()) for _ in range(calls)]
+    results["select po id"] = [
+        timed(lambda i=i: table().select("*").eq("id", ids[i % len(ids)]).execute()) for i in range(calls)
+    ]
+    results["insert (1 wiersz)"] = [timed(lambda i=i: table().insert(interpretation_row(i)).execute()) for i in range(calls)]
+    # Sequential generator before prefetching existing keys: a select before every insert
+    results["select + insert"] = [
+        timed(lambda i=i: (
+            table().select("id, interpretation_text").eq("score", i % 28).eq("user_profile_id", i % 4 + 1).execute(),
+            table().insert(interpretation_row(i)).execute(),
+        )) for i in range(calls)
+    ]
+    results["insert (20 wierszy)"] = [
+        timed(lambda: table().insert([interpretation_row(i) for i in range(20)]).execute()) for _ in range(calls // 5 or 1)
+    ]
+    with ThreadPoolExecutor(CONCURRENT_THREADS) as pool:
+        results[f"select, {CONCURRENT_THREADS} wątków"] = list(pool.map(
+            lambda i: timed(lambda: table().select("*").eq("id", ids[i % len(ids)]).execute()), range(calls)
+        ))
+    return results
+
+
+def idle_scenario(client, idle: float) -> list[float]:
+    client.rpc("current_experiment_id").execute()
+    samples = []
+    for _ in range(IDLE_CALLS):
+        time.sleep(idle)
+        samples.append(timed(lambda: client.rpc("current_experiment_id").execute()))
+    return samples
+
+
+def main(calls: int = DEFAULT_CALLS, latency_ms: float = DEFAULT_LATENCY_MS,
+         handshake_ms: float = DEFAULT_HANDSHAKE_MS, idle: float = 0):
+    from supabase import ClientOptions, create_client
+    from postgrest_stub import serve
+    from transport import build_http_client
+
+    clients = {
+        "domyślny": lambda url: create_client(url, "stub"),
+        "dostrojony": lambda url: create_client(url, "stub", options=ClientOptions(httpx_client=build_http_client())),
+    }
+    print(f"PostgREST stub: opóźnienie {latency_ms:g} ms/zapytanie, nawiązanie połączenia {handshake_ms:g} ms\n")
+
+    results = {}
+    for name, make in clients.items():
+        # A fresh stub per client, so both query tables of the same size
+        server, url = serve(0, latency_ms=latency_ms, handshake_ms=handshake_ms, background=True)
+        results[name] = scenarios(make(url), calls)
+        if idle:
+            results[name][f"po {idle:g} s bezczynności"] = idle_scenario(make(url), idle)
+        server.shutdown()
+
+    names = list(clients)
+    print(f"{'Scenariusz':<26}" + "".join(f"{n + ' p50':>16}{'p95':>8}" for n in names))
+    print("-" * (26 + 24 * len(names)))
+    for scenario in results[names[0]]:
+        row = f"{scenario:<26}"
+        for name in names:
+            p50, p95 = percentiles(results[name][scenario])
+            row += f"{p50:>13.1f} ms{p95:>6.1f} ms"
+        print(row)
+
+
+if __name__ == "__main__":
+    import sys
+
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    main(
+        calls=int(options.get("calls", DEFAULT_CALLS)),
+        latency_ms=float(options.get("latency", DEFAULT_LATENCY_MS)),
+        handshake_ms=float(options.get("handshake", DEFAULT_HANDSHAKE_MS)),
+        idle=float(options.get("idle", 0)),
+    )
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark of the CLI.
+Runs each non-network command in a fresh interpreter several times and checks
+the median wall time against the startup budget. The budget applies to the
+CLI's own cost on top of a bare interpreter start (`python -c pass`), which
+depends on the machine and site-packages rather than on this code.
+
+Usage:
+    python scripts/bench_startup.py             # 10 runs per command
+    python scripts/bench_startup.py --runs=30
+"""
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PV = str(Path(__file__).parent / "pv.py")
+STARTUP_BUDGET_MS = 100
+DEFAULT_RUNS = 10
+
+# Commands that must start without touching the network
+COMMANDS = [
+    ["--help"],
+    ["generate", "--help"],
+    ["analyze", "--help"],
+    ["judge", "--help"],
+    ["render", "--help"],
+    ["templates"],
+]
+
+
+def time_command(argv: list[str], runs: int) -> float:
+    """Median wall time in ms of running argv in a fresh process."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main(runs: int = DEFAULT_RUNS):
+    baseline = time_command([sys.executable, "-c", "pass"], runs)
+    print(f"python -c pass: {baseline:.0f} ms\n")
+
+    slow = 0
+    for args in COMMANDS:
+        elapsed = time_command([sys.executable, PV, *args], runs)
+        ok = elapsed - baseline < STARTUP_BUDGET_MS
+        slow += not ok
+        print(f"{'✅' if ok else '❌'} pv {' '.join(args):<20} {elapsed:6.0f} ms  (+{elapsed - baseline:.0f} ms)")
+
+    print(f"\nLimit: +{STARTUP_BUDGET_MS} ms ponad start interpretera, za wolne: {slow}")
+    if slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    runs = DEFAULT_RUNS
+    for arg in sys.argv:
+        if arg.startswith("--runs="):
+            runs = int(arg.split("=")[1])
+
+    main(runs=runs)
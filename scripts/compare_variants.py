@@ -1,150 +1,221 @@
 #!/usr/bin/env python3
 """
-Quick comparison of 3 prompt variants for the same profile/score.
-Generates one interpretation per variant and prints them for comparison.
+Side-by-side comparison of prompt variants for chosen cells.
+Renders every variant of each cell (instrument, score, profile) with the same
+simulated answers and shows how the prompts differ from the first variant:
+sections added, removed or changed (with their input token deltas), optionally
+the line diff, and the total input tokens and cost per variant.
+Then all variants of all cells are sent to the API at once, so the comparison
+takes about one completion's time instead of one per variant. Responses are
+cached on disk by (model, prompt, parameters): rerunning a comparison, or
+adding one variant to it, only calls the API for prompts not seen before.
+
+Cells are INSTRUMENT:SCORE:PROFILE_ID; the level comes from the scoring ranges.
+
+Usage:
+    python scripts/compare_variants.py                               # PHQ-9, 12, Ania; all variants
+    python scripts/compare_variants.py --cells=PHQ-9:12:1,GAD-7:17:3
+    python scripts/compare_variants.py --variants=minimal,answers    # First variant is the baseline
+    python scripts/compare_variants.py --dry-run                     # Prompt diffs and tokens only, no API
+    python scripts/compare_variants.py --lines                       # Also the line diff of the prompts
+    python scripts/compare_variants.py --no-cache                    # Fresh completions (still cached)
+    python scripts/compare_variants.py --seed=123                    # Other simulated answers
 """
-import os
+import asyncio
+import difflib
+import hashlib
 import json
-import random
-from pathlib import Path
-from jinja2 import Template
-from openai import OpenAI
-
-BASE_DIR = Path(__file__).parent.parent
-
-# Load data
-with open(BASE_DIR / "data/instruments_extended.json") as f:
-    INSTRUMENTS = json.load(f)
-
-with open(BASE_DIR / "data/user_profiles_v2.json") as f:
-    USER_PROFILES = json.load(f)
-
-with open(BASE_DIR / "data/questionnaire_items.json") as f:
-    QUESTIONNAIRE_ITEMS = json.load(f)
-
-# Load templates
-TEMPLATES = {}
-for variant_id in ["minimal", "profile", "answers"]:
-    template_path = BASE_DIR / "prompts" / f"variant_{variant_id}.jinja2"
-    with open(template_path) as f:
-        TEMPLATES[variant_id] = Template(f.read())
-
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
-
-def simulate_answers(instrument_code: str, target_score: int) -> list[dict]:
-    """Generate simulated answers that sum to target_score."""
-    items = QUESTIONNAIRE_ITEMS[instrument_code]["items"]
-    response_options = QUESTIONNAIRE_ITEMS[instrument_code]["response_options"]
-    num_items = len(items)
-
-    random.seed(42)  # For reproducibility
-
-    base_value = target_score // num_items
-    values = [min(base_value, 3) for _ in range(num_items)]
-    current_sum = sum(values)
-
-    indices = list(range(num_items))
-    random.shuffle(indices)
-
-    for i in indices:
-        if current_sum >= target_score:
-            break
-        max_add = min(3 - values[i], target_score - current_sum)
-        if max_add > 0:
-            add = random.randint(1, max_add)
-            values[i] += add
-            current_sum += add
-
-    answers = []
-    for i, item in enumerate(items):
-        response_value = values[i]
-        response_label = response_options[response_value]["label"]
-        answers.append({
-            "number": item["number"],
-            "question": item["text_pl"],
-            "response_value": response_value,
-            "response_label": response_label,
-        })
-    return answers
-
-
-def generate_interpretation(variant_id: str, profile: dict, instrument_code: str, score: int, level_label: str) -> str:
-    """Generate a single interpretation."""
-    instrument = INSTRUMENTS[instrument_code]
-    template = TEMPLATES[variant_id]
-
-    context = {
-        "instrument": instrument_code,
+import time
+from collections import Counter
+from experiment import BASE_DIR, PROMPT_VARIANTS, build_prompt, cell_seed, level_for_score, user_profiles
+from render_matrix import count_tokens
+
+MODEL = "gpt-5.1"
+COMPLETION_PARAMS = {"max_completion_tokens": 1500, "temperature": 0.7}
+DEFAULT_CELLS = "PHQ-9:12:1"  # Ania, moderate
+CACHE_DIR = BASE_DIR / ".cache/responses"
+
+# Fixed run seed: every variant sees the same simulated answers on every run
+COMPARE_SEED = 42
+
+
+def parse_cell(spec: str) -> dict:
+    instrument_code, score, profile_id = spec.split(":")
+    score = int(score)
+    profile = {p["id"]: p for p in user_profiles()}[int(profile_id)]
+    return {
+        "instrument_code": instrument_code,
         "score": score,
-        "max_score": instrument["scoring"]["max_score"],
-        "level_label": level_label,
-        "user_name": profile["name"],
-        "user_age": profile["age"],
-        "user_gender": profile["gender"],
+        "label": level_for_score(instrument_code, score)["label"],
+        "profile": profile,
     }
 
-    if variant_id in ["profile", "answers"]:
-        context.update({
-            "work_type": profile["work_type"],
-            "is_leader": profile["is_leader"],
-            "subtopics": profile["subtopics"],
-        })
 
-    if variant_id == "answers":
-        context["answers"] = simulate_answers(instrument_code, score)
+def render_variants(cell: dict, variant_ids: list[str] = None, run_seed: int = COMPARE_SEED) -> dict[str, str]:
+    """Variant id -> prompt of the chosen variants (default: all) supporting the cell's instrument, in order."""
+    supported = [v["id"] for v in PROMPT_VARIANTS if cell["instrument_code"] in v["instruments"]]
+    # Seeded without the variant, so all variants share one set of simulated answers
+    seed = cell_seed(run_seed, cell["instrument_code"], cell["score"], "", cell["profile"]["id"])
+    return {
+        variant_id: build_prompt(cell["instrument_code"], cell["score"], cell["label"], variant_id, cell["profile"], seed=seed)
+        for variant_id in (variant_ids or supported) if variant_id in supported
+    }
 
-    prompt = template.render(**context)
 
-    response = client.chat.completions.create(
-        model="gpt-5.1",
-        messages=[{"role": "user", "content": prompt}],
-        max_completion_tokens=1500,
-        temperature=0.7
-    )
+def sections(prompt: str) -> dict[tuple[str, int], str]:
+    """
+    (heading, occurrence) -> text of the prompt's markdown sections, heading line
+    included; text before the first heading is ('', 0). The texts concatenate
+    to the prompt, so their token deltas add up to the prompt's (up to tokenizer rounding).
+    """
+    result, seen = {}, Counter()
+    key, lines = ("", 0), []
+    for line in prompt.splitlines(keepends=True):
+        if line.startswith("#"):
+            result[key] = "".join(lines)
+            heading = line.lstrip("#").strip()
+            key, lines = (heading, seen[heading]), [line]
+            seen[heading] += 1
+        else:
+            lines.append(line)
+    result[key] = "".join(lines)
+    return {k: text for k, text in result.items() if k != ("", 0) or text.strip()}
+
+
+def section_label(key: tuple[str, int]) -> str:
+    heading, occurrence = key
+    return f"{heading or '(początek)'}{f' ({occurrence + 1})' if occurrence else ''}"
+
+
+def section_diff(base: str, other: str) -> list[tuple[str, str, int]]:
+    """(change, section label, token delta) of sections added, removed or changed from base to other."""
+    a, b = sections(base), sections(other)
+    changes = []
+    for key in list(a) + [k for k in b if k not in a]:
+        if key not in b:
+            changes.append(("-", section_label(key), -count_tokens(a[key])))
+        elif key not in a:
+            changes.append(("+", section_label(key), count_tokens(b[key])))
+        elif a[key] != b[key]:
+            changes.append(("~", section_label(key), count_tokens(b[key]) - count_tokens(a[key])))
+    return changes
 
-    return response.choices[0].message.content
 
+def line_diff(base: str, other: str, base_name: str, other_name: str) -> str:
+    return "\n".join(difflib.unified_diff(
+        base.splitlines(), other.splitlines(), base_name, other_name, n=1, lineterm=""
+    ))
 
-def main():
-    # Test case: Ania, PHQ-9, score 12 (moderate)
-    profile = USER_PROFILES[0]  # Ania
-    instrument = "PHQ-9"
-    score = 12
-    level_label = "Umiarkowane objawy depresji"
 
+def input_cost(tokens: int) -> float:
+    from key_pool import MODEL_PRICES
+
+    return tokens * MODEL_PRICES.get(MODEL, (0.0, 0.0))[0] / 1_000_000
+
+
+def cache_path(prompt: str):
+    key = json.dumps({"model": MODEL, "prompt": prompt, **COMPLETION_PARAMS}, sort_keys=True, ensure_ascii=False)
+    return CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+
+async def complete(prompt: str, use_cache: bool = True) -> dict:
+    """{"text", "completion_tokens", "seconds", "cached"} of one prompt, from the cache when possible."""
+    path = cache_path(prompt)
+    if use_cache and path.exists():
+        return {**json.loads(path.read_text()), "cached": True}
+    from db import get_key_pool
+
+    start = time.perf_counter()
+    response, _ = await get_key_pool().chat(MODEL, prompt, **COMPLETION_PARAMS)
+    result = {
+        "text": response.choices[0].message.content,
+        "completion_tokens": response.usage.completion_tokens if response.usage else None,
+        "seconds": time.perf_counter() - start,
+    }
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(result, ensure_ascii=False))
+    return {**result, "cached": False}
+
+
+async def complete_all(prompts: list[str], use_cache: bool = True) -> list[dict]:
+    """Completions of all prompts, requested concurrently."""
+    results = await asyncio.gather(*(complete(p, use_cache) for p in prompts), return_exceptions=True)
+    return [{"error": str(r)} if isinstance(r, Exception) else r for r in results]
+
+
+def print_prompt_comparison(cell: dict, prompts: dict[str, str], show_lines: bool = False):
+    profile = cell["profile"]
     print("=" * 80)
-    print(f"PORÓWNANIE WARIANTÓW PROMPTÓW")
-    print(f"Profil: {profile['name']}, {profile['age']} lat, {profile['gender']}")
-    print(f"Praca: {profile['work_type']}, lider: {profile['is_leader']}")
-    print(f"Instrument: {instrument}, wynik: {score}/27 ({level_label})")
+    print(f"{cell['instrument_code']}, wynik {cell['score']} ({cell['label']})")
+    print(f"Profil: {profile['name']}, {profile['age']} lat, {profile['gender']}, "
+          f"praca: {profile['work_type']}, lider: {profile['is_leader']}")
     print("=" * 80)
 
-    for variant_id in ["minimal", "profile", "answers"]:
-        print(f"\n{'='*80}")
-        print(f"WARIANT: {variant_id.upper()}")
-        print("=" * 80)
-
-        if variant_id == "minimal":
-            print("(tylko: imię, wiek, płeć + wynik)")
-        elif variant_id == "profile":
-            print("(+ work_type, is_leader, ~15 subtopics)")
-        else:
-            print("(+ wszystko powyżej + odpowiedzi na pytania)")
+    base_id, base = next(iter(prompts.items()))
+    base_tokens = count_tokens(base)
+    print(f"{'Wariant':<14}{'Tokeny':>8}{'Δ':>8}{'Koszt wej.':>12}")
+    for variant_id, prompt in prompts.items():
+        tokens = count_tokens(prompt)
+        delta = f"{tokens - base_tokens:+d}" if variant_id != base_id else ""
+        print(f"{variant_id:<14}{tokens:>8}{delta:>8}{input_cost(tokens):>11.5f}$")
+
+    for variant_id, prompt in list(prompts.items())[1:]:
+        print(f"\n--- {base_id} -> {variant_id}")
+        changes = section_diff(base, prompt)
+        if not changes:
+            print("   (identyczne sekcje)")
+        for change, heading, delta in changes:
+            print(f"   {change} {heading[:56]:<56}{delta:>+6d} tok.")
+        if show_lines:
+            print(line_diff(base, prompt, base_id, variant_id))
+
+
+def main(cell_specs: list[str], variant_ids: list[str] = None, dry_run: bool = False,
+         show_lines: bool = False, use_cache: bool = True, run_seed: int = COMPARE_SEED):
+    cells = [parse_cell(spec) for spec in cell_specs]
+    jobs = []  # (cell, variant id, prompt)
+    for cell in cells:
+        prompts = render_variants(cell, variant_ids, run_seed)
+        if not prompts:
+            print(f"❌ Brak wariantów dla {cell['instrument_code']}")
+            continue
+        print_prompt_comparison(cell, prompts, show_lines)
+        print()
+        jobs += [(cell, variant_id, prompt) for variant_id, prompt in prompts.items()]
 
-        print("-" * 80)
+    if dry_run or not jobs:
+        return
 
-        interpretation = generate_interpretation(
-            variant_id=variant_id,
-            profile=profile,
-            instrument_code=instrument,
-            score=score,
-            level_label=level_label
-        )
+    start = time.perf_counter()
+    results = asyncio.run(complete_all([prompt for _, _, prompt in jobs], use_cache))
+    elapsed = time.perf_counter() - start
 
-        print(interpretation)
+    for (cell, variant_id, _), result in zip(jobs, results):
+        print("=" * 80)
+        print(f"{cell['instrument_code']} {cell['score']}, {cell['profile']['name']}: WARIANT {variant_id.upper()}")
+        if "error" in result:
+            print(f"❌ {result['error']}\n")
+            continue
+        source = "z pamięci podręcznej" if result["cached"] else f"{result['seconds']:.1f} s"
+        print(f"({result['completion_tokens']} tokenów wyjściowych, {source})")
+        print("-" * 80)
+        print(result["text"])
         print()
 
+    called = [r for r in results if "seconds" in r and not r.get("cached")]
+    print(f"✅ {len(results)} odpowiedzi w {elapsed:.1f} s: {len(results) - len(called)} z pamięci podręcznej, "
+          f"{len(called)} z API" + (f" (suma czasów wywołań {sum(r['seconds'] for r in called):.1f} s)" if called else ""))
+
 
 if __name__ == "__main__":
-    main()
+    import sys
+
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    main(
+        cell_specs=options.get("cells", DEFAULT_CELLS).split(","),
+        variant_ids=options["variants"].split(",") if "variants" in options else None,
+        dry_run="--dry-run" in sys.argv,
+        show_lines="--lines" in sys.argv,
+        use_cache="--no-cache" not in sys.argv,
+        run_seed=int(options.get("seed", COMPARE_SEED)),
+    )
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Stratified analysis cube of pairwise judgments.
+Every judgment is keyed by (variant pair, instrument, level, work type, leader,
+gender, age band, evaluator). The cube is built in one group-by pass
+(np.unique over the flattened key) and kept sparse: one row of outcome counts
+per non-empty cell, so its size is bounded by the number of judgments.
+Drill-down queries filter and re-aggregate those rows, which takes
+milliseconds, e.g.:
+  - does `profile` win for leaders but lose for `fizyczna` workers?
+  - does `answers` help only at severe scores?
+
+Win rates count decisive judgments only. Intervals are the always-valid ones
+from the sequential test: each stays valid however often its slice is checked
+as judgments come in. They are not corrected for comparing many slices, so
+among dozens of slices some will exclude 50% by chance.
+Ties saved without the shown pair (before shown_a/shown_b) have no variant
+pair and are left out.
+
+Usage:
+    python scripts/cube.py                                   # Win rate of each variant pair by level
+    python scripts/cube.py --by=work_type --variant=profile  # `profile` vs all others, by work type
+    python scripts/cube.py --by=level --variant=answers --instrument=PHQ-9
+    python scripts/cube.py --by=evaluator --is_leader=tak    # Filters: any dimension, --dimension=value
+"""
+import numpy as np
+from sequential import confidence_sequence
+
+DIMENSIONS = ("pair", "instrument", "level", "work_type", "is_leader", "gender", "age_band", "evaluator")
+
+DIMENSION_PL = {
+    "pair": "Para wariantów",
+    "instrument": "Instrument",
+    "level": "Poziom",
+    "work_type": "Rodzaj pracy",
+    "is_leader": "Lider",
+    "gender": "Płeć",
+    "age_band": "Wiek",
+    "evaluator": "Oceniający",
+}
+
+# (upper bound exclusive, label); None = no upper bound
+AGE_BANDS = ((30, "<30"), (40, "30-39"), (50, "40-49"), (None, "50+"))
+
+# Outcomes in the pair's orientation (variants sorted)
+FIRST, SECOND, TIE = 0, 1, 2
+N_OUTCOMES = 3
+
+PAIR_SEPARATOR = " vs "
+
+
+def age_band(age) -> str:
+    if age is None:
+        return "?"
+    for upper, label in AGE_BANDS:
+        if upper is None or age < upper:
+            return label
+
+
+def judgment_key(e: dict, interpretations: dict, profiles: dict) -> tuple[tuple, int] | None:
+    """(dimension values, outcome) of one judgment, or None if its variant pair is unknown."""
+    winner, loser = e.get("interpretation_id"), e.get("preferred_over")
+    shown = (e.get("shown_a"), e.get("shown_b"))
+    ids = shown if all(shown) else (winner, loser) if winner and loser else None
+    if not ids:
+        return None
+    a, b = interpretations.get(ids[0]), interpretations.get(ids[1])
+    if not a or not b or a["prompt_variant"] == b["prompt_variant"]:
+        return None
+
+    pair = sorted((a["prompt_variant"], b["prompt_variant"]))
+    if not loser:
+        outcome = TIE
+    else:
+        outcome = FIRST if interpretations[winner]["prompt_variant"] == pair[0] else SECOND
+
+    profile = profiles.get(a.get("user_profile_id"), {})
+    values = (
+        PAIR_SEPARATOR.join(pair),
+        a["instrument_code"],
+        a.get("level") or "?",
+        profile.get("work_type") or "?",
+        "?" if profile.get("is_leader") is None else "tak" if profile["is_leader"] else "nie",
+        profile.get("gender") or "?",
+        age_band(profile.get("age")),
+        e.get("evaluator_name") or "unknown",
+    )
+    return values, outcome
+
+
+class StratifiedCube:
+    """Sparse cube: `coords` (cells x dimensions) codes into `labels`, `counts` (cells x outcomes)."""
+
+    def __init__(self, labels: dict[str, list[str]], coords: np.ndarray, counts: np.ndarray):
+        self.labels = labels
+        self.coords = coords
+        self.counts = counts
+
+    @property
+    def judgments(self) -> int:
+        return int(self.counts.sum())
+
+    def values(self, dimension: str) -> list[str]:
+        return sorted(self.labels[dimension])
+
+    def _mask(self, filters: dict) -> np.ndarray:
+        mask = np.ones(len(self.coords), dtype=bool)
+        for dimension, value in filters.items():
+            labels = self.labels[dimension]
+            if value not in labels:
+                return np.zeros(len(self.coords), dtype=bool)
+            mask &= self.coords[:, DIMENSIONS.index(dimension)] == labels.index(value)
+        return mask
+
+    def query(self, by: str = "pair", variant: str = None, **filters) -> list[dict]:
+        """
+        Win rates grouped by the `by` dimension within the cells matching `filters`.
+        Without `variant`, rows are per variant pair (win rate of the first variant).
+        With `variant`, its pairs are turned to put it first and summed, so rows give
+        its win rate against all other variants.
+        """
+        mask = self._mask(filters)
+        coords, counts = self.coords[mask], self.counts[mask]
+
+        pair_labels = self.labels["pair"]
+        if variant:
+            pairs = [p.split(PAIR_SEPARATOR) for p in pair_labels]
+            contains = np.array([variant in p for p in pairs], dtype=bool)
+            second = np.array([p[1] == variant for p in pairs], dtype=bool)
+            keep = contains[coords[:, 0]]
+            coords, counts = coords[keep], counts[keep].copy()
+            flip = second[coords[:, 0]]
+            counts[flip] = counts[flip][:, [SECOND, FIRST, TIE]]
+
+        group_dims = [by] if variant else list(dict.fromkeys(("pair", by)))
+        axes = [DIMENSIONS.index(d) for d in group_dims]
+        shape = [len(self.labels[d]) for d in group_dims]
+        if not len(counts):
+            return []
+        groups, group_of = np.unique(np.ravel_multi_index(coords[:, axes].T, shape), return_inverse=True)
+        totals = np.zeros((len(groups), N_OUTCOMES), dtype=np.int64)
+        np.add.at(totals, group_of, counts)
+
+        rows = []
+        for codes, (first, second, ties) in zip(np.stack(np.unravel_index(groups, shape), axis=1), totals):
+            first, second, ties = int(first), int(second), int(ties)
+            low, high = confidence_sequence(first, second)
+            row = {d: self.labels[d][c] for d, c in zip(group_dims, codes)}
+            if variant:
+                # Rows are oriented with `variant` first
+                others = [v for v in row.get("pair", "").split(PAIR_SEPARATOR) if v and v != variant]
+                row["pair"] = f"{variant}{PAIR_SEPARATOR}{others[0] if others else 'wszystkie'}"
+            row.update({
+                "wins": first,
+                "losses": second,
+                "ties": ties,
+                "win_rate": first / (first + second) * 100 if first + second else None,
+                "low": low * 100,
+                "high": high * 100,
+            })
+            rows.append(row)
+        return rows
+
+
+def build_cube(evaluations: list[dict], interpretations: dict, profiles: dict) -> StratifiedCube:
+    """
+    One group-by pass over all judgments. `interpretations` maps id -> row with
+    prompt_variant, instrument_code, level and user_profile_id; `profiles` maps
+    profile id -> profile.
+    """
+    codes = {d: {} for d in DIMENSIONS}
+    keys, outcomes = [], []
+    for e in evaluations:
+        key = judgment_key(e, interpretations, profiles)
+        if not key:
+            continue
+        values, outcome = key
+        keys.append([codes[d].setdefault(v, len(codes[d])) for d, v in zip(DIMENSIONS, values)])
+        outcomes.append(outcome)
+
+    labels = {d: list(codes[d]) for d in DIMENSIONS}
+    if not keys:
+        return StratifiedCube(labels, np.empty((0, len(DIMENSIONS)), dtype=np.int64), np.empty((0, N_OUTCOMES), dtype=np.int64))
+
+    shape = [len(labels[d]) for d in DIMENSIONS]
+    cells, cell_of = np.unique(np.ravel_multi_index(np.array(keys).T, shape), return_inverse=True)
+    counts = np.zeros((len(cells), N_OUTCOMES), dtype=np.int64)
+    np.add.at(counts, (cell_of, np.array(outcomes)), 1)
+    coords = np.stack(np.unravel_index(cells, shape), axis=1)
+    return StratifiedCube(labels, coords, counts)
+
+
+def print_drilldown(rows: list[dict], by: str):
+    print("-" * 72)
+    print(f"{DIMENSION_PL['pair']:<28} {DIMENSION_PL[by]:<16} {'W-L-R':>12} {'Win rate':>9}  {'CI 95%':>9}")
+    print("-" * 72)
+    for r in sorted(rows, key=lambda r: (r["pair"], r[by])):
+        score = f"{r['wins']}-{r['losses']}-{r['ties']}"
+        rate = "—" if r["win_rate"] is None else f"{r['win_rate']:.0f}%"
+        print(f"{r['pair'][:28]:<28} {r[by][:16]:<16} {score:>12} {rate:>9}  {r['low']:>3.0f}–{r['high']:.0f}%")
+    print()
+
+
+def main(by: str = "level", variant: str = None, filters: dict = None):
+    import time
+    from experiment import user_profiles
+    from analysis import fetch_evaluations, fetch_interpretations
+
+    evaluations = fetch_evaluations()
+    interpretations = fetch_interpretations()
+
+    start = time.perf_counter()
+    cube = build_cube(evaluations, interpretations, {p["id"]: p for p in user_profiles()})
+    built = time.perf_counter()
+    rows = cube.query(by, variant, **(filters or {}))
+    queried = time.perf_counter()
+
+    print(f"Kostka: {cube.judgments} ocen, {len(cube.coords)} niepustych komórek "
+          f"(budowa {(built - start) * 1000:.1f} ms, zapytanie {(queried - built) * 1000:.1f} ms)")
+    if filters:
+        print("Filtry: " + ", ".join(f"{DIMENSION_PL[d]}={v}" for d, v in filters.items()))
+    print()
+    if rows:
+        print_drilldown(rows, by)
+    else:
+        print("Brak ocen w tym wycinku.")
+
+
+if __name__ == "__main__":
+    import sys
+
+    by = "level"
+    variant = None
+    filters = {}
+    for arg in sys.argv[1:]:
+        if not arg.startswith("--") or "=" not in arg:
+            continue
+        name, value = arg[2:].split("=", 1)
+        if name == "by":
+            by = value
+        elif name == "variant":
+            variant = value
+        elif name in DIMENSIONS:
+            filters[name] = value
+        else:
+            print(f"❌ Nieznany wymiar: {name} (dostępne: {', '.join(DIMENSIONS)})")
+            sys.exit(1)
+    if by not in DIMENSIONS:
+        print(f"❌ Nieznany wymiar: {by} (dostępne: {', '.join(DIMENSIONS)})")
+        sys.exit(1)
+
+    main(by=by, variant=variant, filters=filters)
@@ -0,0 +1,103 @@
+"""
+Lazily created API clients shared by all scripts.
+supabase and openai are imported on first use, so commands that never touch
+the network do not pay for loading them. Supabase calls go through one tuned
+HTTP client per process (see transport.py).
+"""
+import os
+import sys
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_KEY_POOL = os.environ.get("OPENAI_KEY_POOL")  # JSON file with several keys (see key_pool.py)
+PAGE_SIZE = 1000  # Rows per request, at most PostgREST's row limit (max-rows)
+
+_http_client = None
+_supabase_client = None
+_openai_client = None
+_async_openai_client = None
+_key_pool = None
+
+
+def get_http_client():
+    """Lazy initialization of the pooled HTTP client used for all Supabase calls."""
+    global _http_client
+    if _http_client is None:
+        from transport import build_http_client
+
+        _http_client = build_http_client()
+    return _http_client
+
+
+def get_supabase():
+    """Lazy initialization of Supabase client."""
+    global _supabase_client
+    if _supabase_client is None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            print("❌ Brak zmiennych SUPABASE_URL i SUPABASE_KEY")
+            sys.exit(1)
+        from supabase import ClientOptions, create_client
+
+        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=get_http_client()))
+    return _supabase_client
+
+
+def get_openai():
+    """Lazy initialization of OpenAI client."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+
+def get_async_openai():
+    """Lazy initialization of async OpenAI client."""
+    global _async_openai_client
+    if _async_openai_client is None:
+        from openai import AsyncOpenAI
+
+        _async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _async_openai_client
+
+
+def get_key_pool():
+    """Lazy initialization of the API key pool used by the generators."""
+    global _key_pool
+    if _key_pool is None:
+        from key_pool import KeyPool
+
+        _key_pool = KeyPool.from_config(OPENAI_KEY_POOL, OPENAI_API_KEY)
+    return _key_pool
+
+
+_active_experiment_id = None
+
+
+def active_experiment_id() -> str:
+    """Id of the active experiment (see the experiments table), read once per process."""
+    global _active_experiment_id
+    if _active_experiment_id is None:
+        _active_experiment_id = get_supabase().rpc("current_experiment_id").execute().data
+    return _active_experiment_id
+
+
+def select_active(table: str, columns: str = "*", **kwargs):
+    """`table.select(columns)` restricted to rows of the active experiment."""
+    return get_supabase().table(table).select(columns, **kwargs).eq("experiment_id", active_experiment_id())
+
+
+def fetch_all(build_query, page_size: int = PAGE_SIZE) -> list[dict]:
+    """
+    All rows of a query, paged past the API row limit (a plain execute() stops
+    at it silently). build_query() must return a new query ordered on unique
+    columns, e.g. `lambda: select_active("runs", "id").order("id")`.
+    """
+    rows = []
+    while True:
+        page = build_query().range(len(rows), len(rows) + page_size - 1).execute().data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
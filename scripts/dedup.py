@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection across generated interpretations.
+Texts are reduced to MinHash signatures over word shingles and indexed with
+LSH banding, so finding the near-copies of a text touches only the few
+candidates that share a band instead of the whole table.
+
+The index is kept on disk, one file per experiment, and updated
+incrementally: each run only hashes interpretations it has not seen yet. The
+generators and the evaluation app update the same files.
+
+Usage:
+    python scripts/dedup.py                  # Update index, report near-duplicates and diversity
+    python scripts/dedup.py --threshold=0.9  # Custom similarity threshold
+    python scripts/dedup.py --rebuild        # Rebuild index from scratch
+"""
+import re
+import os
+import pickle
+import hashlib
+import random
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+
+BASE_DIR = Path(__file__).parent.parent
+INDEX_DIR = BASE_DIR / ".cache/minhash"
+
+SHINGLE_SIZE = 5  # Words per shingle
+NUM_PERM = 128
+BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 Jaccard almost always collide
+SIMILARITY_THRESHOLD = 0.8
+DIVERSITY_SAMPLE = 500  # Random pairs per variant for the diversity estimate
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)  # Fixed seed: signatures must be comparable across runs
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+WORD_RE = re.compile(r"\w+")
+
+
+def index_path(experiment_id: str) -> Path:
+    """Index file of one experiment; near-duplicates are only looked for within an experiment."""
+    return INDEX_DIR / f"{experiment_id}.pkl"
+
+
+def shingles(text: str) -> np.ndarray:
+    """Hashes of lowercased word n-grams."""
+    words = WORD_RE.findall(text.lower())
+    grams = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little") for g in grams],
+        dtype=np.uint64
+    )
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature: minimum of each of NUM_PERM universal hashes over the shingles."""
+    x = shingles(text) % _PRIME
+    hashed = (np.outer(x, _PERM_A) + _PERM_B) % _PRIME  # (shingles, NUM_PERM)
+    return hashed.min(axis=0)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+
+class MinHashLSH:
+    """MinHash signatures of interpretations with an LSH band index."""
+
+    def __init__(self, bands: int = BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.signatures = {}  # interpretation id -> signature
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, interpretation_id: str, text: str) -> np.ndarray:
+        signature = minhash(text)
+        self._insert(interpretation_id, signature)
+        return signature
+
+    def query(self, signature: np.ndarray, threshold: float = SIMILARITY_THRESHOLD) -> list[tuple[str, float]]:
+        """Indexed interpretations similar to `signature`, most similar first."""
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates |= self.buckets[band].get(key, set())
+        matches = [(c, similarity(signature, self.signatures[c])) for c in candidates]
+        return sorted([m for m in matches if m[1] >= threshold], key=lambda m: -m[1])
+
+    def near_duplicates(self, interpretation_id: str, threshold: float = SIMILARITY_THRESHOLD) -> list[tuple[str, float]]:
+        return [m for m in self.query(self.signatures[interpretation_id], threshold) if m[0] != interpretation_id]
+
+    def near_duplicate_pairs(self, threshold: float = SIMILARITY_THRESHOLD) -> dict[frozenset, float]:
+        """All indexed pairs at or above the threshold."""
+        pairs = {}
+        for band_buckets in self.buckets:
+            for ids in band_buckets.values():
+                if len(ids) < 2:
+                    continue
+                ids = sorted(ids)
+                for i, a in enumerate(ids):
+                    for b in ids[i + 1:]:
+                        key = frozenset((a, b))
+                        if key not in pairs:
+                            pairs[key] = similarity(self.signatures[a], self.signatures[b])
+        return {k: v for k, v in pairs.items() if v >= threshold}
+
+    def _insert(self, interpretation_id: str, signature: np.ndarray):
+        self.signatures[interpretation_id] = signature
+        for band, key in self._band_keys(signature):
+            self.buckets[band][key].add(interpretation_id)
+
+    def save(self, path: Path):
+        """Persist signatures only; buckets are rebuilt on load. Readers never see a partly written file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({"bands": self.bands, "signatures": self.signatures}, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: Path) -> "MinHashLSH":
+        if not path.exists():
+            return MinHashLSH()
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index = MinHashLSH(bands=state["bands"])
+        for interpretation_id, signature in state["signatures"].items():
+            index._insert(interpretation_id, signature)
+        return index
+
+
+def update_index(index: MinHashLSH, rows: list[dict]) -> list[str]:
+    """Add rows not yet in the index; returns the ids that were added."""
+    added = []
+    for r in rows:
+        text = r.get("interpretation_text")
+        if r["id"] in index.signatures or not text or not text.strip():
+            continue
+        index.add(r["id"], text)
+        added.append(r["id"])
+    return added
+
+
+def variant_diversity(index: MinHashLSH, rows: list[dict], sample: int = DIVERSITY_SAMPLE) -> dict:
+    """
+    Per variant: 1 - mean similarity between outputs for the same instrument and score
+    (across profiles and samples), estimated on random pairs.
+    """
+    groups = defaultdict(list)
+    for r in rows:
+        if r["id"] in index.signatures:
+            groups[(r["prompt_variant"], r["instrument_code"], r["score"])].append(r["id"])
+
+    pairs_by_variant = defaultdict(list)
+    for (variant, _, _), ids in groups.items():
+        pairs_by_variant[variant].extend((a, b) for i, a in enumerate(ids) for b in ids[i + 1:])
+
+    rng = random.Random(0)
+    diversity = {}
+    for variant, pairs in pairs_by_variant.items():
+        if len(pairs) > sample:
+            pairs = rng.sample(pairs, sample)
+        sims = [similarity(index.signatures[a], index.signatures[b]) for a, b in pairs]
+        diversity[variant] = 1 - sum(sims) / len(sims)
+    return diversity
+
+
+def main(threshold: float = SIMILARITY_THRESHOLD, rebuild: bool = False):
+    from db import active_experiment_id, select_active
+    from text_store import get_text_loader
+
+    rows = select_active("interpretations",
+        "id, instrument_code, score, prompt_variant, user_profile_id, text_storage"
+    ).gt("text_length", 0).execute().data
+
+    path = index_path(active_experiment_id())
+    index = MinHashLSH() if rebuild else MinHashLSH.load(path)
+    # Only rows new to the index need their text
+    added = update_index(index, get_text_loader().with_texts([r for r in rows if r["id"] not in index.signatures]))
+    index.save(path)
+    print(f"Zindeksowano {len(added)} nowych interpretacji (razem {len(index.signatures)})")
+
+    by_id = {r["id"]: r for r in rows}
+    duplicates = index.near_duplicate_pairs(threshold)
+    print(f"\nPrawie-duplikaty (podobieństwo ≥ {threshold:.2f}): {len(duplicates)}")
+    for key, sim in sorted(duplicates.items(), key=lambda x: -x[1]):
+        a, b = (by_id.get(i, {"prompt_variant": "?", "id": i}) for i in sorted(key))
+        print(f"  {sim:.2f}  {a['id']} ({a['prompt_variant']})  ~  {b['id']} ({b['prompt_variant']})")
+
+    print("\nRóżnorodność wariantów (1 - średnie podobieństwo dla tego samego instrumentu i wyniku):")
+    for variant, value in sorted(variant_diversity(index, rows).items(), key=lambda x: -x[1]):
+        print(f"  {variant}: {value:.2f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    threshold = SIMILARITY_THRESHOLD
+    for arg in sys.argv:
+        if arg.startswith("--threshold="):
+            threshold = float(arg.split("=")[1])
+
+    main(threshold=threshold, rebuild="--rebuild" in sys.argv)
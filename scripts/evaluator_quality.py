@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Evaluator consistency and quality.
+Per evaluator:
+  - position bias:     share of "A" among decisive judgments (0.5 = none) and its z-score
+  - tie rate
+  - self-consistency:  agreement between repeated judgments of the same pair
+  - kappa:             Cohen's kappa against the leave-one-out consensus of the other evaluators
+  - time:              median time per judgment
+Overall: Fleiss' kappa over pairs judged by 2+ evaluators.
+
+Judgments are encoded once into integer arrays (evaluator, pair, outcome) and
+every metric is a bincount/add.at reduction over them, so the cost grows with
+the number of judgments, not with evaluators x evaluators.
+
+Evaluator weights (kappa against consensus, floored at 0) are used by
+analysis.py for a quality-weighted ranking.
+
+Usage:
+    python scripts/evaluator_quality.py
+"""
+import numpy as np
+
+# Outcomes in the pair's canonical orientation (interpretation ids sorted)
+FIRST, SECOND, TIE = 0, 1, 2
+N_OUTCOMES = 3
+
+MIN_JUDGMENTS = 10  # Evaluators with fewer judgments keep weight 1
+MIN_WEIGHT = 0.0
+
+
+def encode(evaluations: list[dict]) -> dict:
+    """
+    Integer arrays of all judgments. Rows missing the shown pair (ties saved
+    before shown order was recorded) get pair -1; rows without a shown order get
+    position -1.
+    """
+    evaluators = sorted({e.get("evaluator_name") or "unknown" for e in evaluations})
+    evaluator_index = {name: i for i, name in enumerate(evaluators)}
+    pair_index = {}
+
+    n = len(evaluations)
+    evaluator = np.empty(n, dtype=np.int64)
+    pair = np.full(n, -1, dtype=np.int64)
+    outcome = np.full(n, TIE, dtype=np.int64)
+    position = np.full(n, -1, dtype=np.int64)  # 0 = A chosen, 1 = B chosen, 2 = tie
+    time_ms = np.full(n, np.nan)
+
+    for i, e in enumerate(evaluations):
+        evaluator[i] = evaluator_index[e.get("evaluator_name") or "unknown"]
+        winner, loser = e.get("interpretation_id"), e.get("preferred_over")
+        shown = (e.get("shown_a"), e.get("shown_b"))
+        ids = shown if all(shown) else (winner, loser) if winner and loser else None
+        if ids:
+            key = tuple(sorted(ids))
+            pair[i] = pair_index.setdefault(key, len(pair_index))
+            if loser:
+                outcome[i] = FIRST if winner == key[0] else SECOND
+        if all(shown):
+            position[i] = 2 if not loser else 0 if winner == shown[0] else 1
+        if e.get("response_time_ms") is not None:
+            time_ms[i] = e["response_time_ms"]
+
+    return {
+        "evaluators": evaluators,
+        "evaluator": evaluator,
+        "pair": pair,
+        "outcome": outcome,
+        "position": position,
+        "time_ms": time_ms,
+        "n_pairs": len(pair_index),
+    }
+
+
+def fleiss_kappa(counts: np.ndarray) -> float:
+    """Fleiss' kappa of an (items, categories) count matrix; items may have different rater counts."""
+    raters = counts.sum(axis=1)
+    counts = counts[raters >= 2]
+    raters = raters[raters >= 2]
+    if len(counts) == 0:
+        return float("nan")
+    p_item = ((counts ** 2).sum(axis=1) - raters) / (raters * (raters - 1))
+    p_category = counts.sum(axis=0) / raters.sum()
+    p_expected = (p_category ** 2).sum()
+    if p_expected == 1:
+        return float("nan")
+    return float((p_item.mean() - p_expected) / (1 - p_expected))
+
+
+def evaluator_quality(evaluations: list[dict]) -> dict:
+    """Per-evaluator metrics and the overall Fleiss' kappa."""
+    a = encode(evaluations)
+    n_eval = len(a["evaluators"])
+    ev, pair, outcome, position = a["evaluator"], a["pair"], a["outcome"], a["position"]
+
+    judgments = np.bincount(ev, minlength=n_eval)
+    ties = np.bincount(ev, weights=outcome == TIE, minlength=n_eval)
+
+    # Position bias over judgments with a known shown order and a winner
+    decisive = (position == 0) | (position == 1)
+    chose_a = np.bincount(ev[decisive], weights=position[decisive] == 0, minlength=n_eval)
+    n_decisive = np.bincount(ev[decisive], minlength=n_eval)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share_a = chose_a / n_decisive
+        position_z = (chose_a - 0.5 * n_decisive) / np.sqrt(0.25 * n_decisive)
+
+    # Outcome counts per pair and per (evaluator, pair) group, both sparse in the pair dimension
+    known = pair >= 0
+    ev_k, pair_k, out_k = ev[known], pair[known], outcome[known]
+    n_pairs = max(a["n_pairs"], 1)
+    groups, group_of = np.unique(ev_k * n_pairs + pair_k, return_inverse=True)
+    group_ev = groups // n_pairs
+    cell = np.zeros((len(groups), N_OUTCOMES))
+    np.add.at(cell, (group_of, out_k), 1)
+    per_pair = np.zeros((n_pairs, N_OUTCOMES))
+    np.add.at(per_pair, (pair_k, out_k), 1)
+
+    # Self-consistency: agreeing judgment pairs among repeats of the same pair
+    repeats = cell.sum(axis=1)
+    agreeing = np.bincount(group_ev, weights=(cell * (cell - 1) / 2).sum(axis=1), minlength=n_eval)
+    comparisons = np.bincount(group_ev, weights=repeats * (repeats - 1) / 2, minlength=n_eval)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        consistency = agreeing / comparisons
+
+    # Leave-one-out consensus of the other evaluators for every judgment (ties in the vote: no consensus)
+    others = per_pair[pair_k] - cell[group_of]
+    top = others.max(axis=1, keepdims=True)
+    has_consensus = (top[:, 0] > 0) & ((others == top).sum(axis=1) == 1)
+    k_ev = ev_k[has_consensus]
+    k_own = out_k[has_consensus]
+    k_cons = others.argmax(axis=1)[has_consensus]
+    n_k = np.bincount(k_ev, minlength=n_eval)
+    agree = np.bincount(k_ev, weights=k_own == k_cons, minlength=n_eval)
+    own_dist = np.bincount(k_ev * N_OUTCOMES + k_own, minlength=n_eval * N_OUTCOMES).reshape(n_eval, N_OUTCOMES)
+    cons_dist = np.bincount(k_ev * N_OUTCOMES + k_cons, minlength=n_eval * N_OUTCOMES).reshape(n_eval, N_OUTCOMES)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_observed = agree / n_k
+        p_expected = (own_dist * cons_dist).sum(axis=1) / n_k ** 2
+        kappa = (p_observed - p_expected) / (1 - p_expected)
+
+    # Median time per judgment
+    order = np.argsort(ev, kind="stable")
+    splits = np.split(a["time_ms"][order], np.cumsum(judgments)[:-1])
+    median_ms = [float(np.nanmedian(t)) if np.isfinite(t).any() else float("nan") for t in splits]
+
+    weights = {}
+    for i, name in enumerate(a["evaluators"]):
+        if n_k[i] >= MIN_JUDGMENTS and np.isfinite(kappa[i]):
+            weights[name] = max(float(kappa[i]), MIN_WEIGHT)
+        else:
+            weights[name] = 1.0
+
+    evaluators = {}
+    for i, name in enumerate(a["evaluators"]):
+        evaluators[name] = {
+            "judgments": int(judgments[i]),
+            "tie_rate": float(ties[i] / judgments[i]),
+            "share_a": float(share_a[i]),
+            "position_z": float(position_z[i]),
+            "repeat_comparisons": int(comparisons[i]),
+            "self_consistency": float(consistency[i]),
+            "consensus_judgments": int(n_k[i]),
+            "consensus_agreement": float(p_observed[i]),
+            "kappa": float(kappa[i]),
+            "median_ms": median_ms[i],
+            "weight": weights[name],
+        }
+
+    return {"evaluators": evaluators, "fleiss_kappa": fleiss_kappa(per_pair), "weights": weights}
+
+
+def fmt(value: float, pattern: str, suffix: str = "") -> str:
+    return "—" if not np.isfinite(value) else format(value, pattern) + suffix
+
+
+def print_quality_report(quality: dict):
+    print("-" * 60)
+    print("JAKOŚĆ OCENIAJĄCYCH:")
+    print("-" * 60)
+    print(f"{'Oceniający':<16} {'Ocen':>5} {'Remisy':>7} {'A%':>5} {'z':>6} {'Spójność':>9} {'Kappa':>6} {'Czas':>6} {'Waga':>5}")
+    for name, q in sorted(quality["evaluators"].items(), key=lambda x: -x[1]["judgments"]):
+        seconds = q["median_ms"] / 1000
+        print(
+            f"{name[:16]:<16} {q['judgments']:>5} {q['tie_rate']:>7.0%} {fmt(q['share_a'] * 100, '.0f'):>5} "
+            f"{fmt(q['position_z'], '+.1f'):>6} {fmt(q['self_consistency'] * 100, '.0f', '%'):>9} "
+            f"{fmt(q['kappa'], '.2f'):>6} {fmt(seconds, '.0f', 's'):>6} {q['weight']:>5.2f}"
+        )
+    print(f"\nKappa Fleissa (pary ocenione przez 2+ osoby): {fmt(quality['fleiss_kappa'], '.2f')}")
+    print("A%: odsetek wyborów lewej interpretacji (|z| > 2: istotne skrzywienie pozycyjne)")
+    print()
+
+
+def main():
+    from analysis import fetch_evaluations
+
+    print_quality_report(evaluator_quality(fetch_evaluations()))
+
+
+if __name__ == "__main__":
+    main()
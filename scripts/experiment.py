@@ -0,0 +1,239 @@
+"""
+Experiment definition shared by all scripts: prompt variants, test scores,
+data files and prompt rendering.
+Data files and templates are loaded lazily on first use, so importing this
+module (or any script built on it) costs almost nothing.
+"""
+import hashlib
+import json
+import random
+import uuid
+from functools import lru_cache
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_FILES = ["instruments_extended.json", "user_profiles_v2.json", "questionnaire_items.json"]
+INTERPRETATION_NAMESPACE = uuid.UUID("5b0d6c1e-8f3a-4c2e-9d47-2a6f1e8b3c90")  # uuid5 namespace of interpretation ids
+
+# V3 prompt variants - focused on comparing data richness
+# Plus Kasia's clinical variants (instrument-specific)
+PROMPT_VARIANTS = [
+    {"id": "minimal", "template": "variant_minimal.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
+    {"id": "profile", "template": "variant_profile.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
+    {"id": "answers", "template": "variant_answers.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
+    {"id": "kasia_phq9", "template": "variant_kasia_phq9.jinja2", "instruments": ["PHQ-9"]},
+    {"id": "kasia_gad7", "template": "variant_kasia_gad7.jinja2", "instruments": ["GAD-7"]},
+]
+
+# Test cases: 2 scores per instrument (moderate and severe); level and label come from the scoring ranges
+TEST_CASES = {
+    "PHQ-9": [12, 20],
+    "GAD-7": [10, 17],
+}
+
+
+@lru_cache(maxsize=None)
+def load_json(filename: str):
+    with open(BASE_DIR / "data" / filename) as f:
+        return json.load(f)
+
+
+def instruments() -> dict:
+    return load_json("instruments_extended.json")
+
+
+def user_profiles() -> list[dict]:
+    return load_json("user_profiles_v2.json")
+
+
+def questionnaire_items() -> dict:
+    return load_json("questionnaire_items.json")
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def data_hash() -> str:
+    """Hash of all data files a prompt can depend on."""
+    h = hashlib.sha256()
+    for filename in DATA_FILES:
+        h.update((BASE_DIR / "data" / filename).read_bytes())
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def template_hash(variant_id: str) -> str:
+    variant = next(v for v in PROMPT_VARIANTS if v["id"] == variant_id)
+    return sha256_hex((BASE_DIR / "prompts" / variant["template"]).read_bytes())
+
+
+def prompt_hash(prompt: str) -> str:
+    return sha256_hex(prompt.encode())
+
+
+def cell_seed(run_seed: int, instrument_code: str, score: int, variant_id: str, profile_id: int,
+              sample: int = 0) -> int:
+    """
+    Counter-based seed of one cell: a hash of (run seed, cell key), so any cell
+    can be reproduced on its own, independent of generation order.
+    """
+    key = f"{run_seed}:{instrument_code}:{score}:{variant_id}:{profile_id}:{sample}"
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") >> 1
+
+
+def interpretation_id(run_id: str, instrument_code: str, score: int, variant_id: str, profile_id: int,
+                      sample: int = 0) -> str:
+    """
+    Client-side id of one generated sample: uuid5 of (run, cell key, sample).
+    Writing the same sample twice (a retry after a timeout) hits the same row,
+    so writes are upserts on id and never duplicate.
+    """
+    return str(uuid.uuid5(INTERPRETATION_NAMESPACE, f"{run_id}:{instrument_code}:{score}:{variant_id}:{profile_id}:{sample}"))
+
+
+@lru_cache(maxsize=None)
+def score_scales() -> dict:
+    """Compiled score -> level tables per (instrument, subscale), see levels.py."""
+    from levels import compile_scales
+
+    return compile_scales(instruments())
+
+
+def score_scale(instrument_code: str, subscale: str = None):
+    try:
+        return score_scales()[(instrument_code, subscale)]
+    except KeyError:
+        raise ValueError(f"{instrument_code}: no scoring ranges" + (f" for subscale {subscale}" if subscale else "")) from None
+
+
+def level_for_score(instrument_code: str, score: int, subscale: str = None) -> dict:
+    """Scoring range ({"level", "label", ...}) containing score."""
+    return score_scale(instrument_code, subscale).band(score)
+
+
+@lru_cache(maxsize=None)
+def test_scores() -> dict[str, list[dict]]:
+    """TEST_CASES with the level and label of each score: {instrument: [{"score", "level", "label"}]}."""
+    return {
+        instrument_code: [
+            {"score": score, "level": band["level"], "label": band["label"]}
+            for score, band in zip(scores, map(score_scale(instrument_code).band, scores))
+        ]
+        for instrument_code, scores in TEST_CASES.items()
+    }
+
+
+@lru_cache(maxsize=None)
+def load_template(filename: str, strict: bool = False):
+    """
+    Compile a template from prompts/ on first use.
+    strict=True raises on any variable missing from the context instead of
+    rendering it as an empty string.
+    """
+    from jinja2 import StrictUndefined, Template, Undefined
+
+    with open(BASE_DIR / "prompts" / filename) as f:
+        return Template(f.read(), undefined=StrictUndefined if strict else Undefined)
+
+
+def get_template(variant_id: str, strict: bool = False):
+    variant = next(v for v in PROMPT_VARIANTS if v["id"] == variant_id)
+    return load_template(variant["template"], strict)
+
+
+def simulate_answers(instrument_code: str, target_score: int, rng: random.Random = None) -> list[dict]:
+    """
+    Generate simulated answers for a questionnaire that sum to target_score.
+    Returns list of answer dicts with question text, response value and label.
+    Pass a seeded rng for reproducible answers; the global RNG is used otherwise.
+    """
+    rng = rng or random
+    items = questionnaire_items()[instrument_code]["items"]
+    response_options = questionnaire_items()[instrument_code]["response_options"]
+    num_items = len(items)
+
+    # Distribute target_score across items
+    # Strategy: start with even distribution, then adjust randomly
+    base_value = target_score // num_items
+    values = [min(base_value, 3) for _ in range(num_items)]
+    current_sum = sum(values)
+
+    # Add remainder to random items
+    indices = list(range(num_items))
+    rng.shuffle(indices)
+
+    for i in indices:
+        if current_sum >= target_score:
+            break
+        max_add = min(3 - values[i], target_score - current_sum)
+        if max_add > 0:
+            add = rng.randint(1, max_add)
+            values[i] += add
+            current_sum += add
+
+    # If we overshot, reduce some values
+    while current_sum > target_score:
+        for i in indices:
+            if values[i] > 0 and current_sum > target_score:
+                reduce = min(values[i], current_sum - target_score)
+                values[i] -= reduce
+                current_sum -= reduce
+
+    # Build answer list
+    answers = []
+    for i, item in enumerate(items):
+        response_value = values[i]
+        response_label = response_options[response_value]["label"]
+        answers.append({
+            "number": item["number"],
+            "question": item["text_pl"],
+            "response_value": response_value,
+            "response_label": response_label,
+        })
+
+    return answers
+
+
+def build_context(instrument_code: str, score: int, level_label: str, variant_id: str, profile: dict,
+                  rng: random.Random = None) -> dict:
+    """Template variables for one cell."""
+    instrument = instruments()[instrument_code]
+
+    # Base context for all variants
+    context = {
+        "instrument": instrument_code,
+        "score": score,
+        "max_score": instrument["scoring"]["max_score"],
+        "level_label": level_label,
+        "user_name": profile["name"],
+        "user_age": profile["age"],
+        "user_gender": profile["gender"],
+    }
+
+    # Add work_type for Kasia variants (they use basic user data + work context)
+    if variant_id in ["kasia_phq9", "kasia_gad7"]:
+        context["work_type"] = profile["work_type"]
+
+    # Add full profile data for 'profile' and 'answers' variants
+    if variant_id in ["profile", "answers"]:
+        context.update({
+            "work_type": profile["work_type"],
+            "is_leader": profile["is_leader"],
+            "subtopics": profile["subtopics"],
+        })
+
+    # Add simulated answers for 'answers' variant
+    if variant_id == "answers":
+        context["answers"] = simulate_answers(instrument_code, score, rng)
+
+    return context
+
+
+def build_prompt(instrument_code: str, score: int, level_label: str, variant_id: str, profile: dict,
+                 strict: bool = False, seed: int = None) -> str:
+    """Build prompt from template. A seed (see cell_seed) makes the prompt reproducible."""
+    rng = random.Random(seed) if seed is not None else None
+    context = build_context(instrument_code, score, level_label, variant_id, profile, rng)
+    return get_template(variant_id, strict).render(**context)
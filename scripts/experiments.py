@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Experiment management.
+Every interpretation, evaluation, judge verdict and run belongs to an
+experiment; only the active one is read by the app and the scripts. Switching
+experiments changes a single pointer row, and archiving moves an inactive
+experiment's rows to the *_archive tables (cold storage) in one server-side
+transaction.
+
+Usage:
+    python scripts/experiments.py                         # List experiments
+    python scripts/experiments.py new v4 --description="Nowe szablony"
+    python scripts/experiments.py switch v3               # Make an existing experiment active
+    python scripts/experiments.py archive v3              # Move an inactive experiment to the archive
+"""
+import sys
+from db import get_supabase
+
+
+def get_experiments() -> list[dict]:
+    return get_supabase().table("experiments").select("*").order("created_at").execute().data
+
+
+def get_active() -> dict:
+    active_id = get_supabase().rpc("current_experiment_id").execute().data
+    return next(e for e in get_experiments() if e["id"] == active_id)
+
+
+def get_by_name(name: str) -> dict:
+    result = get_supabase().table("experiments").select("*").eq("name", name).execute().data
+    if not result:
+        print(f"❌ Nie ma eksperymentu: {name}")
+        sys.exit(1)
+    return result[0]
+
+
+def get_counts(experiment_id: str) -> tuple[int, int]:
+    """(interpretations, evaluations) of an experiment."""
+    interps = get_supabase().table("interpretations").select("id", count="exact").eq(
+        "experiment_id", experiment_id
+    ).limit(1).execute()
+    evals = get_supabase().table("evaluations").select("id", count="exact").eq(
+        "experiment_id", experiment_id
+    ).limit(1).execute()
+    return interps.count, evals.count
+
+
+def activate(name: str, description: str = None) -> str:
+    """Make the experiment active, creating it if needed. Returns its id."""
+    return get_supabase().rpc(
+        "activate_experiment", {"experiment_name": name, "experiment_description": description}
+    ).execute().data
+
+
+def archive(experiment_id: str) -> int:
+    """Move an inactive experiment to the archive tables. Returns the number of interpretations moved."""
+    return get_supabase().rpc("archive_experiment", {"target": experiment_id}).execute().data
+
+
+def print_experiments():
+    active = get_active()
+    for e in get_experiments():
+        marker = "*" if e["id"] == active["id"] else " "
+        if e["archived_at"]:
+            print(f"{marker} {e['name']:<24} zarchiwizowany {e['archived_at'][:10]}")
+            continue
+        interp_count, eval_count = get_counts(e["id"])
+        print(f"{marker} {e['name']:<24} interpretacje: {interp_count:>6}  ewaluacje: {eval_count:>6}  {e['description'] or ''}")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    description = None
+    for arg in sys.argv:
+        if arg.startswith("--description="):
+            description = arg.split("=", 1)[1]
+
+    command = args[0] if args else "list"
+    if command == "list":
+        print_experiments()
+    elif command in ("new", "switch") and len(args) == 2:
+        if command == "switch":
+            get_by_name(args[1])
+        activate(args[1], description)
+        print(f"✅ Aktywny eksperyment: {args[1]}")
+    elif command == "archive" and len(args) == 2:
+        experiment = get_by_name(args[1])
+        moved = archive(experiment["id"])
+        print(f"✅ Zarchiwizowano '{args[1]}': {moved} interpretacji")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Export the experiment dataset to partitioned Parquet files.
+Streams `interpretations` and `evaluations` page by page, joins them with
+profile and instrument metadata and appends new rows to hive-partitioned
+datasets. Low-cardinality columns (variant, instrument, level, evaluator, ...)
+are dictionary encoded.
+
+Every table has one fixed schema (SCHEMAS), so all files of a dataset agree
+on column types even when a page has a column that is entirely null.
+
+Only rows after the previous export are fetched (watermark on (created_at, id)
+kept in _state.json), so repeated runs are cheap appends.
+
+Usage:
+    python scripts/export_parquet.py                     # Export to ./export
+    python scripts/export_parquet.py --out=/data/pv      # Custom output directory
+    python scripts/export_parquet.py --full              # Delete the previous export, re-export everything
+
+Reading:
+    import pyarrow.dataset as ds
+    interpretations = ds.dataset("export/interpretations", partitioning="hive").to_table()
+"""
+import json
+import shutil
+import time
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.dataset as ds
+from experiment import BASE_DIR, instruments, user_profiles
+from db import get_supabase
+from text_store import get_text_loader
+
+DEFAULT_OUT = BASE_DIR / "export"
+PAGE_SIZE = 1000
+
+# Dictionary encoded: low-cardinality text columns
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+PROFILE_FIELDS = [
+    ("profile_name", DICTIONARY),
+    ("profile_age", pa.int64()),
+    ("profile_gender", DICTIONARY),
+    ("profile_work_type", DICTIONARY),
+    ("profile_is_leader", pa.bool_()),
+    ("profile_subtopic_count", pa.int64()),
+]
+SCHEMAS = {
+    "interpretations": pa.schema([
+        ("id", pa.string()),
+        ("experiment_id", pa.string()),
+        ("run_id", pa.string()),
+        ("instrument_code", DICTIONARY),
+        ("score", pa.int64()),
+        ("level", DICTIONARY),
+        ("prompt_variant", DICTIONARY),
+        ("user_profile_id", pa.int64()),
+        ("interpretation_text", pa.string()),
+        ("text_length", pa.int64()),
+        ("model", DICTIONARY),
+        ("api_key_alias", DICTIONARY),
+        ("seed", pa.int64()),
+        ("prompt_hash", pa.string()),
+        ("template_hash", pa.string()),
+        ("data_hash", pa.string()),
+        ("created_at", pa.string()),
+        *PROFILE_FIELDS,
+        ("instrument_domain", DICTIONARY),
+        ("instrument_max_score", pa.int64()),
+    ]),
+    "evaluations": pa.schema([
+        ("id", pa.string()),
+        ("experiment_id", pa.string()),
+        ("interpretation_id", pa.string()),
+        ("preferred_over", pa.string()),
+        ("shown_a", pa.string()),
+        ("shown_b", pa.string()),
+        ("evaluator_name", DICTIONARY),
+        ("rating", pa.int64()),
+        ("feedback", pa.string()),
+        ("response_time_ms", pa.int64()),
+        ("created_at", pa.string()),
+        ("instrument_code", DICTIONARY),
+        ("score", pa.int64()),
+        ("level", DICTIONARY),
+        ("winner_variant", DICTIONARY),
+        ("loser_variant", DICTIONARY),
+        ("is_tie", pa.bool_()),
+        *PROFILE_FIELDS,
+    ]),
+}
+PARTITIONS = {
+    "interpretations": ["instrument_code", "prompt_variant"],
+    "evaluations": ["instrument_code"],
+}
+
+def stream_rows(table: str, columns: str, since: dict | None):
+    """
+    Yield pages of rows after the watermark `since` ({"created_at", "id"}), oldest
+    first. Each page starts after the last row of the previous one (keyset
+    paging), so every page is one index range scan however far the export is.
+    `columns` must include created_at and id.
+    """
+    while True:
+        query = get_supabase().table(table).select(columns).order("created_at").order("id")
+        if since:
+            query = after(query, since)
+        page = query.limit(PAGE_SIZE).execute().data
+        if page:
+            yield page
+        if len(page) < PAGE_SIZE:
+            return
+        since = {"created_at": page[-1]["created_at"], "id": page[-1]["id"]}
+
+
+def after(query, since: dict):
+    """Rows after (created_at, id) in export order; many rows share created_at (one write per run)."""
+    created_at = since["created_at"]
+    if since["id"] is None:
+        return query.gt("created_at", created_at)
+    return query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{since["id"]})')
+
+
+def profile_columns(profile_id: int) -> dict:
+    profile = next((p for p in user_profiles() if p["id"] == profile_id), {})
+    return {
+        "profile_name": profile.get("name"),
+        "profile_age": profile.get("age"),
+        "profile_gender": profile.get("gender"),
+        "profile_work_type": profile.get("work_type"),
+        "profile_is_leader": profile.get("is_leader"),
+        "profile_subtopic_count": len(profile.get("subtopics", [])),
+    }
+
+
+def enrich_interpretation(row: dict) -> dict:
+    instrument = instruments().get(row["instrument_code"], {})
+    return {
+        **row,
+        **profile_columns(row["user_profile_id"]),
+        "instrument_domain": instrument.get("domain"),
+        "instrument_max_score": instrument.get("scoring", {}).get("max_score"),
+    }
+
+
+def enrich_evaluation(row: dict, interpretations: dict) -> dict:
+    winner = interpretations.get(row["interpretation_id"], {})
+    loser = interpretations.get(row.get("preferred_over"), {})
+    return {
+        **row,
+        "instrument_code": winner.get("instrument_code"),
+        "score": winner.get("score"),
+        "level": winner.get("level"),
+        "winner_variant": winner.get("prompt_variant"),
+        "loser_variant": loser.get("prompt_variant"),
+        "is_tie": not row.get("preferred_over"),
+        **profile_columns(winner.get("user_profile_id")),
+    }
+
+
+def to_arrow(rows: list[dict], name: str) -> pa.Table:
+    return pa.Table.from_pylist(rows, schema=SCHEMAS[name])
+
+
+def write_partitioned(table: pa.Table, out_dir: Path, name: str, run_tag: str, part: int):
+    """Append one batch as new files; existing files are never rewritten."""
+    ds.write_dataset(
+        table,
+        out_dir / name,
+        format="parquet",
+        partitioning=PARTITIONS[name],
+        partitioning_flavor="hive",
+        basename_template=f"{run_tag}-{part}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def load_state(out_dir: Path) -> dict:
+    path = out_dir / "_state.json"
+    if not path.exists():
+        return {}
+    state = json.loads(path.read_text())
+    # Watermarks of older exports are a bare created_at, and every row at it was exported
+    return {name: {"created_at": mark, "id": None} if isinstance(mark, str) else mark for name, mark in state.items()}
+
+
+def save_state(out_dir: Path, state: dict):
+    (out_dir / "_state.json").write_text(json.dumps(state, indent=2))
+
+
+def clear_export(out_dir: Path):
+    """Remove the datasets and watermarks of previous exports."""
+    for name in SCHEMAS:
+        shutil.rmtree(out_dir / name, ignore_errors=True)
+    (out_dir / "_state.json").unlink(missing_ok=True)
+
+
+def main(out_dir: Path = DEFAULT_OUT, full: bool = False):
+    if full:
+        clear_export(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(out_dir)
+    run_tag = time.strftime("%Y%m%dT%H%M%S")
+
+    # Evaluations need metadata of every interpretation they reference, not just the new ones
+    interpretation_meta = {}
+    for page in stream_rows("interpretations", "id, created_at, instrument_code, score, level, prompt_variant, user_profile_id", None):
+        interpretation_meta.update({r["id"]: r for r in page})
+
+    counts = {}
+    for name, columns in [("interpretations", "*"), ("evaluations", "*")]:
+        counts[name] = 0
+        for part, page in enumerate(stream_rows(name, columns, state.get(name))):
+            if name == "interpretations":
+                # Compressed texts live outside the row (see text_store.py)
+                texts = get_text_loader().texts([r for r in page if r.get("text_storage") == "zstd"], cache=False)
+                rows = [enrich_interpretation({**r, "interpretation_text": texts.get(r["id"], r["interpretation_text"])})
+                        for r in page]
+            else:
+                rows = [enrich_evaluation(r, interpretation_meta) for r in page]
+            write_partitioned(to_arrow(rows, name), out_dir, name, run_tag, part)
+            counts[name] += len(rows)
+            state[name] = {"created_at": page[-1]["created_at"], "id": page[-1]["id"]}
+            save_state(out_dir, state)
+
+    print(f"✅ Eksport do {out_dir}")
+    print(f"   Interpretacje: {counts['interpretations']} nowych wierszy")
+    print(f"   Ewaluacje: {counts['evaluations']} nowych wierszy")
+
+
+if __name__ == "__main__":
+    import sys
+
+    out_dir = DEFAULT_OUT
+    for arg in sys.argv:
+        if arg.startswith("--out="):
+            out_dir = Path(arg.split("=", 1)[1])
+
+    main(out_dir=out_dir, full="--full" in sys.argv)
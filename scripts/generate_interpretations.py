@@ -5,136 +5,28 @@ V3 - New prompt variants for testing:
   - minimal: basic user data + score only
   - profile: full user profile with subtopics + score
   - answers: full profile + individual question answers
+
+Usage:
+    python scripts/generate_interpretations.py --dry-run     # 3 samples, nothing saved
+    python scripts/generate_interpretations.py --limit=10
+    python scripts/generate_interpretations.py --no-skip     # Also regenerate existing cells
+    python scripts/generate_interpretations.py --seed=123    # Fixed run seed (see runs.py)
 """
-import os
-import json
 import time
-import random
-from pathlib import Path
-from jinja2 import Template
-from openai import OpenAI
-from supabase import create_client
+from experiment import (
+    PROMPT_VARIANTS, build_prompt, cell_seed, data_hash, interpretation_id, prompt_hash, template_hash, test_scores,
+    user_profiles
+)
+from db import get_key_pool
+from generate_interpretations_parallel import delete_empty_records, get_existing_keys, upsert_interpretations
+from key_pool import print_pool_summary
+from profiling import stage
+from runs import finish_run, new_run_seed, register_run
+from validator import load_validator
 
 # Config
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 MODEL = "gpt-5.1"
-
-BASE_DIR = Path(__file__).parent.parent
-
-# Load data
-with open(BASE_DIR / "data/instruments_extended.json") as f:
-    INSTRUMENTS = json.load(f)
-
-with open(BASE_DIR / "data/user_profiles_v2.json") as f:
-    USER_PROFILES = json.load(f)
-
-with open(BASE_DIR / "data/questionnaire_items.json") as f:
-    QUESTIONNAIRE_ITEMS = json.load(f)
-
-# V3 prompt variants - focused on comparing data richness
-# Plus Kasia's clinical variants (instrument-specific)
-PROMPT_VARIANTS = [
-    {"id": "minimal", "template": "variant_minimal.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "profile", "template": "variant_profile.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "answers", "template": "variant_answers.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "kasia_phq9", "template": "variant_kasia_phq9.jinja2", "instruments": ["PHQ-9"]},
-    {"id": "kasia_gad7", "template": "variant_kasia_gad7.jinja2", "instruments": ["GAD-7"]},
-]
-
-# Test cases: 2 score levels per instrument (moderate and severe)
-TEST_SCORES = {
-    "PHQ-9": [
-        {"score": 12, "level": "moderate", "label": "Umiarkowane objawy depresji"},
-        {"score": 20, "level": "severe", "label": "Ciężkie objawy depresji"},
-    ],
-    "GAD-7": [
-        {"score": 10, "level": "moderate", "label": "Umiarkowany lęk"},
-        {"score": 17, "level": "severe", "label": "Ciężki lęk"},
-    ],
-}
-
-# Load all templates
-TEMPLATES = {}
-for variant in PROMPT_VARIANTS:
-    template_path = BASE_DIR / "prompts" / variant["template"]
-    with open(template_path) as f:
-        TEMPLATES[variant["id"]] = Template(f.read())
-
-# Initialize clients lazily (only when needed)
-openai_client = None
-supabase_client = None
-
-
-def get_openai_client():
-    """Lazy initialization of OpenAI client."""
-    global openai_client
-    if openai_client is None:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    return openai_client
-
-
-def get_supabase_client():
-    """Lazy initialization of Supabase client."""
-    global supabase_client
-    if supabase_client is None:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    return supabase_client
-
-
-def simulate_answers(instrument_code: str, target_score: int) -> list[dict]:
-    """
-    Generate simulated answers for a questionnaire that sum to target_score.
-    Returns list of answer dicts with question text, response value and label.
-    """
-    items = QUESTIONNAIRE_ITEMS[instrument_code]["items"]
-    response_options = QUESTIONNAIRE_ITEMS[instrument_code]["response_options"]
-    num_items = len(items)
-
-    # Distribute target_score across items
-    # Strategy: start with even distribution, then adjust randomly
-    base_value = target_score // num_items
-    remainder = target_score % num_items
-
-    # Initialize with base values
-    values = [min(base_value, 3) for _ in range(num_items)]
-    current_sum = sum(values)
-
-    # Add remainder to random items
-    indices = list(range(num_items))
-    random.shuffle(indices)
-
-    for i in indices:
-        if current_sum >= target_score:
-            break
-        max_add = min(3 - values[i], target_score - current_sum)
-        if max_add > 0:
-            add = random.randint(1, max_add)
-            values[i] += add
-            current_sum += add
-
-    # If we overshot, reduce some values
-    while current_sum > target_score:
-        for i in indices:
-            if values[i] > 0 and current_sum > target_score:
-                reduce = min(values[i], current_sum - target_score)
-                values[i] -= reduce
-                current_sum -= reduce
-
-    # Build answer list
-    answers = []
-    for i, item in enumerate(items):
-        response_value = values[i]
-        response_label = response_options[response_value]["label"]
-        answers.append({
-            "number": item["number"],
-            "question": item["text_pl"],
-            "response_value": response_value,
-            "response_label": response_label,
-        })
-
-    return answers
+MAX_ATTEMPTS = 3  # Generations per cell before giving up on invalid output
 
 
 def generate_interpretation(
@@ -143,154 +35,126 @@ def generate_interpretation(
     level: str,
     level_label: str,
     variant_id: str,
-    profile: dict
-) -> str:
-    """Generate a single interpretation using GPT."""
-    instrument = INSTRUMENTS[instrument_code]
-    template = TEMPLATES[variant_id]
-
-    # Base context for all variants
-    context = {
-        "instrument": instrument_code,
-        "score": score,
-        "max_score": instrument["scoring"]["max_score"],
-        "level_label": level_label,
-        "user_name": profile["name"],
-        "user_age": profile["age"],
-        "user_gender": profile["gender"],
-    }
-
-    # Add work_type for Kasia variants (they use basic user data + work context)
-    if variant_id in ["kasia_phq9", "kasia_gad7"]:
-        context.update({
-            "work_type": profile["work_type"],
-        })
-
-    # Add full profile data for 'profile' and 'answers' variants
-    if variant_id in ["profile", "answers"]:
-        context.update({
-            "work_type": profile["work_type"],
-            "is_leader": profile["is_leader"],
-            "subtopics": profile["subtopics"],
-        })
-
-    # Add simulated answers for 'answers' variant
-    if variant_id == "answers":
-        answers = simulate_answers(instrument_code, score)
-        context["answers"] = answers
-
-    prompt = template.render(**context)
-
-    response = get_openai_client().chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        max_completion_tokens=16000,  # High limit needed for reasoning models (reasoning_tokens + output)
-        temperature=0.7
-    )
+    profile: dict,
+    seed: int = None
+) -> tuple[str, str, str, str]:
+    """Generate a single interpretation using GPT. Returns (text, finish_reason, prompt, key alias)."""
+    with stage("render"):
+        prompt = build_prompt(instrument_code, score, level_label, variant_id, profile, seed=seed)
 
-    return response.choices[0].message.content
+    with stage("api"):
+        response, alias = get_key_pool().chat_sync(
+            MODEL, prompt,
+            max_completion_tokens=16000,  # High limit needed for reasoning models (reasoning_tokens + output)
+            temperature=0.7
+        )
 
+    return response.choices[0].message.content, response.choices[0].finish_reason, prompt, alias
 
-def check_existing(instrument_code: str, score: int, variant_id: str, profile_id: int) -> bool:
-    """Check if interpretation already exists with non-empty text. Delete empty ones."""
-    result = get_supabase_client().table("interpretations").select("id, interpretation_text").eq(
-        "instrument_code", instrument_code
-    ).eq("score", score).eq("prompt_variant", variant_id).eq(
-        "user_profile_id", profile_id
-    ).execute()
 
-    has_valid = False
-    empty_ids = []
-
-    for r in result.data:
-        text = r.get("interpretation_text")
-        if text and text.strip():
-            has_valid = True
-        else:
-            empty_ids.append(r["id"])
-
-    # Delete any empty records to avoid duplicates
-    if empty_ids:
-        get_supabase_client().table("interpretations").delete().in_("id", empty_ids).execute()
-
-    return has_valid
-
-
-def main(dry_run: bool = False, limit: int = None, skip_existing: bool = True):
+def main(dry_run: bool = False, limit: int = None, skip_existing: bool = True, seed: int = None):
     """Generate all interpretations for V3 experiment."""
+    profiles = user_profiles()
+    validator = load_validator()
+    seed = new_run_seed() if seed is None else seed
+    run_id = None if dry_run else register_run(seed, MODEL, "generate_interpretations", {"limit": limit})
     generated = 0
     skipped = 0
     errors = 0
 
+    # Existing cells in two requests up front, instead of a select (and delete) before every cell
+    existing = set()
+    if skip_existing:
+        delete_empty_records()
+        existing = get_existing_keys()
+
     # Calculate total (accounting for instrument-specific variants)
     # PHQ-9: 4 variants (minimal, profile, answers, kasia_phq9) × 4 profiles × 2 scores = 32
     # GAD-7: 4 variants (minimal, profile, answers, kasia_gad7) × 4 profiles × 2 scores = 32
     # Total: 64 interpretations
     total = 0
-    for instrument_code in TEST_SCORES.keys():
+    for instrument_code in test_scores().keys():
         variants_for_instrument = [v for v in PROMPT_VARIANTS if instrument_code in v["instruments"]]
-        total += len(variants_for_instrument) * len(USER_PROFILES) * 2  # 2 score levels
+        total += len(variants_for_instrument) * len(profiles) * 2  # 2 score levels
 
     print(f"Generating {total} interpretations...")
-    print(f"Instruments: {list(TEST_SCORES.keys())}")
+    print(f"Instruments: {list(test_scores().keys())}")
     print(f"Variants: {[v['id'] for v in PROMPT_VARIANTS]}")
-    print(f"Profiles: {len(USER_PROFILES)}")
+    print(f"Profiles: {len(profiles)}")
     print(f"Scores per instrument: 2 (moderate, severe)")
+    print(f"Run: {run_id or '(dry run)'}, seed: {seed}")
 
     if dry_run:
         print("(DRY RUN - only generating 3 samples)")
         limit = 3
 
-    for instrument_code, scores in TEST_SCORES.items():
+    for instrument_code, scores in test_scores().items():
         for score_info in scores:
             for variant in PROMPT_VARIANTS:
                 # Skip if variant doesn't support this instrument
                 if instrument_code not in variant["instruments"]:
                     continue
 
-                for profile in USER_PROFILES:
+                for profile in profiles:
                     if limit and generated >= limit:
                         print(f"\n✅ Generated {generated} interpretations (limit reached)")
                         print(f"   Skipped {skipped} existing")
+                        if run_id:
+                            finish_run(run_id, "partial" if errors else "done", generated, errors)
                         return
 
                     # Check if already exists
-                    if skip_existing and check_existing(
-                        instrument_code, score_info["score"],
-                        variant["id"], profile["id"]
-                    ):
+                    if (instrument_code, score_info["score"], variant["id"], profile["id"]) in existing:
                         skipped += 1
                         continue
 
+                    seed_for_cell = cell_seed(seed, instrument_code, score_info["score"], variant["id"], profile["id"])
                     try:
-                        interpretation = generate_interpretation(
-                            instrument_code=instrument_code,
-                            score=score_info["score"],
-                            level=score_info["level"],
-                            level_label=score_info["label"],
-                            variant_id=variant["id"],
-                            profile=profile
-                        )
-
-                        # Validate interpretation is not empty
-                        if not interpretation or not interpretation.strip():
-                            print(f"WARNING: Empty response for {instrument_code}/{variant['id']}/profile={profile['id']}/score={score_info['score']}")
+                        # Regenerate until the output passes validation or the retry budget is spent
+                        for attempt in range(1, MAX_ATTEMPTS + 1):
+                            interpretation, finish_reason, prompt, alias = generate_interpretation(
+                                instrument_code=instrument_code,
+                                score=score_info["score"],
+                                level=score_info["level"],
+                                level_label=score_info["label"],
+                                variant_id=variant["id"],
+                                profile=profile,
+                                seed=seed_for_cell
+                            )
+                            with stage("validate"):
+                                problems = validator.validate(
+                                    interpretation, instrument_code, score_info["score"], profile,
+                                    finish_reason=finish_reason
+                                )
+                            if not problems:
+                                break
+                            print(f"WARNING: Invalid response for {instrument_code}/{variant['id']}/profile={profile['id']}/score={score_info['score']} "
+                                  f"(attempt {attempt}/{MAX_ATTEMPTS}): {', '.join(problems)}")
+
+                        if problems:
                             errors += 1
                             continue
 
                         # Build record with V3 profile data
                         record = {
+                            "id": interpretation_id(run_id, instrument_code, score_info["score"], variant["id"], profile["id"]),
                             "instrument_code": instrument_code,
                             "score": score_info["score"],
                             "level": score_info["level"],
                             "prompt_variant": variant["id"],
                             "user_profile_id": profile["id"],
                             "interpretation_text": interpretation,
-                            "model": MODEL
+                            "model": MODEL,
+                            "run_id": run_id,
+                            "seed": seed_for_cell,
+                            "prompt_hash": prompt_hash(prompt),
+                            "template_hash": template_hash(variant["id"]),
+                            "data_hash": data_hash(),
+                            "api_key_alias": alias,
                         }
 
                         if not dry_run:
-                            get_supabase_client().table("interpretations").insert(record).execute()
+                            upsert_interpretations([record])
                         else:
                             print(f"\n--- Sample ({variant['id']}) ---")
                             print(f"Profile: {profile['name']}, {profile['age']}y, {profile['work_type']}")
@@ -311,9 +175,14 @@ def main(dry_run: bool = False, limit: int = None, skip_existing: bool = True):
                         print(f"ERROR: {e}")
                         if errors > 10:
                             print("Too many errors, stopping.")
+                            if run_id:
+                                finish_run(run_id, "failed", generated, errors)
                             return
 
+    if run_id:
+        finish_run(run_id, "partial" if errors else "done", generated, errors)
     print(f"\n✅ Done! Generated {generated} interpretations, skipped {skipped}, {errors} errors.")
+    print_pool_summary(get_key_pool())
 
 
 if __name__ == "__main__":
@@ -327,4 +196,10 @@ if __name__ == "__main__":
         if arg.startswith("--limit="):
             limit = int(arg.split("=")[1])
 
-    main(dry_run=dry_run, limit=limit, skip_existing=not no_skip)
+    # Parse run seed
+    seed = None
+    for arg in sys.argv:
+        if arg.startswith("--seed="):
+            seed = int(arg.split("=")[1])
+
+    main(dry_run=dry_run, limit=limit, skip_existing=not no_skip, seed=seed)
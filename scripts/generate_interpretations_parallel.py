@@ -7,234 +7,240 @@ Usage:
     python scripts/generate_interpretations_parallel.py              # Generate all
     python scripts/generate_interpretations_parallel.py --dry-run    # Test mode (3 samples)
     python scripts/generate_interpretations_parallel.py --concurrency=30  # Limit concurrency
+    python scripts/generate_interpretations_parallel.py --max-attempts=5  # Retry budget per cell
+    python scripts/generate_interpretations_parallel.py --workers=4       # Render/validate processes (default: CPU count)
+    python scripts/generate_interpretations_parallel.py --seed=123        # Fixed run seed
+    python scripts/generate_interpretations_parallel.py --resume=<run_id> # Reuse a registered run's seed
+
+Every run is registered in the `runs` table. Simulated answers of each cell are
+drawn from a seed derived from the run seed and the cell key, so a cell's
+prompt is identical whenever it is regenerated with the same run seed.
+
+Rendering and validation run in a process pool; API calls run in the event
+loop. Bounded queues between the stages keep rendering just ahead of the API
+(see run_pipeline).
 """
-import os
-import json
 import asyncio
-import random
+import os
 import time
-from pathlib import Path
-from jinja2 import Template
-from openai import AsyncOpenAI
-from supabase import create_client
+from concurrent.futures import ProcessPoolExecutor
+from experiment import (
+    PROMPT_VARIANTS, build_prompt, cell_seed, data_hash, interpretation_id, prompt_hash, template_hash, test_scores,
+    user_profiles
+)
+from db import fetch_all, get_key_pool, get_supabase, select_active
+from runs import finish_run, get_run, new_run_seed, register_run
+from key_pool import KeyPoolExhausted, print_pool_summary
+from profiling import stage
+from text_store import split_texts, write_texts
+from validator import load_validator
 
 # Config
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 MODEL = "gpt-5.1"
 DEFAULT_CONCURRENCY = 50  # Max concurrent requests
-
-BASE_DIR = Path(__file__).parent.parent
-
-# Load data
-with open(BASE_DIR / "data/instruments_extended.json") as f:
-    INSTRUMENTS = json.load(f)
-
-with open(BASE_DIR / "data/user_profiles_v2.json") as f:
-    USER_PROFILES = json.load(f)
-
-with open(BASE_DIR / "data/questionnaire_items.json") as f:
-    QUESTIONNAIRE_ITEMS = json.load(f)
-
-# Prompt variants
-PROMPT_VARIANTS = [
-    {"id": "minimal", "template": "variant_minimal.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "profile", "template": "variant_profile.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "answers", "template": "variant_answers.jinja2", "instruments": ["PHQ-9", "GAD-7"]},
-    {"id": "kasia_phq9", "template": "variant_kasia_phq9.jinja2", "instruments": ["PHQ-9"]},
-    {"id": "kasia_gad7", "template": "variant_kasia_gad7.jinja2", "instruments": ["GAD-7"]},
-]
-
-TEST_SCORES = {
-    "PHQ-9": [
-        {"score": 12, "level": "moderate", "label": "Umiarkowane objawy depresji"},
-        {"score": 20, "level": "severe", "label": "Ciężkie objawy depresji"},
-    ],
-    "GAD-7": [
-        {"score": 10, "level": "moderate", "label": "Umiarkowany lęk"},
-        {"score": 17, "level": "severe", "label": "Ciężki lęk"},
-    ],
-}
-
-# Load templates
-TEMPLATES = {}
-for variant in PROMPT_VARIANTS:
-    template_path = BASE_DIR / "prompts" / variant["template"]
-    with open(template_path) as f:
-        TEMPLATES[variant["id"]] = Template(f.read())
-
-# Clients
-openai_client = None
-supabase_client = None
-
-
-def get_supabase():
-    global supabase_client
-    if supabase_client is None:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    return supabase_client
-
-
-def get_openai():
-    global openai_client
-    if openai_client is None:
-        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    return openai_client
-
-
-def simulate_answers(instrument_code: str, target_score: int) -> list[dict]:
-    """Generate simulated answers for a questionnaire that sum to target_score."""
-    items = QUESTIONNAIRE_ITEMS[instrument_code]["items"]
-    response_options = QUESTIONNAIRE_ITEMS[instrument_code]["response_options"]
-    num_items = len(items)
-
-    base_value = target_score // num_items
-    values = [min(base_value, 3) for _ in range(num_items)]
-    current_sum = sum(values)
-
-    indices = list(range(num_items))
-    random.shuffle(indices)
-
-    for i in indices:
-        if current_sum >= target_score:
-            break
-        max_add = min(3 - values[i], target_score - current_sum)
-        if max_add > 0:
-            add = random.randint(1, max_add)
-            values[i] += add
-            current_sum += add
-
-    while current_sum > target_score:
-        for i in indices:
-            if values[i] > 0 and current_sum > target_score:
-                reduce = min(values[i], current_sum - target_score)
-                values[i] -= reduce
-                current_sum -= reduce
-
-    answers = []
-    for i, item in enumerate(items):
-        response_value = values[i]
-        response_label = response_options[response_value]["label"]
-        answers.append({
-            "number": item["number"],
-            "question": item["text_pl"],
-            "response_value": response_value,
-            "response_label": response_label,
-        })
-
-    return answers
-
-
-def build_prompt(instrument_code: str, score: int, level_label: str, variant_id: str, profile: dict) -> str:
-    """Build prompt from template."""
-    instrument = INSTRUMENTS[instrument_code]
-    template = TEMPLATES[variant_id]
-
-    context = {
-        "instrument": instrument_code,
-        "score": score,
-        "max_score": instrument["scoring"]["max_score"],
-        "level_label": level_label,
-        "user_name": profile["name"],
-        "user_age": profile["age"],
-        "user_gender": profile["gender"],
+QUEUE_FACTOR = 2  # Prompts rendered ahead of the API (and completions awaiting validation) per request slot
+DEFAULT_MAX_ATTEMPTS = 3  # Generations per cell before giving up on invalid output
+WRITE_MAX_ATTEMPTS = 3  # Upserts are idempotent, so failed writes are simply repeated
+WRITE_BACKOFF_SECONDS = 1.0
+
+
+def render_prompt(task: dict) -> dict:
+    """CPU stage: render one cell's prompt (runs in the process pool)."""
+    score_info = task["score_info"]
+    prompt = build_prompt(
+        instrument_code=task["instrument_code"],
+        score=score_info["score"],
+        level_label=score_info["label"],
+        variant_id=task["variant"]["id"],
+        profile=task["profile"],
+        seed=task["seed"]
+    )
+    return {"prompt": prompt, "prompt_hash": prompt_hash(prompt)}
+
+
+def validate_completion(task: dict, text: str, finish_reason: str) -> list[str]:
+    """CPU stage: validate one completion (runs in the process pool)."""
+    return load_validator().validate(
+        text, task["instrument_code"], task["score_info"]["score"], task["profile"], finish_reason=finish_reason
+    )
+
+
+def build_record(task: dict, rendered: dict, text: str, api_key_alias: str = None) -> dict:
+    variant = task["variant"]
+    return {
+        "id": interpretation_id(
+            task["run_id"], task["instrument_code"], task["score_info"]["score"], variant["id"], task["profile"]["id"]
+        ),
+        "instrument_code": task["instrument_code"],
+        "score": task["score_info"]["score"],
+        "level": task["score_info"]["level"],
+        "prompt_variant": variant["id"],
+        "user_profile_id": task["profile"]["id"],
+        "interpretation_text": text,
+        "model": MODEL,
+        "run_id": task["run_id"],
+        "seed": task["seed"],
+        "prompt_hash": rendered["prompt_hash"],
+        "template_hash": template_hash(variant["id"]),
+        "data_hash": data_hash(),
+        "api_key_alias": api_key_alias,
     }
 
-    if variant_id in ["kasia_phq9", "kasia_gad7"]:
-        context["work_type"] = profile["work_type"]
 
-    if variant_id in ["profile", "answers"]:
-        context.update({
-            "work_type": profile["work_type"],
-            "is_leader": profile["is_leader"],
-            "subtopics": profile["subtopics"],
-        })
-
-    if variant_id == "answers":
-        context["answers"] = simulate_answers(instrument_code, score)
-
-    return template.render(**context)
-
-
-async def generate_single(
-    semaphore: asyncio.Semaphore,
-    task_info: dict,
-    progress: dict
-) -> dict:
-    """Generate a single interpretation with rate limiting."""
-    async with semaphore:
-        instrument_code = task_info["instrument_code"]
-        score_info = task_info["score_info"]
-        variant = task_info["variant"]
-        profile = task_info["profile"]
-
-        prompt = build_prompt(
-            instrument_code=instrument_code,
-            score=score_info["score"],
-            level_label=score_info["label"],
-            variant_id=variant["id"],
-            profile=profile
-        )
-
-        try:
-            response = await get_openai().chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                max_completion_tokens=16000,
-                temperature=0.7
-            )
-
-            interpretation = response.choices[0].message.content
-
-            if not interpretation or not interpretation.strip():
+def describe(task: dict) -> str:
+    return f"{task['instrument_code']}/{task['variant']['id']}/profile={task['profile']['id']}"
+
+
+async def run_pipeline(tasks: list[dict], concurrency: int, workers: int, max_attempts: int,
+                       progress: dict) -> tuple[list[dict], list[dict]]:
+    """
+    Staged pipeline over all cells, returning (records, failed cells):
+      render (process pool) -> prompts queue -> API calls (`concurrency` coroutines)
+      -> completions queue -> validation (process pool)
+    Both queues are bounded, so rendering runs at most QUEUE_FACTOR * concurrency
+    prompts ahead of the API, and the event loop only ever awaits: CPU work never
+    delays sending requests or reading responses. Invalid or failed completions
+    go back to the prompts queue (the prompt is reused, it is deterministic) until
+    max_attempts is spent.
+    """
+    # Import by module name so the pool pickles the stage functions by an importable
+    # reference even when this file runs as __main__ (directly or via pv.py)
+    from generate_interpretations_parallel import render_prompt, validate_completion
+
+    loop = asyncio.get_running_loop()
+    prompts = asyncio.Queue(maxsize=QUEUE_FACTOR * concurrency)
+    completions = asyncio.Queue(maxsize=QUEUE_FACTOR * concurrency)
+    cells = iter(tasks)  # Shared by the render coroutines
+    successful, failed = [], []
+    requeued = set()  # Keeps pending re-queue puts alive
+    remaining = len(tasks)
+    finished = asyncio.Event()
+
+    def settle(task: dict, record: dict = None):
+        nonlocal remaining
+        if record:
+            successful.append(record)
+        else:
+            failed.append(task)
+        remaining -= 1
+        if remaining == 0:
+            finished.set()
+
+    def retry(task: dict, rendered: dict, attempt: int):
+        if attempt >= max_attempts:
+            settle(task)
+            return
+        print(f"Re-queueing {describe(task)} (attempt {attempt + 1}/{max_attempts})")
+        # Not awaited: the validation stage must not block on the queue that feeds the stage before it
+        put = asyncio.create_task(prompts.put((task, rendered, attempt + 1)))
+        requeued.add(put)
+        put.add_done_callback(requeued.discard)
+
+    async def render_stage(pool):
+        for task in cells:
+            try:
+                with stage("render"):
+                    rendered = await loop.run_in_executor(pool, render_prompt, task)
+            except Exception as e:
                 progress["errors"] += 1
-                return {"success": False, "error": "Empty response", **task_info}
-
+                print(f"ERROR: {describe(task)}: {e}")
+                settle(task)
+                continue
+            await prompts.put((task, rendered, 1))  # Waits while the API stage is saturated
+
+    async def network_stage():
+        while True:
+            task, rendered, attempt = await prompts.get()
+            try:
+                with stage("api"):
+                    response, alias = await get_key_pool().chat(
+                        MODEL, rendered["prompt"], max_completion_tokens=16000, temperature=0.7
+                    )
+            except KeyPoolExhausted as e:
+                # No retry can succeed; the remaining cells fail fast and the run ends as partial
+                print(f"ERROR: {describe(task)}: {e}")
+                settle(task)
+                continue
+            except Exception as e:
+                progress["errors"] += 1
+                print(f"ERROR: {describe(task)}: {e}")
+                retry(task, rendered, attempt)
+                continue
+            choice = response.choices[0]
+            await completions.put((task, rendered, attempt, choice.message.content, choice.finish_reason, alias))
+
+    async def validate_stage(pool):
+        while True:
+            task, rendered, attempt, text, finish_reason, alias = await completions.get()
+            with stage("validate"):
+                problems = await loop.run_in_executor(pool, validate_completion, task, text, finish_reason)
+            if problems:
+                progress["errors"] += 1
+                print(f"INVALID: {describe(task)}: {', '.join(problems)}")
+                retry(task, rendered, attempt)
+                continue
             progress["completed"] += 1
-            print(f"[{progress['completed']}/{progress['total']}] {instrument_code} | {variant['id']} | score={score_info['score']} | profile={profile['id']}")
-
-            return {
-                "success": True,
-                "record": {
-                    "instrument_code": instrument_code,
-                    "score": score_info["score"],
-                    "level": score_info["level"],
-                    "prompt_variant": variant["id"],
-                    "user_profile_id": profile["id"],
-                    "interpretation_text": interpretation,
-                    "model": MODEL
-                }
-            }
-
-        except Exception as e:
-            progress["errors"] += 1
-            print(f"ERROR: {instrument_code}/{variant['id']}/profile={profile['id']}: {e}")
-            return {"success": False, "error": str(e), **task_info}
+            print(f"[{progress['completed']}/{progress['total']}] {task['instrument_code']} | {task['variant']['id']} | "
+                  f"score={task['score_info']['score']} | profile={task['profile']['id']}")
+            settle(task, build_record(task, rendered, text, alias))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        renderers = [asyncio.create_task(render_stage(pool)) for _ in range(workers)]
+        stages = [asyncio.create_task(network_stage()) for _ in range(concurrency)]
+        stages += [asyncio.create_task(validate_stage(pool)) for _ in range(workers)]
+        waiter = asyncio.create_task(finished.wait())
+
+        # Stages only return by raising, so this also surfaces a crashed stage instead of hanging
+        await asyncio.wait([waiter, *stages], return_when=asyncio.FIRST_COMPLETED)
+        for t in [waiter, *renderers, *stages, *requeued]:
+            t.cancel()
+        await asyncio.gather(*renderers, *stages, return_exceptions=True)
+        for t in stages:
+            if t.done() and not t.cancelled() and t.exception():
+                raise t.exception()
+
+    return successful, failed
 
 
 def get_existing_keys() -> set:
     """Get set of existing (instrument, score, variant, profile) tuples with non-empty text."""
-    result = get_supabase().table("interpretations").select(
-        "instrument_code, score, prompt_variant, user_profile_id, interpretation_text"
-    ).execute()
+    rows = fetch_all(lambda: select_active("interpretations",
+        "id, instrument_code, score, prompt_variant, user_profile_id, text_length"
+    ).order("id"))
 
     existing = set()
-    empty_ids_to_delete = []
-
-    for r in result.data:
+    for r in rows:
         key = (r["instrument_code"], r["score"], r["prompt_variant"], r["user_profile_id"])
-        text = r.get("interpretation_text")
-        if text and text.strip():
+        if r.get("text_length"):
             existing.add(key)
 
     return existing
 
 
+def upsert_interpretations(records: list[dict]) -> list[dict]:
+    """
+    Write records in one request, retrying on errors. Their ids are derived from
+    run and cell (experiment.interpretation_id), so a write that landed but whose
+    response was lost is overwritten by the retry instead of duplicated.
+    Returns the written rows.
+    """
+    with stage("write"):
+        records, texts = split_texts(get_supabase(), records)
+        for attempt in range(1, WRITE_MAX_ATTEMPTS + 1):
+            try:
+                write_texts(get_supabase(), texts)  # Before the rows that point to them
+                return get_supabase().table("interpretations").upsert(records, on_conflict="id").execute().data
+            except Exception as e:
+                if attempt == WRITE_MAX_ATTEMPTS:
+                    raise
+                print(f"Write failed (attempt {attempt}/{WRITE_MAX_ATTEMPTS}): {e}")
+                time.sleep(WRITE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+
 def delete_empty_records():
     """Delete any records with empty interpretation_text."""
-    result = get_supabase().table("interpretations").select("id, interpretation_text").execute()
-    empty_ids = [r["id"] for r in result.data if not r.get("interpretation_text") or not r["interpretation_text"].strip()]
+    rows = fetch_all(lambda: select_active("interpretations", "id, text_length").order("id"))
+    empty_ids = [r["id"] for r in rows if not r.get("text_length")]
 
     if empty_ids:
         for i in range(0, len(empty_ids), 10):
@@ -242,10 +248,17 @@ def delete_empty_records():
         print(f"Deleted {len(empty_ids)} empty records")
 
 
-async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY, limit: int = None):
+async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY, limit: int = None,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS, seed: int = None, resume: str = None,
+               workers: int = None):
     """Generate all interpretations in parallel."""
     start_time = time.time()
 
+    if resume:
+        seed = get_run(resume)["seed"]
+    elif seed is None:
+        seed = new_run_seed()
+
     # Clean up empty records first
     delete_empty_records()
 
@@ -256,12 +269,12 @@ async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY, li
     # Build task list
     tasks_to_run = []
 
-    for instrument_code, scores in TEST_SCORES.items():
+    for instrument_code, scores in test_scores().items():
         for score_info in scores:
             for variant in PROMPT_VARIANTS:
                 if instrument_code not in variant["instruments"]:
                     continue
-                for profile in USER_PROFILES:
+                for profile in user_profiles():
                     key = (instrument_code, score_info["score"], variant["id"], profile["id"])
                     if key in existing:
                         continue
@@ -269,7 +282,8 @@ async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY, li
                         "instrument_code": instrument_code,
                         "score_info": score_info,
                         "variant": variant,
-                        "profile": profile
+                        "profile": profile,
+                        "seed": cell_seed(seed, instrument_code, score_info["score"], variant["id"], profile["id"]),
                     })
 
     total = len(tasks_to_run)
@@ -288,38 +302,52 @@ async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY, li
         tasks_to_run = tasks_to_run[:limit]
         total = len(tasks_to_run)
 
-    print(f"Using concurrency: {concurrency}")
+    # Dry runs write nothing, so they are not registered
+    run_id = None
+    if not dry_run:
+        run_id = resume or register_run(seed, MODEL, "generate_interpretations_parallel", {
+            "concurrency": concurrency, "limit": limit, "max_attempts": max_attempts,
+        })
+    for task in tasks_to_run:
+        task["run_id"] = run_id
+
+    print(f"Run: {run_id or '(dry run)'}, seed: {seed}")
+    workers = workers or os.cpu_count()
+    print(f"Using concurrency: {concurrency}, CPU workers: {workers}")
     print(f"Starting parallel generation...")
     print("-" * 50)
 
     # Progress tracking
     progress = {"completed": 0, "errors": 0, "total": total}
 
-    # Create semaphore for rate limiting
-    semaphore = asyncio.Semaphore(concurrency)
-
-    # Run all tasks concurrently
-    results = await asyncio.gather(*[
-        generate_single(semaphore, task, progress)
-        for task in tasks_to_run
-    ])
-
-    # Insert successful results
-    successful = [r["record"] for r in results if r.get("success")]
+    successful, pending = await run_pipeline(tasks_to_run, concurrency, workers, max_attempts, progress)
 
     if successful and not dry_run:
-        # Insert in batches of 20
-        for i in range(0, len(successful), 20):
-            batch = successful[i:i+20]
-            get_supabase().table("interpretations").insert(batch).execute()
+        from db import active_experiment_id
+        from dedup import MinHashLSH, index_path, update_index
+
+        # One idempotent upsert for the whole run, then the new rows go to the near-duplicate index
+        # (indexed from the records: ids are client-side and stored rows may hold no inline text)
+        upsert_interpretations(successful)
+        path = index_path(active_experiment_id())
+        index = MinHashLSH.load(path)
+        for new_id in update_index(index, successful):
+            for other_id, sim in index.near_duplicates(new_id):
+                print(f"NEAR-DUPLICATE: {new_id} ~ {other_id} ({sim:.2f})")
+        index.save(path)
         print(f"Inserted {len(successful)} records to database")
 
+    if run_id:
+        finish_run(run_id, "partial" if pending else "done", len(successful), len(pending))
+
     elapsed = time.time() - start_time
     print("-" * 50)
     print(f"✅ Done in {elapsed:.1f}s!")
     print(f"   Generated: {progress['completed']}")
     print(f"   Errors: {progress['errors']}")
+    print(f"   Failed cells: {len(pending)}")
     print(f"   Speed: {progress['completed']/elapsed:.1f} interpretations/second")
+    print_pool_summary(get_key_pool())
 
 
 if __name__ == "__main__":
@@ -339,4 +367,26 @@ if __name__ == "__main__":
         if arg.startswith("--limit="):
             limit = int(arg.split("=")[1])
 
-    asyncio.run(main(dry_run=dry_run, concurrency=concurrency, limit=limit))
+    # Parse retry budget
+    max_attempts = DEFAULT_MAX_ATTEMPTS
+    for arg in sys.argv:
+        if arg.startswith("--max-attempts="):
+            max_attempts = int(arg.split("=")[1])
+
+    # Parse CPU stage size
+    workers = None
+    for arg in sys.argv:
+        if arg.startswith("--workers="):
+            workers = int(arg.split("=")[1])
+
+    # Parse run seed
+    seed = None
+    resume = None
+    for arg in sys.argv:
+        if arg.startswith("--seed="):
+            seed = int(arg.split("=")[1])
+        elif arg.startswith("--resume="):
+            resume = arg.split("=")[1]
+
+    asyncio.run(main(dry_run=dry_run, concurrency=concurrency, limit=limit, max_attempts=max_attempts,
+                     seed=seed, resume=resume, workers=workers))
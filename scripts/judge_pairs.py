@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Automated LLM-as-judge pre-screening of interpretation pairs.
+Judges every pair the evaluation app could show (same instrument/score/profile),
+in both orderings to cancel position bias, and stores verdicts in the
+`judge_verdicts` table tagged with the judge model. Pairs where the two
+orderings disagree are "ambiguous" and left for human evaluators: the
+evaluation app shows pairs judged the same way in both orderings only when no
+unjudged or ambiguous pair is left.
+
+Usage:
+    python scripts/judge_pairs.py                    # Judge all pairs not yet judged
+    python scripts/judge_pairs.py --dry-run          # Judge 3 pairs, do not save
+    python scripts/judge_pairs.py --concurrency=30   # Limit concurrency
+    python scripts/judge_pairs.py --limit=100        # Judge at most 100 pairs not yet judged
+    python scripts/judge_pairs.py --judge-model=gpt-5.1
+    python scripts/judge_pairs.py --report           # Only print agreement with human labels
+"""
+import re
+import json
+import asyncio
+import time
+from collections import defaultdict
+from experiment import instruments, load_template, user_profiles
+from db import fetch_all, get_async_openai as get_openai, get_supabase, select_active
+from generate_interpretations_parallel import DEFAULT_CONCURRENCY
+from profiling import stage
+from text_store import get_text_loader
+
+JUDGE_MODEL = "gpt-5.1"
+JUDGE_TEMPLATE = "judge_pairwise.jinja2"
+
+
+def level_label(instrument_code: str, level: str) -> str:
+    """Polish label of a scoring level, e.g. 'moderate' -> 'Umiarkowany lęk'."""
+    for r in instruments()[instrument_code]["scoring"]["ranges"]:
+        if r["level"] == level:
+            return r["label"]
+    return level
+
+
+def fetch_candidate_pairs() -> list[tuple[dict, dict]]:
+    """All pairs get_random_pair could return: two non-empty interpretations of the same instrument/score/profile."""
+    rows = fetch_all(lambda: select_active("interpretations",
+        "id, instrument_code, score, level, user_profile_id, prompt_variant, text_storage"
+    ).in_("instrument_code", ["PHQ-9", "GAD-7"]).gt("text_length", 0).order("id"))
+
+    groups = defaultdict(list)
+    for r in rows:
+        groups[(r["instrument_code"], r["score"], r["user_profile_id"])].append(r)
+
+    pairs = []
+    for rows in groups.values():
+        rows.sort(key=lambda r: r["id"])
+        pairs.extend((a, b) for i, a in enumerate(rows) for b in rows[i + 1:])
+    return pairs
+
+
+def fetch_verdicts(judge_model: str) -> list[dict]:
+    return fetch_all(lambda: select_active("judge_verdicts",
+        "id, interpretation_a, interpretation_b, winner_id"
+    ).eq("judge_model", judge_model).order("id"))
+
+
+def build_judge_prompt(shown_a: dict, shown_b: dict) -> str:
+    instrument_code = shown_a["instrument_code"]
+    profile = next(p for p in user_profiles() if p["id"] == shown_a["user_profile_id"])
+    return load_template(JUDGE_TEMPLATE).render(
+        instrument=instrument_code,
+        score=shown_a["score"],
+        max_score=instruments()[instrument_code]["scoring"]["max_score"],
+        level_label=level_label(instrument_code, shown_a["level"]),
+        user_name=profile["name"],
+        user_age=profile["age"],
+        user_gender=profile["gender"],
+        work_type=profile["work_type"],
+        is_leader=profile["is_leader"],
+        interpretation_a=shown_a["interpretation_text"],
+        interpretation_b=shown_b["interpretation_text"],
+    )
+
+
+def parse_verdict(content: str) -> tuple[str, str]:
+    """Return ('A' | 'B' | 'tie', reason) from the judge response."""
+    try:
+        data = json.loads(content)
+        winner, reason = str(data.get("winner", "")).strip(), data.get("reason", "")
+    except (json.JSONDecodeError, AttributeError):
+        match = re.search(r'"?winner"?\s*:\s*"?(A|B|tie)', content, re.IGNORECASE)
+        winner, reason = (match.group(1) if match else ""), content
+    winner = {"a": "A", "b": "B", "tie": "tie", "remis": "tie"}.get(winner.lower())
+    if winner is None:
+        raise ValueError(f"Unparseable verdict: {content[:100]}")
+    return winner, reason
+
+
+async def judge_single(
+    semaphore: asyncio.Semaphore,
+    shown_a: dict,
+    shown_b: dict,
+    judge_model: str,
+    progress: dict
+) -> dict:
+    """Judge one ordered pair with rate limiting."""
+    async with semaphore:
+        try:
+            with stage("api"):
+                response = await get_openai().chat.completions.create(
+                    model=judge_model,
+                    messages=[{"role": "user", "content": build_judge_prompt(shown_a, shown_b)}],
+                    response_format={"type": "json_object"},
+                    max_completion_tokens=4000,
+                    temperature=0
+                )
+            winner, reason = parse_verdict(response.choices[0].message.content or "")
+
+            progress["completed"] += 1
+            print(f"[{progress['completed']}/{progress['total']}] {shown_a['prompt_variant']} vs {shown_b['prompt_variant']} → {winner}")
+
+            return {
+                "success": True,
+                "record": {
+                    "interpretation_a": shown_a["id"],
+                    "interpretation_b": shown_b["id"],
+                    "winner_id": {"A": shown_a["id"], "B": shown_b["id"]}.get(winner),
+                    "judge_model": judge_model,
+                    "reason": reason,
+                }
+            }
+
+        except Exception as e:
+            progress["errors"] += 1
+            print(f"ERROR: {shown_a['id']} vs {shown_b['id']}: {e}")
+            return {"success": False, "error": str(e)}
+
+
+def combine_verdicts(verdicts: list[dict]) -> dict:
+    """
+    Merge both orderings of each pair.
+    Returns {frozenset(ids): winner id | "tie" | "ambiguous"}; pairs judged in one order only are skipped.
+    """
+    by_pair = defaultdict(list)
+    for v in verdicts:
+        by_pair[frozenset((v["interpretation_a"], v["interpretation_b"]))].append(v["winner_id"] or "tie")
+
+    combined = {}
+    for key, outcomes in by_pair.items():
+        if len(outcomes) < 2:
+            continue
+        combined[key] = outcomes[0] if len(set(outcomes)) == 1 else "ambiguous"
+    return combined
+
+
+def cohen_kappa(pairs: list[tuple[str, str]]) -> float:
+    """Cohen's kappa for two raters over categorical labels."""
+    n = len(pairs)
+    if n == 0:
+        return 0.0
+    observed = sum(a == b for a, b in pairs) / n
+    counts_a = defaultdict(int)
+    counts_b = defaultdict(int)
+    for a, b in pairs:
+        counts_a[a] += 1
+        counts_b[b] += 1
+    expected = sum(counts_a[c] * counts_b[c] for c in counts_a) / n ** 2
+    return (observed - expected) / (1 - expected) if expected < 1 else 1.0
+
+
+def print_agreement_report(judge_model: str):
+    """Compare judge verdicts with human evaluations on the same pairs."""
+    combined = combine_verdicts(fetch_verdicts(judge_model))
+    evaluations = fetch_all(lambda: select_active("evaluations", "id, interpretation_id, preferred_over").order("id"))
+
+    # Human ties do not record the other interpretation, so only decisive votes can be matched
+    labels = []
+    for e in evaluations:
+        if not e.get("preferred_over"):
+            continue
+        key = frozenset((e["interpretation_id"], e["preferred_over"]))
+        verdict = combined.get(key)
+        if verdict is None or verdict == "ambiguous":
+            continue
+        first = min(key)
+        human = "first" if e["interpretation_id"] == first else "second"
+        judge = "tie" if verdict == "tie" else ("first" if verdict == first else "second")
+        labels.append((human, judge))
+
+    ambiguous = sum(1 for v in combined.values() if v == "ambiguous")
+    ties = sum(1 for v in combined.values() if v == "tie")
+
+    print("=" * 60)
+    print(f"       SĘDZIA LLM: {judge_model}")
+    print("=" * 60)
+    print(f"Ocenione pary (obie kolejności): {len(combined)}")
+    if combined:
+        print(f"  - spójne: {len(combined) - ambiguous} ({(len(combined) - ambiguous) / len(combined) * 100:.0f}%)")
+    print(f"  - remisy: {ties}")
+    print(f"  - niejednoznaczne (do oceny przez ludzi): {ambiguous}")
+    print()
+
+    if labels:
+        agreement = sum(h == j for h, j in labels) / len(labels) * 100
+        print(f"Zgodność z ocenami ludzi: {agreement:.1f}% na {len(labels)} ocenach")
+        print(f"Kappa Cohena: {cohen_kappa(labels):.2f}")
+    else:
+        print("Brak wspólnych par z ocenami ludzi.")
+    print()
+
+
+async def main(dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY,
+               limit: int = None, judge_model: str = JUDGE_MODEL):
+    """Judge all candidate pairs in both orderings."""
+    start_time = time.time()
+
+    pairs = fetch_candidate_pairs()
+    judged = {(v["interpretation_a"], v["interpretation_b"]) for v in fetch_verdicts(judge_model)}
+    print(f"Found {len(pairs)} candidate pairs, {len(judged)} orderings already judged by {judge_model}")
+
+    # Orderings not yet judged, per pair; limits count pairs with work left
+    pending = []
+    for a, b in pairs:
+        unjudged = [(x, y) for x, y in [(a, b), (b, a)] if (x["id"], y["id"]) not in judged]
+        if unjudged:
+            pending.append(unjudged)
+
+    if dry_run:
+        pending = pending[:3]
+        print(f"(DRY RUN - only judging {len(pending)} pairs)")
+
+    if limit:
+        pending = pending[:limit]
+
+    orderings = [ordering for unjudged in pending for ordering in unjudged]
+
+    total = len(orderings)
+    if total == 0:
+        print("✅ All pairs already judged!")
+        print_agreement_report(judge_model)
+        return
+
+    # Texts of only the interpretations about to be judged (pairs share row dicts)
+    shown = list({r["id"]: r for ordering in orderings for r in ordering}.values())
+    texts = get_text_loader().texts(shown, cache=False)
+    for r in shown:
+        r["interpretation_text"] = texts.get(r["id"], "")
+
+    print(f"Using concurrency: {concurrency}")
+    print(f"Judging {total} orderings...")
+    print("-" * 50)
+
+    progress = {"completed": 0, "errors": 0, "total": total}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    results = await asyncio.gather(*[
+        judge_single(semaphore, shown_a, shown_b, judge_model, progress)
+        for shown_a, shown_b in orderings
+    ])
+
+    successful = [r["record"] for r in results if r.get("success")]
+
+    if successful and not dry_run:
+        # One request; a repeated write of the same ordering (UNIQUE per judge model) is a no-op
+        get_supabase().table("judge_verdicts").upsert(
+            successful, on_conflict="interpretation_a,interpretation_b,judge_model", ignore_duplicates=True
+        ).execute()
+        print(f"Inserted {len(successful)} verdicts to database")
+
+    elapsed = time.time() - start_time
+    print("-" * 50)
+    print(f"✅ Done in {elapsed:.1f}s!")
+    print(f"   Judged: {progress['completed']}")
+    print(f"   Errors: {progress['errors']}")
+    print()
+
+    if not dry_run:
+        print_agreement_report(judge_model)
+
+
+if __name__ == "__main__":
+    import sys
+
+    dry_run = "--dry-run" in sys.argv
+
+    concurrency = DEFAULT_CONCURRENCY
+    limit = None
+    judge_model = JUDGE_MODEL
+    for arg in sys.argv:
+        if arg.startswith("--concurrency="):
+            concurrency = int(arg.split("=")[1])
+        if arg.startswith("--limit="):
+            limit = int(arg.split("=")[1])
+        if arg.startswith("--judge-model="):
+            judge_model = arg.split("=")[1]
+
+    if "--report" in sys.argv:
+        print_agreement_report(judge_model)
+    else:
+        asyncio.run(main(dry_run=dry_run, concurrency=concurrency, limit=limit, judge_model=judge_model))
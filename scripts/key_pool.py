@@ -0,0 +1,243 @@
+"""
+Pool of OpenAI API keys, e.g. from several accounts or organizations, so
+throughput is not capped by one account's rate limits.
+Each request goes to the key with the most RPM/TPM headroom. Headroom is
+tracked client-side as token buckets refilling at the key's per-minute
+limits, and corrected with the actual usage of every response. A key that
+gets a 429 cools down for its Retry-After (or COOLDOWN_SECONDS) and the
+request is retried on the next available key; the 429 is raised only when
+every key is cooling down or capped. The OpenAI clients do not retry on their
+own (max_retries=0), so a throttled key is never retried in place. A key that
+reaches its spend cap (counted in this process from response usage) is taken
+out of the pool (requests already in flight may overshoot the cap). When all
+keys are capped, KeyPoolExhausted is raised.
+
+OPENAI_KEY_POOL points to a JSON file:
+    [
+      {"alias": "org-a", "api_key": "sk-...", "rpm": 500, "tpm": 500000, "max_spend_usd": 50},
+      {"alias": "org-b", "api_key": "sk-...", "organization": "org-...", "rpm": 5000, "tpm": 2000000}
+    ]
+Without it, the pool holds OPENAI_API_KEY alone, under the alias "default".
+Every stored interpretation records the alias of the key that generated it.
+"""
+import asyncio
+import json
+import threading
+import time
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 500_000
+COOLDOWN_SECONDS = 20.0  # After a 429 without Retry-After
+ESTIMATED_COMPLETION_TOKENS = 2000  # Reserved per request until the real usage is known
+CHARS_PER_TOKEN = 4
+
+# USD per 1M tokens: (input, output)
+MODEL_PRICES = {
+    "gpt-5.1": (1.25, 10.0),
+}
+
+
+class KeyPoolExhausted(Exception):
+    """Every key in the pool has reached its spend cap."""
+
+
+def estimate_tokens(prompt: str) -> int:
+    return len(prompt) // CHARS_PER_TOKEN + ESTIMATED_COMPLETION_TOKENS
+
+
+def usage_cost(model: str, usage) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (usage.prompt_tokens * input_price + usage.completion_tokens * output_price) / 1_000_000
+
+
+def is_rate_limit(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class PooledKey:
+    """One API key with its limits, client-side rate budget and spend."""
+
+    def __init__(self, alias: str, api_key: str, organization: str = None, rpm: int = DEFAULT_RPM,
+                 tpm: int = DEFAULT_TPM, max_spend_usd: float = None):
+        self.alias = alias
+        self.api_key = api_key
+        self.organization = organization
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_spend_usd = max_spend_usd
+        # Token buckets: capacity is one minute of the limit, refilled continuously
+        self.requests_left = float(rpm)
+        self.tokens_left = float(tpm)
+        self.refilled_at = time.monotonic()
+        self.cooldown_until = 0.0
+        self.spent_usd = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self._client = None
+        self._async_client = None
+
+    @property
+    def capped(self) -> bool:
+        return self.max_spend_usd is not None and self.spent_usd >= self.max_spend_usd
+
+    def refill(self, now: float):
+        elapsed = now - self.refilled_at
+        self.requests_left = min(self.rpm, self.requests_left + elapsed * self.rpm / 60)
+        self.tokens_left = min(self.tpm, self.tokens_left + elapsed * self.tpm / 60)
+        self.refilled_at = now
+
+    def headroom(self, tokens: int) -> float:
+        """Fraction of the tighter of the two limits left after this request."""
+        return min((self.requests_left - 1) / self.rpm, (self.tokens_left - tokens) / self.tpm)
+
+    def wait_time(self, now: float, tokens: int) -> float:
+        """Seconds until this key can take a request of `tokens`."""
+        return max(
+            self.cooldown_until - now,
+            (1 - self.requests_left) * 60 / self.rpm,
+            (min(tokens, self.tpm) - self.tokens_left) * 60 / self.tpm,
+            0.0,
+        )
+
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self.api_key, organization=self.organization, max_retries=0)
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(api_key=self.api_key, organization=self.organization, max_retries=0)
+        return self._async_client
+
+
+class KeyPool:
+    """Assigns requests to keys; safe to share between threads and coroutines."""
+
+    def __init__(self, keys: list[PooledKey]):
+        if not keys:
+            raise ValueError("Key pool needs at least one key")
+        self.keys = keys
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path: str = None, default_key: str = None) -> "KeyPool":
+        if path:
+            with open(path) as f:
+                return cls([PooledKey(**entry) for entry in json.load(f)])
+        return cls([PooledKey("default", default_key)])
+
+    def _try_acquire(self, tokens: int) -> tuple[PooledKey | None, float]:
+        """Reserve capacity on the key with the most headroom, or say how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            usable = [k for k in self.keys if not k.capped]
+            if not usable:
+                raise KeyPoolExhausted(f"All {len(self.keys)} API keys reached their spend caps")
+            for k in usable:
+                k.refill(now)
+            ready = [k for k in usable if k.wait_time(now, tokens) == 0]
+            if not ready:
+                return None, min(k.wait_time(now, tokens) for k in usable)
+            key = max(ready, key=lambda k: k.headroom(tokens))
+            key.requests_left -= 1
+            key.tokens_left -= tokens
+            key.requests += 1
+            return key, 0.0
+
+    async def acquire(self, prompt: str) -> tuple[PooledKey, int]:
+        """(key, reserved tokens) for one request; waits while every key is at its limits."""
+        tokens = estimate_tokens(prompt)
+        while True:
+            key, wait = self._try_acquire(tokens)
+            if key:
+                return key, tokens
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, prompt: str) -> tuple[PooledKey, int]:
+        tokens = estimate_tokens(prompt)
+        while True:
+            key, wait = self._try_acquire(tokens)
+            if key:
+                return key, tokens
+            time.sleep(wait)
+
+    def completed(self, key: PooledKey, reserved: int, model: str, usage):
+        """Replace the reservation with the actual usage and add the cost to the key's spend."""
+        if usage is None:
+            return
+        with self._lock:
+            key.tokens_left += reserved - usage.total_tokens
+            key.spent_usd += usage_cost(model, usage)
+
+    def failed(self, key: PooledKey, reserved: int, error: Exception):
+        """Return the reserved tokens; cool the key down if it was throttled."""
+        with self._lock:
+            key.tokens_left += reserved
+            if is_rate_limit(error):
+                key.throttled += 1
+                key.cooldown_until = time.monotonic() + (retry_after(error) or COOLDOWN_SECONDS)
+
+    def all_cooling_down(self) -> bool:
+        """Whether every key that is not capped is cooling down after a 429."""
+        with self._lock:
+            now = time.monotonic()
+            return all(k.capped or k.cooldown_until > now for k in self.keys)
+
+    async def chat(self, model: str, prompt: str, **kwargs):
+        """One chat completion on the best key, moving to the next key on 429; returns (response, key alias)."""
+        while True:
+            key, reserved = await self.acquire(prompt)
+            try:
+                response = await key.async_client().chat.completions.create(
+                    model=model, messages=[{"role": "user", "content": prompt}], **kwargs
+                )
+            except Exception as e:
+                self.failed(key, reserved, e)
+                if is_rate_limit(e) and not self.all_cooling_down():
+                    continue
+                raise
+            self.completed(key, reserved, model, response.usage)
+            return response, key.alias
+
+    def chat_sync(self, model: str, prompt: str, **kwargs):
+        while True:
+            key, reserved = self.acquire_sync(prompt)
+            try:
+                response = key.client().chat.completions.create(
+                    model=model, messages=[{"role": "user", "content": prompt}], **kwargs
+                )
+            except Exception as e:
+                self.failed(key, reserved, e)
+                if is_rate_limit(e) and not self.all_cooling_down():
+                    continue
+                raise
+            self.completed(key, reserved, model, response.usage)
+            return response, key.alias
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            return [{
+                "alias": k.alias,
+                "requests": k.requests,
+                "throttled": k.throttled,
+                "spent_usd": k.spent_usd,
+                "capped": k.capped,
+            } for k in self.keys]
+
+
+def print_pool_summary(pool: KeyPool):
+    for k in pool.summary():
+        print(f"   Klucz {k['alias']}: {k['requests']} zapytań, 429: {k['throttled']}, "
+              f"koszt ${k['spent_usd']:.2f}{' (limit wydatków)' if k['capped'] else ''}")
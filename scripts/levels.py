@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Score-to-level resolver compiled from the scoring ranges in
+instruments_extended.json, the only source of truth for levels and labels.
+Each instrument, and each subscale of DASS-21 and MBI, becomes a ScoreScale:
+a dense table from score to band index, built once. Looking up one score is
+a list index; `resolve` labels any array of scores with one numpy gather.
+
+Compilation fails on overlapping ranges or on scores between 0 and the
+scale's maximum that no range covers, so bad data cannot produce a level
+silently.
+
+Usage:
+    python scripts/levels.py          # Print the compiled scales
+"""
+UNRESOLVED = -1  # Band index of scores outside the scale
+
+
+class ScoreScale:
+    """Bands of one instrument or subscale and the dense score -> band index table."""
+
+    def __init__(self, name: str, ranges: list[dict], max_score: int = None):
+        self.name = name
+        self.bands = sorted(ranges, key=lambda r: r["min"])
+        self.max_score = max(max_score or 0, max(r["max"] for r in self.bands))
+
+        table = [UNRESOLVED] * (self.max_score + 1)
+        for i, band in enumerate(self.bands):
+            for score in range(band["min"], band["max"] + 1):
+                if table[score] != UNRESOLVED:
+                    raise ValueError(f"{name}: score {score} in two ranges")
+                table[score] = i
+        gaps = [score for score, band in enumerate(table) if band == UNRESOLVED]
+        if gaps:
+            raise ValueError(f"{name}: scores {gaps} outside all ranges")
+        self.table = table
+        self._array = None
+
+    def band_index(self, score: int) -> int:
+        return self.table[score] if 0 <= score <= self.max_score else UNRESOLVED
+
+    def band(self, score: int) -> dict:
+        """Scoring range ({"level", "label", ...}) containing score."""
+        i = self.band_index(score)
+        if i == UNRESOLVED:
+            raise ValueError(f"{self.name}: score {score} outside scoring ranges")
+        return self.bands[i]
+
+    def resolve(self, scores):
+        """Band index of every score in an array (UNRESOLVED outside 0..max_score)."""
+        import numpy as np
+
+        if self._array is None:
+            self._array = np.array(self.table, dtype=np.int16)
+        scores = np.asarray(scores)
+        inside = (scores >= 0) & (scores <= self.max_score)
+        indices = np.full(scores.shape, UNRESOLVED, dtype=np.int16)
+        indices[inside] = self._array[scores[inside]]
+        return indices
+
+    def levels(self, scores):
+        """Level of every score in an array ("" outside the scale)."""
+        import numpy as np
+
+        # UNRESOLVED (-1) picks the trailing ""
+        return np.array([b["level"] for b in self.bands] + [""])[self.resolve(scores)]
+
+    def labels(self, scores):
+        """Label of every score in an array ("" outside the scale)."""
+        import numpy as np
+
+        return np.array([b["label"] for b in self.bands] + [""])[self.resolve(scores)]
+
+
+def compile_scales(instruments: dict) -> dict[tuple[str, str | None], ScoreScale]:
+    """
+    ScoreScale per (instrument code, subscale). Instruments without subscales
+    are keyed with subscale None. Subscale ranges are read from
+    scoring["<subscale>_ranges"] (DASS-21) or scoring["<subscale>"]["ranges"] (MBI).
+    """
+    scales = {}
+    for code, instrument in instruments.items():
+        scoring = instrument["scoring"]
+        if "ranges" in scoring:
+            scales[(code, None)] = ScoreScale(code, scoring["ranges"], scoring.get("max_score"))
+        for subscale in instrument.get("subscales", []):
+            name = f"{code}/{subscale}"
+            if f"{subscale}_ranges" in scoring:
+                scales[(code, subscale)] = ScoreScale(name, scoring[f"{subscale}_ranges"], scoring.get("subscale_max"))
+            else:
+                scales[(code, subscale)] = ScoreScale(name, scoring[subscale]["ranges"], scoring[subscale].get("max_score"))
+    return scales
+
+
+def main():
+    from experiment import score_scales
+
+    for scale in score_scales().values():
+        bands = ", ".join(f"{b['min']}-{b['max']} {b['level']}" for b in scale.bands)
+        print(f"{scale.name:<36} 0-{scale.max_score:<3} {bands}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Impact analysis of template and data edits.
+Re-renders the prompt of every stored interpretation from its own cell seed
+and compares it with the stored prompt_hash. A cell is stale exactly when its
+prompt would change, so editing one template or one profile only marks the
+cells rendered from it:
+  - template: the variant's template changed (template_hash differs)
+  - data:     same template, but the data the prompt is built from changed
+  - legacy:   row has no seed/prompt_hash (generated before the run registry)
+Cells of the experiment with no interpretation at all are listed as missing.
+
+With --apply, stale rows (with their evaluations and judge verdicts) are moved
+to the *_archive tables and only the archived and missing cells are
+regenerated.
+
+Usage:
+    python scripts/plan.py                    # Show stale and missing cells
+    python scripts/plan.py --verbose          # List every stale cell
+    python scripts/plan.py --apply            # Archive stale rows, regenerate them
+    python scripts/plan.py --apply --include-legacy
+"""
+import asyncio
+from collections import Counter
+from experiment import (
+    PROMPT_VARIANTS, build_prompt, level_for_score, prompt_hash, template_hash, test_scores, user_profiles
+)
+from db import get_supabase, select_active
+
+ARCHIVE_BATCH = 500  # Ids per archive_interpretations call
+
+
+def fetch_rows() -> list[dict]:
+    return select_active("interpretations",
+        "id, instrument_code, score, prompt_variant, user_profile_id, seed, prompt_hash, template_hash"
+    ).execute().data
+
+
+def stale_reason(row: dict, profiles: dict) -> str | None:
+    """Why the row's prompt no longer matches the current templates and data, or None if it does."""
+    if row.get("seed") is None or not row.get("prompt_hash"):
+        return "legacy"
+    variant = row["prompt_variant"]
+    if variant not in {v["id"] for v in PROMPT_VARIANTS}:
+        return "template"  # Variant was removed
+    if row.get("template_hash") != template_hash(variant):
+        return "template"
+    prompt = build_prompt(
+        row["instrument_code"], row["score"], level_for_score(row["instrument_code"], row["score"])["label"],
+        variant, profiles[row["user_profile_id"]], seed=row["seed"]
+    )
+    if prompt_hash(prompt) != row["prompt_hash"]:
+        return "data"
+    return None
+
+
+def expected_cells() -> set[tuple]:
+    """(instrument, score, variant, profile) of every cell the generators produce."""
+    return {
+        (instrument_code, score_info["score"], variant["id"], profile["id"])
+        for instrument_code, scores in test_scores().items()
+        for score_info in scores
+        for variant in PROMPT_VARIANTS if instrument_code in variant["instruments"]
+        for profile in user_profiles()
+    }
+
+
+def compute_plan(rows: list[dict]) -> tuple[dict[str, list[dict]], set[tuple]]:
+    """Stale rows grouped by reason, and cells with no current interpretation."""
+    profiles = {p["id"]: p for p in user_profiles()}
+    stale = {"template": [], "data": [], "legacy": []}
+    current = set()
+    for r in rows:
+        reason = stale_reason(r, profiles)
+        if reason:
+            stale[reason].append(r)
+        else:
+            current.add((r["instrument_code"], r["score"], r["prompt_variant"], r["user_profile_id"]))
+    stale_keys = {
+        (r["instrument_code"], r["score"], r["prompt_variant"], r["user_profile_id"])
+        for group in stale.values() for r in group
+    }
+    missing = expected_cells() - current - stale_keys
+    return stale, missing
+
+
+def archive(rows: list[dict], reason: str):
+    """Move rows, their evaluations and verdicts to the archive tables, one transaction per batch."""
+    ids = [r["id"] for r in rows]
+    for i in range(0, len(ids), ARCHIVE_BATCH):
+        get_supabase().rpc("archive_interpretations", {"ids": ids[i:i + ARCHIVE_BATCH], "reason": reason}).execute()
+
+
+def print_plan(stale: dict[str, list[dict]], missing: set[tuple], verbose: bool = False):
+    print("=== Plan ===")
+    for reason, rows in stale.items():
+        by_variant = Counter(r["prompt_variant"] for r in rows)
+        print(f"Nieaktualne ({reason}): {len(rows)}" + (f"  {dict(by_variant)}" if rows else ""))
+        if verbose:
+            for r in rows:
+                print(f"  {r['id']} {r['instrument_code']}/{r['prompt_variant']}/profile={r['user_profile_id']}/score={r['score']}")
+    print(f"Brakujące komórki: {len(missing)}")
+    if verbose:
+        for instrument_code, score, variant, profile_id in sorted(missing):
+            print(f"  {instrument_code}/{variant}/profile={profile_id}/score={score}")
+
+
+def main(apply: bool = False, include_legacy: bool = False, verbose: bool = False):
+    stale, missing = compute_plan(fetch_rows())
+    print_plan(stale, missing, verbose)
+
+    if not apply:
+        return
+
+    to_archive = {reason: rows for reason, rows in stale.items() if rows and (reason != "legacy" or include_legacy)}
+    for reason, rows in to_archive.items():
+        archive(rows, reason)
+        print(f"Zarchiwizowano {len(rows)} ({reason})")
+
+    if to_archive or missing:
+        # The generator fills every cell without a current row, i.e. exactly the archived and missing ones
+        from generate_interpretations_parallel import main as generate
+
+        asyncio.run(generate())
+    else:
+        print("✅ Wszystko aktualne.")
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(
+        apply="--apply" in sys.argv,
+        include_legacy="--include-legacy" in sys.argv,
+        verbose="--verbose" in sys.argv,
+    )
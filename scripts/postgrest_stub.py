@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Local in-memory stand-in for Supabase's PostgREST API, for benchmarks and
+load tests without a database server. It supports the subset of the API that
+this repo uses:
+  - GET /rest/v1/<table>     select=, filters (eq, neq, gt, gte, lt, lte, in, is,
+                             like, ilike, not.<op>, or=(...), and=(...) nested),
+                             order=, limit=, offset=,
+                             Prefer: count=exact (Content-Range)
+  - POST /rest/v1/<table>    insert, or upsert with Prefer: resolution=merge-duplicates
+                             / ignore-duplicates and on_conflict=
+  - PATCH / DELETE           with the same filters
+  - POST /rest/v1/rpc/<fn>   functions from RPCS (current_experiment_id, stub_requests)
+
+Inserted rows get an id, created_at and, in the experiment-scoped tables, the
+stub's experiment_id. Connections are HTTP/1.1 keep-alive. Responses are
+gzip-compressed for clients that accept it, and gzip request bodies are
+decoded. --latency adds a delay to every request and --handshake a one-time
+delay to every new connection (e.g. a TLS handshake to a remote host), so
+connection reuse shows in the timings.
+
+Usage:
+    python scripts/postgrest_stub.py                       # http://127.0.0.1:54321
+    python scripts/postgrest_stub.py --port=8000 --seed=seed.json --latency=5 --handshake=40
+
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=stub python scripts/pv.py ...
+"""
+import gzip
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+DEFAULT_PORT = 54321
+EXPERIMENT_ID = "00000000-0000-0000-0000-000000000001"
+EXPERIMENT_TABLES = ("interpretations", "evaluations", "judge_verdicts", "runs", "generation_tasks")
+GZIP_MIN_BYTES = 1024  # Smaller responses are sent as is
+RESERVED_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns")
+
+RPCS = {
+    "current_experiment_id": lambda store, args: EXPERIMENT_ID,
+    "stub_requests": lambda store, args: store.requests,  # Requests served so far (load tests)
+}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def coerce(value: str, like):
+    """URL value as the type of the stored value it is compared with."""
+    if value == "null":
+        return None
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+
+def like_match(value, pattern: str, ignore_case: bool) -> bool:
+    import re
+
+    regex = "^" + ".*".join(re.escape(part) for part in pattern.replace("*", "%").split("%")) + "$"
+    return re.match(regex, str(value), re.IGNORECASE if ignore_case else 0) is not None
+
+
+def split_conditions(body: str) -> list[str]:
+    """Top-level comma-separated conditions of a logical filter body, e.g. 'a.eq.1,and(b.gt.2,c.is.null)'."""
+    conditions, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(body):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and char == "," and depth == 0:
+            conditions.append(body[start:i])
+            start = i + 1
+    conditions.append(body[start:])
+    return [c for c in conditions if c]
+
+
+def matches_logical(row: dict, operator: str, body: str) -> bool:
+    """or=(...) / and=(...) with nested and(...) / or(...) and not. prefixes."""
+    negate = operator.startswith("not.")
+    operator = operator.removeprefix("not.")
+    results = []
+    for condition in split_conditions(body.strip()[1:-1]):
+        head = condition.partition("(")[0]
+        if head.removeprefix("not.") in ("and", "or"):
+            results.append(matches_logical(row, head, condition[len(head):]))
+        else:
+            column, _, expression = condition.partition(".")
+            results.append(matches(row, column, expression.replace('"', "")))
+    result = all(results) if operator == "and" else any(results)
+    return result != negate
+
+
+def matches(row: dict, column: str, expression: str) -> bool:
+    if column.removeprefix("not.") in ("and", "or"):
+        return matches_logical(row, column, expression)
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, value = expression.partition(".")
+    stored = row.get(column)
+    if operator == "in":
+        values = [v.strip().strip('"') for v in value.strip("()").split(",")] if value != "()" else []
+        result = stored is not None and any(stored == coerce(v, stored) for v in values)
+    elif operator == "is":
+        result = stored is None if value == "null" else stored is coerce(value, True)
+    elif operator in ("like", "ilike"):
+        result = stored is not None and like_match(stored, value, operator == "ilike")
+    else:
+        target = coerce(value, stored)
+        if stored is None or target is None:
+            result = operator == "neq" and stored is not target
+        else:
+            result = {
+                "eq": stored == target, "neq": stored != target, "gt": stored > target,
+                "gte": stored >= target, "lt": stored < target, "lte": stored <= target,
+            }[operator]
+    return result != negate
+
+
+class Store:
+    """Tables as lists of rows, guarded by one lock."""
+
+    def __init__(self, tables: dict[str, list[dict]] = None):
+        self.tables = {name: [self.with_defaults(name, r) for r in rows] for name, rows in (tables or {}).items()}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def rows(self, table: str) -> list[dict]:
+        return self.tables.setdefault(table, [])
+
+    def with_defaults(self, table: str, row: dict) -> dict:
+        defaults = {"id": str(uuid.uuid4()), "created_at": now_iso()}
+        if table in EXPERIMENT_TABLES:
+            defaults["experiment_id"] = EXPERIMENT_ID
+        if table == "interpretations":
+            defaults["text_storage"] = "inline"
+        return self.on_write(table, {**defaults, **row})
+
+    @staticmethod
+    def on_write(table: str, row: dict) -> dict:
+        """The interpretations text_length trigger of setup_supabase.py."""
+        if table == "interpretations" and row.get("text_storage") == "inline":
+            row["text_length"] = len((row.get("interpretation_text") or "").strip())
+        return row
+
+
+def parse_query(query: str) -> tuple[dict, list[tuple[str, str]]]:
+    """(reserved params, [(column, filter expression)])."""
+    params, filters = {}, []
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name in RESERVED_PARAMS:
+            params[name] = f"{params[name]},{value}" if name == "order" and name in params else value
+        else:
+            filters.append((name, value))
+    return params, filters
+
+
+def project(row: dict, select: str) -> dict:
+    columns = [c.strip() for c in select.split(",") if c.strip()]
+    if not columns or "*" in columns:
+        return dict(row)
+    return {c: row.get(c) for c in columns}
+
+
+def order_rows(rows: list[dict], order: str) -> list[dict]:
+    for term in reversed(order.split(",")):
+        column, *modifiers = term.split(".")
+        rows = sorted(
+            rows,
+            # None sorts last ascending (PostgreSQL's default)
+            key=lambda r: (r.get(column) is None, r.get(column) if r.get(column) is not None else 0),
+            reverse="desc" in modifiers,
+        )
+    return rows
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    disable_nagle_algorithm = True  # Headers and body are separate writes; avoid the delayed-ACK stall
+    store: Store = None
+    latency = 0.0
+    handshake = 0.0
+
+    def setup(self):
+        super().setup()
+        if self.handshake:
+            time.sleep(self.handshake)  # Once per connection
+
+    def log_message(self, format, *args):
+        pass
+
+    def body(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return json.loads(raw) if raw else None
+
+    def reply(self, status: int, payload=None, headers: dict = None):
+        data = b"" if payload is None else json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        if len(data) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, 5)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self) -> tuple[str | None, str | None, str]:
+        """(table, rpc name, query) of the request path."""
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if parts[:2] != ["rest", "v1"] or len(parts) < 3:
+            return None, None, url.query
+        if parts[2] == "rpc" and len(parts) == 4:
+            return None, parts[3], url.query
+        return parts[2], None, url.query
+
+    def handle_one(self, method: str):
+        if self.latency:
+            time.sleep(self.latency)
+        table, rpc, query = self.route()
+        prefer = self.headers.get("Prefer", "")
+        store = self.store
+        store.requests += 1
+
+        if rpc:
+            args = self.body() or {}
+            if rpc not in RPCS:
+                return self.reply(404, {"message": f"Unknown function {rpc}"})
+            with store.lock:
+                return self.reply(200, RPCS[rpc](store, args))
+        body = self.body()  # Read for every method so the next request on the connection starts clean
+        if not table:
+            return self.reply(404, {"message": "Not found"})
+
+        params, filters = parse_query(query)
+        with store.lock:
+            rows = store.rows(table)
+            selected = [r for r in rows if all(matches(r, c, e) for c, e in filters)]
+
+            if method == "GET":
+                total = len(selected)
+                if "order" in params:
+                    selected = order_rows(selected, params["order"])
+                offset = int(params.get("offset", 0))
+                limit = int(params["limit"]) if "limit" in params else None
+                page = selected[offset:None if limit is None else offset + limit]
+                headers = {}
+                if "count=exact" in prefer:
+                    end = f"{offset}-{offset + len(page) - 1}" if page else "*"
+                    headers["Content-Range"] = f"{end}/{total}"
+                return self.reply(200, [project(r, params.get("select", "*")) for r in page], headers)
+
+            if method == "POST":
+                new = [store.with_defaults(table, r) for r in (body if isinstance(body, list) else [body])]
+                conflict = params.get("on_conflict", "id").split(",")
+                written = []
+                for row in new:
+                    existing = next((r for r in rows if all(r.get(c) == row.get(c) for c in conflict)), None)
+                    if existing is None:
+                        rows.append(row)
+                        written.append(row)
+                    elif "resolution=merge-duplicates" in prefer:
+                        existing.update({k: v for k, v in row.items() if k not in ("id", "created_at")})
+                        store.on_write(table, existing)
+                        written.append(existing)
+                    elif "resolution=ignore-duplicates" not in prefer:
+                        return self.reply(409, {"code": "23505", "message": "duplicate key value violates unique constraint"})
+                status, result = 201, written
+            elif method == "PATCH":
+                for r in selected:
+                    r.update(body or {})
+                    store.on_write(table, r)
+                status, result = 200, selected
+            else:  # DELETE
+                ids = {id(r) for r in selected}
+                rows[:] = [r for r in rows if id(r) not in ids]
+                status, result = 200, selected
+
+            if "return=minimal" in prefer:
+                return self.reply(204 if method != "POST" else 201)
+            return self.reply(status, [project(r, params.get("select", "*")) for r in result])
+
+    def do_GET(self):
+        self.handle_one("GET")
+
+    def do_POST(self):
+        self.handle_one("POST")
+
+    def do_PATCH(self):
+        self.handle_one("PATCH")
+
+    def do_DELETE(self):
+        self.handle_one("DELETE")
+
+
+def serve(port: int = DEFAULT_PORT, tables: dict = None, latency_ms: float = 0, handshake_ms: float = 0,
+          background: bool = False) -> tuple[ThreadingHTTPServer, str]:
+    """Start the stub; with background=True in a daemon thread. Returns (server, base URL)."""
+    handler = type("StubHandler", (Handler,), {
+        "store": Store(tables), "latency": latency_ms / 1000, "handshake": handshake_ms / 1000,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, url
+
+
+if __name__ == "__main__":
+    import sys
+
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    tables = None
+    if "seed" in options:
+        with open(options["seed"]) as f:
+            tables = json.load(f)
+    server, url = serve(
+        int(options.get("port", DEFAULT_PORT)), tables,
+        latency_ms=float(options.get("latency", 0)), handshake_ms=float(options.get("handshake", 0)),
+    )
+    print(f"PostgREST stub: {url} (SUPABASE_URL={url}, dowolny SUPABASE_KEY)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,226 @@
+"""
+Where time goes in a run: stage timers, a sampling profiler and cProfile.
+
+  - stage timers: `with stage("render"):` adds the block's wall time to a table
+    of calls, total and max per stage. Concurrent stages (API calls in the event
+    loop, worker threads) add up to more than the run's wall time. Timers record
+    only while profiling is enabled, so instrumented code costs nothing otherwise.
+  - Supabase calls: while profiling, every request through transport.py is a
+    stage "db <METHOD> <table>" covering the round trip and reading the body
+    (JSON decoding shows in the profiles).
+  - sampling profiler (default): a thread records the stacks of all threads
+    every SAMPLE_INTERVAL_SECONDS, including code waiting on the network, and
+    writes collapsed stacks (flamegraph.pl, inferno, speedscope) and speedscope
+    JSON. Process pool workers are not sampled; their stages are timed from the
+    parent.
+  - cProfile: exact call counts and times of the main thread, saved as .prof
+    (pstats, snakeviz) with the top functions printed.
+
+Usage:
+    python scripts/pv.py <command> --profile [options]            # Sampling -> .cache/profiles/
+    python scripts/pv.py <command> --profile=cprofile [options]
+    python scripts/pv.py <command> --profile=stages [options]     # Stage table only
+    streamlit run app/streamlit_app_profiled.py                   # Per-session rerun and DB call timing
+
+    https://www.speedscope.app/ opens both the .speedscope.json and the .collapsed files.
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_DIR = Path(__file__).parent.parent / ".cache/profiles"
+PROFILE_MODES = ("sample", "cprofile", "stages")
+SAMPLE_INTERVAL_SECONDS = 0.005
+CPROFILE_TOP = 30
+
+_enabled = False
+_stages = {}  # Stage name -> [calls, seconds, max seconds]
+_stages_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def record(name: str, seconds: float):
+    with _stages_lock:
+        totals = _stages.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as one call of stage `name` (no-op unless profiling is enabled)."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+@contextmanager
+def traced():
+    """Collect (stage, seconds) of every stage the calling thread records inside the block."""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace = []
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def stage_table() -> list[tuple[str, int, float, float]]:
+    """(stage, calls, seconds, max seconds), slowest total first."""
+    with _stages_lock:
+        rows = [(name, *totals) for name, totals in _stages.items()]
+    return sorted(rows, key=lambda r: r[2], reverse=True)
+
+
+def print_stages(wall_seconds: float):
+    rows = stage_table()
+    print(f"\n⏱  Czas całkowity: {wall_seconds:.2f} s")
+    if not rows:
+        print("   (brak zmierzonych etapów)")
+        return
+    print(f"   {'Etap':<40}{'Wywołania':>10}{'Suma s':>9}{'Średnio ms':>12}{'Max ms':>9}{'% czasu':>9}")
+    for name, calls, seconds, longest in rows:
+        print(f"   {name[:40]:<40}{calls:>10}{seconds:>9.2f}{seconds / calls * 1000:>12.1f}"
+              f"{longest * 1000:>9.1f}{seconds / wall_seconds * 100:>8.0f}%")
+    print("   (etapy współbieżne sumują się do ponad 100%)")
+
+
+def frame_key(frame) -> tuple[str, str, int]:
+    """(function, short file name, first line) of a frame."""
+    code = frame.f_code
+    path = code.co_filename
+    short = path.rsplit("site-packages/", 1)[-1] if "site-packages/" in path else Path(path).name
+    return code.co_name, short, code.co_firstlineno
+
+
+class Sampler:
+    """Wall-clock sampling profiler of all threads in the process."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()  # (thread name, (frame key, ...) root first) -> samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pv-sampler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(frame_key(frame))
+                    frame = frame.f_back
+                self.stacks[names.get(thread_id, str(thread_id)), tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: Path):
+        """One line per distinct stack: `thread;function (file:line);... samples`."""
+        with open(path, "w") as f:
+            for (thread, stack), samples in self.stacks.most_common():
+                frames = ";".join(f"{name} ({file}:{line})".replace(";", ",") for name, file, line in stack)
+                f.write(f"{thread};{frames} {samples}\n")
+
+    def write_speedscope(self, path: Path, name: str):
+        """speedscope's sampled profile format, one profile per thread, weights in seconds."""
+        frames, index = [], {}
+        profiles = {}
+        for (thread, stack), samples in self.stacks.items():
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                ids.append(index[key])
+            profile = profiles.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(ids)
+            profile["weights"].append(samples * self.interval)
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "pv profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled", "name": thread, "unit": "seconds",
+                    "startValue": 0, "endValue": sum(p["weights"]), **p,
+                }
+                # Busiest thread first, so speedscope opens on it
+                for thread, p in sorted(profiles.items(), key=lambda item: -sum(item[1]["weights"]))
+            ],
+        }
+        with open(path, "w") as f:
+            json.dump(document, f)
+
+
+def run_profiled(fn, name: str, mode: str = "sample"):
+    """Run fn() with profiling enabled; print the stage table and save the profile, even if fn fails."""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}, expected one of {', '.join(PROFILE_MODES)}")
+    enable()
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    base = PROFILE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
+    sampler = Sampler() if mode == "sample" else None
+    profiler = None
+    if mode == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    start = time.perf_counter()
+    if sampler:
+        sampler.start()
+    if profiler:
+        profiler.enable()
+    try:
+        return fn()
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        print_stages(time.perf_counter() - start)
+        if sampler:
+            sampler.write_collapsed(base.with_suffix(".collapsed"))
+            sampler.write_speedscope(base.with_suffix(".speedscope.json"), name)
+            print(f"   Profil: {base}.collapsed, {base}.speedscope.json ({sum(sampler.stacks.values())} próbek)")
+        if profiler:
+            import pstats
+
+            profiler.dump_stats(base.with_suffix(".prof"))
+            print()
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+            print(f"   Profil: {base}.prof")
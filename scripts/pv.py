@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the prompt validation scripts.
+Commands are resolved to their script only after the command name is parsed,
+so `pv --help` or a template test never imports openai, supabase or numpy.
+
+Usage:
+    python scripts/pv.py generate [--dry-run] [--limit=N] ...   # Parallel generation
+    python scripts/pv.py generate --sequential ...              # One request at a time
+    python scripts/pv.py worker enqueue|work|status             # Distributed generation through a task queue
+    python scripts/pv.py analyze                                # Win rates and ranking
+    python scripts/pv.py cube [--by=level] [--variant=V]        # Win rates sliced by profile, level, evaluator
+    python scripts/pv.py compare [--cells=...] [--dry-run]      # Prompt diffs, token deltas, outputs of variants
+    python scripts/pv.py reset [--force]                        # Switch to a fresh, empty experiment
+    python scripts/pv.py experiments [new|switch|archive NAME]  # Manage experiments
+    python scripts/pv.py plan [--apply]                         # Stale cells after template/data edits
+    python scripts/pv.py render [--samples=N]                   # Render the full prompt matrix without API calls
+    python scripts/pv.py templates                              # Quick template smoke test
+    python scripts/pv.py <command> --help                       # Script usage
+    python scripts/pv.py <command> --profile[=cprofile|stages]  # Stage timings and a profile (see profiling.py)
+"""
+import ast
+import runpy
+import sys
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).parent
+
+# command -> (script module, one-line description)
+COMMANDS = {
+    "generate": ("generate_interpretations_parallel", "Generowanie interpretacji (równolegle)"),
+    "worker": ("worker", "Kolejka zadań: enqueue, work (wiele procesów/hostów), status"),
+    "analyze": ("analysis", "Analiza ewaluacji: win rate, ranking, test sekwencyjny"),
+    "compare": ("compare_variants", "Porównanie wariantów: różnice promptów, tokeny, odpowiedzi"),
+    "reset": ("reset_database", "Nowy, pusty eksperyment (dane poprzedniego zachowane)"),
+    "experiments": ("experiments", "Eksperymenty: lista, nowy, przełączenie, archiwizacja"),
+    "plan": ("plan", "Nieaktualne komórki po zmianie szablonu lub danych"),
+    "render": ("render_matrix", "Renderowanie pełnej macierzy promptów bez wywołań API"),
+    "levels": ("levels", "Przedziały wynik -> poziom wszystkich instrumentów i podskal"),
+    "templates": ("test_templates", "Szybki test szablonów (jeden profil)"),
+    "cube": ("cube", "Analiza warstwowa: win rate wg profilu, poziomu, oceniającego"),
+    "quality": ("evaluator_quality", "Jakość oceniających: skrzywienie pozycyjne, spójność, kappa"),
+    "judge": ("judge_pairs", "Ocena par przez LLM"),
+    "validate": ("validator", "Walidacja zapisanych interpretacji"),
+    "dedup": ("dedup", "Wykrywanie prawie-duplikatów"),
+    "export": ("export_parquet", "Eksport do Parquet"),
+    "texts": ("text_store", "Teksty interpretacji: statystyki, słownik zstd, kompresja"),
+    "setup": ("setup_supabase", "Schemat bazy danych"),
+}
+SEQUENTIAL_GENERATE = "generate_interpretations"
+
+
+def print_commands():
+    print("Użycie: python scripts/pv.py <komenda> [opcje]\n")
+    width = max(len(c) for c in COMMANDS)
+    for command, (_, description) in COMMANDS.items():
+        print(f"  {command:<{width}}  {description}")
+    print("\n`python scripts/pv.py <komenda> --help` pokazuje opcje komendy.")
+
+
+def script_usage(module: str) -> str:
+    """Docstring of a script, read without importing it."""
+    source = (SCRIPTS_DIR / f"{module}.py").read_text()
+    return ast.get_docstring(ast.parse(source)) or f"{module}: brak opisu"
+
+
+def run(module: str, args: list[str]):
+    """Run a script as if it was called directly with `args`."""
+    sys.argv = [str(SCRIPTS_DIR / f"{module}.py")] + args
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def main(argv: list[str]):
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print_commands()
+        return
+
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"❌ Nieznana komenda: {command}\n")
+        print_commands()
+        sys.exit(2)
+
+    module = COMMANDS[command][0]
+    if command == "generate" and "--sequential" in args:
+        module = SEQUENTIAL_GENERATE
+        args = [a for a in args if a != "--sequential"]
+
+    if "--help" in args or "-h" in args:
+        print(script_usage(module))
+        return
+
+    profile = next((a for a in args if a == "--profile" or a.startswith("--profile=")), None)
+    if profile:
+        from profiling import run_profiled
+
+        args = [a for a in args if a != profile]
+        run_profiled(lambda: run(module, args), command, profile.partition("=")[2] or "sample")
+        return
+
+    run(module, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
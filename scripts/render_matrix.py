@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Render-only compilation of the full prompt matrix, without API calls.
+Expands every score from 0 to max_score of each instrument x every profile x
+every variant supporting the instrument (x --samples simulated answer sets),
+renders the prompts in a process pool with StrictUndefined and writes them as
+gzip-compressed JSONL with a sha256 hash and a token count per prompt.
+
+Use it to validate templates and to size a run before spending on the API.
+
+Checks per prompt:
+  - undefined:  template uses a variable missing from the context
+  - markup:     unrendered Jinja markup left in the output
+  - no_score:   the score does not appear in the prompt
+  - error:      any other rendering error
+
+Token counts use tiktoken when installed, otherwise chars / 4.
+
+Usage:
+    python scripts/render_matrix.py                          # Full matrix -> export/prompts.jsonl.gz
+    python scripts/render_matrix.py --samples=100            # 100 simulated answer sets per cell
+    python scripts/render_matrix.py --workers=8              # Process pool size (default: CPU count)
+    python scripts/render_matrix.py --out=/tmp/prompts.jsonl.gz
+    python scripts/render_matrix.py --no-text                # Only hashes and sizes, not the prompts
+    python scripts/render_matrix.py --seed=123               # Run seed (prompts match a generation run with it)
+"""
+import gzip
+import json
+import os
+import re
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from experiment import (
+    BASE_DIR, PROMPT_VARIANTS, build_prompt, cell_seed, instruments, prompt_hash, score_scale, user_profiles
+)
+
+DEFAULT_OUT = BASE_DIR / "export/prompts.jsonl.gz"
+CHUNK_SIZE = 500  # Cells per worker task
+CHUNKS_IN_FLIGHT_PER_WORKER = 2  # Rendered chunks wait for the writer, so memory stays bounded
+TOKEN_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4  # Fallback estimate without tiktoken
+
+MARKUP_RE = re.compile(r"\{\{|\}\}|\{%|%\}")
+
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+        except ImportError:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return len(text) // CHARS_PER_TOKEN
+
+
+def iter_cells(samples: int = 1, run_seed: int = 0):
+    """Every (instrument, score, variant, profile, sample) cell of the matrix, with its level."""
+    import numpy as np
+
+    for instrument_code, instrument in instruments().items():
+        variants = [v for v in PROMPT_VARIANTS if instrument_code in v["instruments"]]
+        if not variants:
+            continue
+        scale = score_scale(instrument_code)
+        scores = np.arange(instrument["scoring"]["max_score"] + 1)
+        # All scores of the instrument labelled in one lookup
+        for score, level, label in zip(scores.tolist(), scale.levels(scores).tolist(), scale.labels(scores).tolist()):
+            for variant in variants:
+                for profile in user_profiles():
+                    for sample in range(samples):
+                        yield {
+                            "instrument_code": instrument_code,
+                            "score": score,
+                            "level": level,
+                            "label": label,
+                            "prompt_variant": variant["id"],
+                            "user_profile_id": profile["id"],
+                            "sample": sample,
+                            "run_seed": run_seed,
+                        }
+
+
+def chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_cell(cell: dict, profiles: dict) -> dict:
+    """Render one cell with StrictUndefined and check the output."""
+    from jinja2 import UndefinedError
+
+    # Same seeds as a generation run with this run seed, so hashes match its prompt_hash
+    seed = cell_seed(
+        cell["run_seed"], cell["instrument_code"], cell["score"], cell["prompt_variant"],
+        cell["user_profile_id"], cell["sample"]
+    )
+
+    result = {**cell, "problems": []}
+    try:
+        prompt = build_prompt(
+            cell["instrument_code"], cell["score"], cell["label"], cell["prompt_variant"],
+            profiles[cell["user_profile_id"]], strict=True, seed=seed
+        )
+    except UndefinedError as e:
+        result["problems"].append(f"undefined:{e.message}")
+        return result
+    except Exception as e:
+        result["problems"].append(f"error:{e}")
+        return result
+
+    if MARKUP_RE.search(prompt):
+        result["problems"].append("markup")
+    if str(cell["score"]) not in prompt:
+        result["problems"].append("no_score")
+
+    result.update({
+        "seed": seed,
+        "prompt_hash": prompt_hash(prompt),
+        "chars": len(prompt),
+        "tokens": count_tokens(prompt),
+        "prompt": prompt,
+    })
+    return result
+
+
+def render_chunk(cells: list[dict]) -> list[dict]:
+    profiles = {p["id"]: p for p in user_profiles()}
+    return [render_cell(c, profiles) for c in cells]
+
+
+def bounded_map(pool, fn, items, window: int):
+    """Results of fn over items in order, like pool.map, but submitting at most `window` tasks ahead."""
+    in_flight = deque()
+    for item in items:
+        in_flight.append(pool.submit(fn, item))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def main(out_path=DEFAULT_OUT, samples: int = 1, workers: int = None, include_text: bool = True, run_seed: int = 0):
+    # Import by module name so the pool pickles render_chunk by an importable
+    # reference even when this file runs as __main__ (directly or via pv.py)
+    from render_matrix import render_chunk
+
+    start_time = time.time()
+    count_tokens("")  # Pick the tokenizer here too, for the summary
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    total = 0
+    problems = defaultdict(int)
+    tokens_by_variant = defaultdict(lambda: [0, 0, 0])  # Variant -> [sum, prompts, max]
+    hashes = set()
+
+    workers = workers or os.cpu_count()
+    with gzip.open(out_path, "wt", encoding="utf-8") as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        cell_chunks = chunks(iter_cells(samples, run_seed), CHUNK_SIZE)
+        for results in bounded_map(pool, render_chunk, cell_chunks, workers * CHUNKS_IN_FLIGHT_PER_WORKER):
+            for r in results:
+                total += 1
+                for p in r["problems"]:
+                    problems[p.split(":")[0]] += 1
+                    print(f"❌ {r['instrument_code']}/{r['prompt_variant']}/profile={r['user_profile_id']}/score={r['score']}: {p}")
+                if "tokens" in r:
+                    totals = tokens_by_variant[r["prompt_variant"]]
+                    totals[0] += r["tokens"]
+                    totals[1] += 1
+                    totals[2] = max(totals[2], r["tokens"])
+                    hashes.add(r["prompt_hash"])
+                if not include_text:
+                    r.pop("prompt", None)
+                out.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    elapsed = time.time() - start_time
+    print(f"\n✅ Wyrenderowano {total} promptów w {elapsed:.1f}s ({total / elapsed:.0f}/s) -> {out_path}")
+    print(f"   Unikalne prompty: {len(hashes)}")
+    print(f"   Tokeny ({'tiktoken' if _encoder else f'szacunek: znaki/{CHARS_PER_TOKEN}'}):")
+    for variant, (tokens, prompts, longest) in sorted(tokens_by_variant.items()):
+        print(f"     {variant}: suma {tokens:,}, średnio {tokens / prompts:.0f}, max {longest}")
+    print(f"   Razem: {sum(t[0] for t in tokens_by_variant.values()):,} tokenów wejściowych")
+    if problems:
+        print(f"   Błędy: {dict(problems)}")
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    out_path = DEFAULT_OUT
+    samples = 1
+    workers = None
+    run_seed = 0
+    for arg in sys.argv:
+        if arg.startswith("--out="):
+            out_path = Path(arg.split("=", 1)[1])
+        elif arg.startswith("--samples="):
+            samples = int(arg.split("=")[1])
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=")[1])
+        elif arg.startswith("--seed="):
+            run_seed = int(arg.split("=")[1])
+
+    main(out_path=out_path, samples=samples, workers=workers, include_text="--no-text" not in sys.argv,
+         run_seed=run_seed)
@@ -1,48 +1,34 @@
 #!/usr/bin/env python3
 """
-Reset database tables for a fresh experiment.
-Deletes all interpretations and evaluations.
+Reset the database for a fresh experiment.
+Switches the active-experiment pointer to a new, empty experiment: an O(1)
+metadata change. Interpretations and evaluations of the previous experiment
+are kept (no longer visible to the app and scripts); with --archive they are
+also moved to the *_archive tables in bulk.
 
 Usage:
-    python scripts/reset_database.py           # Interactive confirmation
-    python scripts/reset_database.py --force   # Skip confirmation
+    python scripts/reset_database.py                      # Interactive confirmation
+    python scripts/reset_database.py --force              # Skip confirmation
+    python scripts/reset_database.py --name=v4            # Name of the new experiment
+    python scripts/reset_database.py --archive            # Also archive the previous experiment
 """
-import os
 import sys
-from supabase import create_client
-
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("❌ Brak zmiennych SUPABASE_URL i SUPABASE_KEY")
-    sys.exit(1)
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-def get_counts():
-    """Get current row counts."""
-    interps = supabase.table("interpretations").select("id", count="exact").execute()
-    evals = supabase.table("evaluations").select("id", count="exact").execute()
-    return interps.count, evals.count
-
-
-def reset_tables():
-    """Delete all data from tables."""
-    # Delete evaluations first (foreign key constraint)
-    supabase.table("evaluations").delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
-
-    # Delete interpretations
-    supabase.table("interpretations").delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
+import time
+from experiments import activate, archive, get_active, get_counts
 
 
 def main():
     force = "--force" in sys.argv
+    name = f"reset-{time.strftime('%Y%m%d-%H%M%S')}"
+    for arg in sys.argv:
+        if arg.startswith("--name="):
+            name = arg.split("=", 1)[1]
 
-    interp_count, eval_count = get_counts()
+    previous = get_active()
+    interp_count, eval_count = get_counts(previous["id"])
 
     print("=== Reset Database ===")
+    print(f"Aktywny eksperyment: {previous['name']}")
     print(f"Interpretacje: {interp_count}")
     print(f"Ewaluacje: {eval_count}")
     print()
@@ -52,17 +38,18 @@ def main():
         return
 
     if not force:
-        confirm = input("Czy na pewno usunąć wszystkie dane? (tak/nie): ")
+        confirm = input(f"Rozpocząć nowy eksperyment '{name}'? (tak/nie): ")
         if confirm.lower() not in ["tak", "yes", "y", "t"]:
             print("Anulowano.")
             return
 
-    print("Usuwanie danych...")
-    reset_tables()
+    activate(name)
+    print(f"✅ Aktywny eksperyment: {name} (dane '{previous['name']}' zachowane)")
 
-    # Verify
-    interp_count, eval_count = get_counts()
-    print(f"\n✅ Gotowe! Interpretacje: {interp_count}, Ewaluacje: {eval_count}")
+    if "--archive" in sys.argv:
+        print("Archiwizacja...")
+        moved = archive(previous["id"])
+        print(f"✅ Zarchiwizowano '{previous['name']}': {moved} interpretacji")
 
 
 if __name__ == "__main__":
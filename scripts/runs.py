@@ -0,0 +1,52 @@
+"""
+Run registry: one `runs` row per generation run, holding the run seed and the
+hashes of the templates and data files it was generated from. Each
+interpretation row points at its run and stores its own cell seed and
+prompt hash, so any cell can be re-rendered or regenerated exactly.
+"""
+import secrets
+import subprocess
+from datetime import datetime, timezone
+from experiment import BASE_DIR, PROMPT_VARIANTS, data_hash, template_hash
+from db import get_supabase
+
+
+def new_run_seed() -> int:
+    return secrets.randbits(63)  # Fits a Postgres BIGINT
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def register_run(seed: int, model: str, script: str, config: dict = None) -> str:
+    """Insert a `runs` row and return its id."""
+    row = {
+        "seed": seed,
+        "model": model,
+        "script": script,
+        "config": config or {},
+        "data_hash": data_hash(),
+        "template_hashes": {v["id"]: template_hash(v["id"]) for v in PROMPT_VARIANTS},
+        "git_commit": git_commit(),
+        "status": "running",
+    }
+    return get_supabase().table("runs").insert(row).execute().data[0]["id"]
+
+
+def finish_run(run_id: str, status: str, generated: int, failed: int):
+    get_supabase().table("runs").update({
+        "status": status,
+        "generated": generated,
+        "failed": failed,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }).eq("id", run_id).execute()
+
+
+def get_run(run_id: str) -> dict:
+    return get_supabase().table("runs").select("*").eq("id", run_id).single().execute().data
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Sequential analysis of pairwise variant comparisons.
+
+Each comparison (variant A vs variant B, ties excluded) gets an always-valid
+95% confidence sequence for P(A beats B), built from a beta-binomial mixture
+martingale. The result can be checked after every single evaluation without
+inflating the error rate, so a comparison is declared settled as soon as:
+  - the interval excludes 0.5 (one variant is better), or
+  - the interval lies inside 0.5 ± MIN_EFFECT (no meaningful difference).
+Settled comparisons no longer need human evaluations.
+
+Usage:
+    python scripts/sequential.py            # Print status of all comparisons
+"""
+import math
+from collections import defaultdict
+
+ALPHA = 0.05
+MIN_EFFECT = 0.15  # |P(A beats B) - 0.5| below this is "no meaningful difference"
+MIN_COMPARISONS = 10  # Never settle on fewer decisive votes than this
+
+STATUS_PL = {
+    "running": "trwa",
+    "winner": "rozstrzygnięte",
+    "equivalent": "brak istotnej różnicy",
+}
+
+
+def _log_beta(a: float, b: float) -> float:
+    return math.lgamma(a) + math.lgamma(b) - math.lgamma(a + b)
+
+
+def log_mixture_martingale(wins: int, losses: int, p: float) -> float:
+    """log M_n(p) for a uniform mixture over the win probability, tested against p."""
+    log_likelihood = (wins * math.log(p) if wins else 0.0) + (losses * math.log1p(-p) if losses else 0.0)
+    return _log_beta(wins + 1, losses + 1) - log_likelihood
+
+
+def confidence_sequence(wins: int, losses: int, alpha: float = ALPHA) -> tuple[float, float]:
+    """
+    Always-valid confidence interval for P(win): all p with M_n(p) < 1/alpha.
+    log M_n(p) is convex in p, so the set is an interval around wins / n.
+    """
+    n = wins + losses
+    if n == 0:
+        return 0.0, 1.0
+
+    threshold = math.log(1 / alpha)
+    eps = 1e-12
+    p_hat = min(max(wins / n, eps), 1 - eps)
+
+    def outside(p: float) -> bool:
+        return log_mixture_martingale(wins, losses, p) >= threshold
+
+    def bisect(inside: float, out: float) -> float:
+        for _ in range(60):
+            mid = (inside + out) / 2
+            if outside(mid):
+                out = mid
+            else:
+                inside = mid
+        return inside
+
+    low = 0.0 if not outside(eps) else bisect(p_hat, eps)
+    high = 1.0 if not outside(1 - eps) else bisect(p_hat, 1 - eps)
+    return low, high
+
+
+def comparison_status(wins: int, losses: int, alpha: float = ALPHA,
+                      min_effect: float = MIN_EFFECT, min_comparisons: int = MIN_COMPARISONS) -> dict:
+    """Status of one comparison from the point of view of the first variant."""
+    low, high = confidence_sequence(wins, losses, alpha)
+    status = "running"
+    if wins + losses >= min_comparisons:
+        if low > 0.5 or high < 0.5:
+            status = "winner"
+        elif low >= 0.5 - min_effect and high <= 0.5 + min_effect:
+            status = "equivalent"
+    return {"wins": wins, "losses": losses, "low": low, "high": high, "status": status}
+
+
+class SequentialMonitor:
+    """Consumes decisive pairwise votes as they stream in and tracks which comparisons are settled."""
+
+    def __init__(self, alpha: float = ALPHA, min_effect: float = MIN_EFFECT, min_comparisons: int = MIN_COMPARISONS):
+        self.alpha = alpha
+        self.min_effect = min_effect
+        self.min_comparisons = min_comparisons
+        self.counts = defaultdict(lambda: [0, 0])  # (variant_a, variant_b) sorted -> [a_wins, b_wins]
+
+    @classmethod
+    def from_head_to_head(cls, head_to_head: dict, **kwargs) -> "SequentialMonitor":
+        """Build from aggregated {(winner, loser): count} counts."""
+        monitor = cls(**kwargs)
+        for (winner, loser), count in head_to_head.items():
+            monitor.add(winner, loser, count)
+        return monitor
+
+    def add(self, winner_variant: str, loser_variant: str, count: int = 1):
+        if winner_variant == loser_variant:
+            return
+        key = tuple(sorted([winner_variant, loser_variant]))
+        self.counts[key][0 if key[0] == winner_variant else 1] += count
+
+    def status(self, variant_a: str, variant_b: str) -> dict:
+        key = tuple(sorted([variant_a, variant_b]))
+        a_wins, b_wins = self.counts.get(key, (0, 0))
+        result = comparison_status(a_wins, b_wins, self.alpha, self.min_effect, self.min_comparisons)
+        if result["status"] == "winner":
+            result["winner"] = key[0] if result["low"] > 0.5 else key[1]
+        return result
+
+    def report(self) -> dict:
+        """{(variant_a, variant_b): status dict} for every comparison seen so far."""
+        return {key: self.status(*key) for key in sorted(self.counts)}
+
+    def settled(self) -> set[frozenset]:
+        """Variant pairs that no longer need evaluations."""
+        return {frozenset(key) for key, r in self.report().items() if r["status"] != "running"}
+
+
+def print_sequential_report(monitor: SequentialMonitor):
+    """Print status of every comparison."""
+    print("-" * 60)
+    print(f"ANALIZA SEKWENCYJNA (zawsze ważne CI {1 - monitor.alpha:.0%}):")
+    print("-" * 60)
+    for (var_a, var_b), r in monitor.report().items():
+        verdict = STATUS_PL[r["status"]]
+        if r["status"] == "winner":
+            verdict += f" → {r['winner']}"
+        print(f"  {var_a} vs {var_b}: {r['wins']}-{r['losses']}, "
+              f"P({var_a} wygrywa) ∈ [{r['low']:.2f}, {r['high']:.2f}] — {verdict}")
+    print()
+
+
+def main():
+    from analysis import fetch_evaluations, fetch_interpretations
+
+    evaluations = fetch_evaluations()
+    interpretations = fetch_interpretations()
+
+    monitor = SequentialMonitor()
+    for e in evaluations:
+        winner = interpretations.get(e.get("interpretation_id"))
+        loser = interpretations.get(e.get("preferred_over"))
+        if winner and loser:
+            monitor.add(winner["prompt_variant"], loser["prompt_variant"])
+
+    print_sequential_report(monitor)
+
+
+if __name__ == "__main__":
+    main()
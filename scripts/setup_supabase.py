@@ -3,19 +3,70 @@
 Setup Supabase tables for prompt validation.
 Run this once to create the schema.
 """
-import os
-from supabase import create_client
+from db import get_supabase
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+# SQL to create tables - run this in Supabase SQL Editor
+SQL_SCHEMA = """
+-- Experiments: every row of interpretations/evaluations/judge_verdicts/runs belongs to one.
+-- Exactly one is active; readers only see the active one, so a reset is a pointer switch.
+CREATE TABLE IF NOT EXISTS experiments (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name TEXT UNIQUE NOT NULL,
+    description TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    archived_at TIMESTAMPTZ
+);
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Set SUPABASE_URL and SUPABASE_KEY environment variables")
+-- Single-row pointer to the active experiment
+CREATE TABLE IF NOT EXISTS active_experiment (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    experiment_id UUID NOT NULL REFERENCES experiments(id),
+    switched_at TIMESTAMPTZ DEFAULT NOW()
+);
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+INSERT INTO experiments (name, description) VALUES ('v3', 'Eksperyment V3') ON CONFLICT (name) DO NOTHING;
+INSERT INTO active_experiment (experiment_id)
+SELECT id FROM experiments WHERE name = 'v3' ON CONFLICT (singleton) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION current_experiment_id()
+RETURNS UUID LANGUAGE sql STABLE AS $$
+    SELECT experiment_id FROM active_experiment WHERE singleton
+$$;
+
+-- Make an experiment active (creating it if needed); O(1), no data is touched
+CREATE OR REPLACE FUNCTION activate_experiment(experiment_name TEXT, experiment_description TEXT DEFAULT NULL)
+RETURNS UUID LANGUAGE plpgsql AS $$
+DECLARE
+    target UUID;
+BEGIN
+    INSERT INTO experiments (name, description) VALUES (experiment_name, experiment_description)
+    ON CONFLICT (name) DO UPDATE SET archived_at = experiments.archived_at
+    RETURNING id INTO target;
+    IF (SELECT archived_at FROM experiments WHERE id = target) IS NOT NULL THEN
+        RAISE EXCEPTION 'Experiment % is archived', experiment_name;
+    END IF;
+    UPDATE active_experiment SET experiment_id = target, switched_at = NOW() WHERE singleton;
+    RETURN target;
+END;
+$$;
+
+-- Generation runs: seed and input hashes each interpretation was generated from
+CREATE TABLE IF NOT EXISTS runs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    seed BIGINT NOT NULL,
+    model TEXT NOT NULL,
+    script TEXT NOT NULL,
+    config JSONB DEFAULT '{}',
+    data_hash TEXT NOT NULL,
+    template_hashes JSONB NOT NULL,
+    git_commit TEXT,
+    status TEXT DEFAULT 'running',
+    generated INTEGER,
+    failed INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
 
-# SQL to create tables - run this in Supabase SQL Editor
-SQL_SCHEMA = """
 -- Interpretations generated by LLM
 CREATE TABLE IF NOT EXISTS interpretations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -26,9 +77,21 @@ CREATE TABLE IF NOT EXISTS interpretations (
     user_profile_id INTEGER,
     interpretation_text TEXT NOT NULL,
     model TEXT DEFAULT 'gpt-5.1',
+    run_id UUID REFERENCES runs(id),
+    seed BIGINT,                -- Cell seed (experiment.cell_seed) of the simulated answers
+    prompt_hash TEXT,           -- sha256 of the rendered prompt
+    template_hash TEXT,
+    data_hash TEXT,
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Provenance columns for tables created before the run registry
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS run_id UUID REFERENCES runs(id);
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS seed BIGINT;
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS template_hash TEXT;
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS data_hash TEXT;
+
 -- Evaluations by human reviewers (blind test)
 CREATE TABLE IF NOT EXISTS evaluations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -40,24 +103,305 @@ CREATE TABLE IF NOT EXISTS evaluations (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Pairwise verdicts from the automated LLM judge (one row per shown ordering)
+CREATE TABLE IF NOT EXISTS judge_verdicts (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    interpretation_a UUID REFERENCES interpretations(id),
+    interpretation_b UUID REFERENCES interpretations(id),
+    winner_id UUID REFERENCES interpretations(id),
+    judge_model TEXT NOT NULL,
+    reason TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (interpretation_a, interpretation_b, judge_model)
+);
+
+-- Experiment scoping; new rows default to the active experiment
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS experiment_id UUID REFERENCES experiments(id) DEFAULT current_experiment_id();
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS experiment_id UUID REFERENCES experiments(id) DEFAULT current_experiment_id();
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS experiment_id UUID REFERENCES experiments(id) DEFAULT current_experiment_id();
+ALTER TABLE judge_verdicts ADD COLUMN IF NOT EXISTS experiment_id UUID REFERENCES experiments(id) DEFAULT current_experiment_id();
+UPDATE runs SET experiment_id = current_experiment_id() WHERE experiment_id IS NULL;
+UPDATE interpretations SET experiment_id = current_experiment_id() WHERE experiment_id IS NULL;
+UPDATE evaluations SET experiment_id = current_experiment_id() WHERE experiment_id IS NULL;
+UPDATE judge_verdicts SET experiment_id = current_experiment_id() WHERE experiment_id IS NULL;
+
+-- Shown order (A = left) and time to decide, for evaluator quality (see evaluator_quality.py)
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS shown_a UUID REFERENCES interpretations(id);
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS shown_b UUID REFERENCES interpretations(id);
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS response_time_ms INTEGER;
+
+-- Alias of the API key that generated the interpretation (see key_pool.py)
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS api_key_alias TEXT;
+
+-- Text storage (see text_store.py): text inline or zstd-compressed in interpretation_texts.
+-- text_length (trimmed) lets readers check for text without fetching it; the trigger keeps it for inline rows.
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS text_storage TEXT NOT NULL DEFAULT 'inline'
+    CHECK (text_storage IN ('inline', 'zstd'));
+ALTER TABLE interpretations ADD COLUMN IF NOT EXISTS text_length INTEGER;
+UPDATE interpretations SET text_length = LENGTH(BTRIM(interpretation_text))
+WHERE text_length IS NULL AND text_storage = 'inline';
+
+CREATE OR REPLACE FUNCTION set_text_length()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.text_storage = 'inline' THEN
+        NEW.text_length := LENGTH(BTRIM(NEW.interpretation_text));
+    END IF;
+    RETURN NEW;
+END;
+$$;
+DROP TRIGGER IF EXISTS interpretations_text_length ON interpretations;
+CREATE TRIGGER interpretations_text_length BEFORE INSERT OR UPDATE ON interpretations
+FOR EACH ROW EXECUTE FUNCTION set_text_length();
+
+-- zstd dictionaries trained on earlier outputs (base64); the newest one compresses new texts
+CREATE TABLE IF NOT EXISTS text_dictionaries (
+    id INTEGER PRIMARY KEY,     -- Also the zstd dictionary id stored in each frame
+    dictionary TEXT NOT NULL,
+    samples INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Compressed texts (base64 zstd frames). No foreign key: texts of archived interpretations stay readable.
+CREATE TABLE IF NOT EXISTS interpretation_texts (
+    interpretation_id UUID PRIMARY KEY,
+    dictionary_id INTEGER NOT NULL REFERENCES text_dictionaries(id),
+    compressed TEXT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Superseded interpretations and their evaluations (see plan.py) and archived experiments (cold storage)
+CREATE TABLE IF NOT EXISTS interpretations_archive (
+    LIKE interpretations INCLUDING DEFAULTS,
+    archive_reason TEXT,
+    archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS evaluations_archive (
+    LIKE evaluations INCLUDING DEFAULTS,
+    archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS judge_verdicts_archive (
+    LIKE judge_verdicts INCLUDING DEFAULTS,
+    archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE interpretations_archive ADD COLUMN IF NOT EXISTS experiment_id UUID;
+ALTER TABLE evaluations_archive ADD COLUMN IF NOT EXISTS experiment_id UUID;
+ALTER TABLE judge_verdicts_archive ADD COLUMN IF NOT EXISTS experiment_id UUID;
+ALTER TABLE evaluations_archive ADD COLUMN IF NOT EXISTS shown_a UUID;
+ALTER TABLE evaluations_archive ADD COLUMN IF NOT EXISTS shown_b UUID;
+ALTER TABLE evaluations_archive ADD COLUMN IF NOT EXISTS response_time_ms INTEGER;
+ALTER TABLE interpretations_archive ADD COLUMN IF NOT EXISTS api_key_alias TEXT;
+ALTER TABLE interpretations_archive ADD COLUMN IF NOT EXISTS text_storage TEXT;
+ALTER TABLE interpretations_archive ADD COLUMN IF NOT EXISTS text_length INTEGER;
+ALTER TABLE interpretations_archive ALTER COLUMN experiment_id DROP DEFAULT;
+ALTER TABLE evaluations_archive ALTER COLUMN experiment_id DROP DEFAULT;
+ALTER TABLE judge_verdicts_archive ALTER COLUMN experiment_id DROP DEFAULT;
+CREATE INDEX IF NOT EXISTS idx_interpretations_archive_experiment ON interpretations_archive(experiment_id);
+CREATE INDEX IF NOT EXISTS idx_evaluations_archive_experiment ON evaluations_archive(experiment_id);
+
+-- Move interpretations, and the evaluations and verdicts referencing them, to the archive in one transaction.
+-- Rows are copied by column name, so archive tables may have columns in a different order.
+CREATE OR REPLACE FUNCTION archive_interpretations(ids UUID[], reason TEXT)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    moved INTEGER;
+    stamp JSONB := jsonb_build_object('archived_at', NOW());
+BEGIN
+    WITH gone AS (
+        DELETE FROM evaluations
+        WHERE interpretation_id = ANY(ids) OR preferred_over = ANY(ids)
+           OR shown_a = ANY(ids) OR shown_b = ANY(ids)
+        RETURNING *
+    )
+    INSERT INTO evaluations_archive
+    SELECT (jsonb_populate_record(NULL::evaluations_archive, to_jsonb(gone) || stamp)).* FROM gone;
+
+    WITH gone AS (
+        DELETE FROM judge_verdicts
+        WHERE interpretation_a = ANY(ids) OR interpretation_b = ANY(ids)
+        RETURNING *
+    )
+    INSERT INTO judge_verdicts_archive
+    SELECT (jsonb_populate_record(NULL::judge_verdicts_archive, to_jsonb(gone) || stamp)).* FROM gone;
+
+    WITH gone AS (
+        DELETE FROM interpretations WHERE id = ANY(ids) RETURNING *
+    )
+    INSERT INTO interpretations_archive
+    SELECT (jsonb_populate_record(
+        NULL::interpretations_archive, to_jsonb(gone) || stamp || jsonb_build_object('archive_reason', reason)
+    )).* FROM gone;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$;
+
+-- Move a whole inactive experiment to the archive tables in bulk (server side, one transaction)
+CREATE OR REPLACE FUNCTION archive_experiment(target UUID)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    ids UUID[];
+    moved INTEGER;
+    stamp JSONB := jsonb_build_object('archived_at', NOW());
+BEGIN
+    IF target = current_experiment_id() THEN
+        RAISE EXCEPTION 'Cannot archive the active experiment';
+    END IF;
+
+    SELECT COALESCE(array_agg(id), '{}') INTO ids FROM interpretations WHERE experiment_id = target;
+    moved := archive_interpretations(ids, 'experiment');
+
+    -- Remaining rows tagged with the experiment (e.g. evaluations of another experiment's interpretations)
+    WITH gone AS (DELETE FROM evaluations WHERE experiment_id = target RETURNING *)
+    INSERT INTO evaluations_archive
+    SELECT (jsonb_populate_record(NULL::evaluations_archive, to_jsonb(gone) || stamp)).* FROM gone;
+    WITH gone AS (DELETE FROM judge_verdicts WHERE experiment_id = target RETURNING *)
+    INSERT INTO judge_verdicts_archive
+    SELECT (jsonb_populate_record(NULL::judge_verdicts_archive, to_jsonb(gone) || stamp)).* FROM gone;
+
+    UPDATE experiments SET archived_at = NOW() WHERE id = target;
+    RETURN moved;
+END;
+$$;
+
+-- Work queue for distributed generation (see task_queue.py and worker.py): one row per cell of a run
+CREATE TABLE IF NOT EXISTS generation_tasks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    experiment_id UUID REFERENCES experiments(id) DEFAULT current_experiment_id(),
+    run_id UUID NOT NULL REFERENCES runs(id),
+    instrument_code TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    prompt_variant TEXT NOT NULL,
+    user_profile_id INTEGER NOT NULL,
+    seed BIGINT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued, leased, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_expires_at TIMESTAMPTZ,
+    interpretation_id UUID REFERENCES interpretations(id) ON DELETE SET NULL,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (run_id, instrument_code, score, prompt_variant, user_profile_id)
+);
+
+-- Lease up to batch_size claimable tasks (queued, or leased with an expired lease) without waiting on other claimers
+CREATE OR REPLACE FUNCTION claim_generation_tasks(worker_name TEXT, batch_size INTEGER, lease_seconds INTEGER)
+RETURNS SETOF generation_tasks LANGUAGE plpgsql AS $$
+BEGIN
+    -- Expired leases with no attempts left are given up
+    UPDATE generation_tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = NOW()
+    WHERE experiment_id = current_experiment_id() AND status = 'leased'
+      AND lease_expires_at < NOW() AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE generation_tasks t
+    SET status = 'leased', worker = worker_name, attempts = t.attempts + 1,
+        lease_expires_at = NOW() + make_interval(secs => lease_seconds), updated_at = NOW()
+    WHERE t.id IN (
+        SELECT c.id FROM generation_tasks c
+        WHERE c.experiment_id = current_experiment_id()
+          AND (c.status = 'queued' OR (c.status = 'leased' AND c.lease_expires_at < NOW()))
+          AND c.attempts < c.max_attempts
+        ORDER BY c.created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING t.*;
+END;
+$$;
+
+-- Extend the leases a worker still holds; returns their ids
+CREATE OR REPLACE FUNCTION heartbeat_generation_tasks(worker_name TEXT, task_ids UUID[], lease_seconds INTEGER)
+RETURNS SETOF UUID LANGUAGE sql AS $$
+    UPDATE generation_tasks
+    SET lease_expires_at = NOW() + make_interval(secs => lease_seconds), updated_at = NOW()
+    WHERE id = ANY(task_ids) AND worker = worker_name AND status = 'leased'
+    RETURNING id
+$$;
+
+-- Insert the interpretation and mark the task done in one transaction; a repeated completion returns the first one's id
+CREATE OR REPLACE FUNCTION complete_generation_task(task_id UUID, record JSONB)
+RETURNS UUID LANGUAGE plpgsql AS $$
+DECLARE
+    task generation_tasks;
+    new_id UUID;
+BEGIN
+    SELECT * INTO task FROM generation_tasks WHERE id = task_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Unknown generation task %', task_id;
+    END IF;
+    IF task.status = 'done' THEN
+        RETURN task.interpretation_id;
+    END IF;
+
+    -- Client-side ids (experiment.interpretation_id) make a repeated insert a no-op
+    new_id := COALESCE((record->>'id')::UUID, gen_random_uuid());
+    INSERT INTO interpretations (id, experiment_id, instrument_code, score, level, prompt_variant, user_profile_id,
+                                 interpretation_text, model, run_id, seed, prompt_hash, template_hash, data_hash,
+                                 api_key_alias, text_storage, text_length)
+    SELECT new_id, task.experiment_id, r.instrument_code, r.score, r.level, r.prompt_variant, r.user_profile_id,
+           r.interpretation_text, r.model, r.run_id, r.seed, r.prompt_hash, r.template_hash, r.data_hash,
+           r.api_key_alias, COALESCE(r.text_storage, 'inline'), r.text_length
+    FROM jsonb_populate_record(NULL::interpretations, record) r
+    ON CONFLICT (id) DO NOTHING;
+
+    UPDATE generation_tasks SET status = 'done', interpretation_id = new_id, error = NULL, updated_at = NOW()
+    WHERE id = task_id;
+    RETURN new_id;
+END;
+$$;
+
+-- Release a leased task after a failed attempt: back to the queue, or failed when out of attempts
+CREATE OR REPLACE FUNCTION fail_generation_task(task_id UUID, worker_name TEXT, reason TEXT)
+RETURNS TEXT LANGUAGE sql AS $$
+    UPDATE generation_tasks
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        worker = NULL, lease_expires_at = NULL, error = reason, updated_at = NOW()
+    WHERE id = task_id AND worker = worker_name AND status = 'leased'
+    RETURNING status
+$$;
+
+CREATE OR REPLACE FUNCTION generation_task_counts()
+RETURNS TABLE (run_id UUID, status TEXT, tasks BIGINT) LANGUAGE sql STABLE AS $$
+    SELECT g.run_id, g.status, COUNT(*) FROM generation_tasks g
+    WHERE g.experiment_id = current_experiment_id()
+    GROUP BY g.run_id, g.status
+$$;
+
 -- Index for quick lookups
 CREATE INDEX IF NOT EXISTS idx_interpretations_instrument ON interpretations(instrument_code);
 CREATE INDEX IF NOT EXISTS idx_interpretations_variant ON interpretations(prompt_variant);
 CREATE INDEX IF NOT EXISTS idx_evaluations_evaluator ON evaluations(evaluator_name);
+CREATE INDEX IF NOT EXISTS idx_judge_verdicts_model ON judge_verdicts(judge_model);
+CREATE INDEX IF NOT EXISTS idx_interpretations_run ON interpretations(run_id);
+CREATE INDEX IF NOT EXISTS idx_interpretations_prompt_hash ON interpretations(prompt_hash);
+CREATE INDEX IF NOT EXISTS idx_interpretations_experiment ON interpretations(experiment_id);
+CREATE INDEX IF NOT EXISTS idx_evaluations_experiment ON evaluations(experiment_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_judge_verdicts_experiment ON judge_verdicts(experiment_id);
+CREATE INDEX IF NOT EXISTS idx_generation_tasks_claim ON generation_tasks(experiment_id, status, created_at);
 """
 
-print("=== Supabase Schema ===")
-print("Copy and run this SQL in your Supabase SQL Editor:")
-print("https://supabase.com/dashboard/project/_/sql")
-print()
-print(SQL_SCHEMA)
-print()
-print("After running the SQL, this script will verify the connection...")
-
-# Test connection
-try:
-    result = supabase.table("interpretations").select("id").limit(1).execute()
-    print("✅ Connection successful! Tables exist.")
-except Exception as e:
-    print(f"⚠️  Tables not yet created or connection error: {e}")
-    print("Run the SQL above first, then re-run this script.")
+
+def main():
+    print("=== Supabase Schema ===")
+    print("Copy and run this SQL in your Supabase SQL Editor:")
+    print("https://supabase.com/dashboard/project/_/sql")
+    print()
+    print(SQL_SCHEMA)
+    print()
+    print("After running the SQL, this script will verify the connection...")
+
+    # Test connection
+    try:
+        result = get_supabase().table("interpretations").select("id").limit(1).execute()
+        print("✅ Connection successful! Tables exist.")
+    except Exception as e:
+        print(f"⚠️  Tables not yet created or connection error: {e}")
+        print("Run the SQL above first, then re-run this script.")
+
+
+if __name__ == "__main__":
+    main()
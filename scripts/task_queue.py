@@ -0,0 +1,286 @@
+"""
+Work queue of generation tasks shared by any number of workers (see worker.py).
+One row per matrix cell of a run in `generation_tasks`:
+
+    queued --claim--> leased --complete--> done
+                        |  \--fail------> queued (attempts left) / failed
+                        \--lease expires--> claimable again
+
+Claims lock rows with SKIP LOCKED, so concurrent workers never get the same
+task. A worker extends its leases with heartbeats. If it dies, its leases
+expire and the tasks are claimed again. Completion inserts the
+interpretation and marks the task done in one transaction, and is
+idempotent: a late duplicate completion returns the first one's
+interpretation id.
+
+Two backends with the same methods:
+  - SupabaseTaskQueue: the generation_tasks table and RPCs from setup_supabase.py
+  - SQLiteTaskQueue:   a local file (queue URL sqlite:///relative/path or
+                       sqlite:////absolute/path) for running
+                       several local worker processes without a database server
+"""
+import sqlite3
+import threading
+import time
+import uuid
+
+ENQUEUE_BATCH = 500  # Rows per enqueue request
+TERMINAL_STATUSES = ("done", "failed")
+
+CELL_COLUMNS = ("instrument_code", "score", "level", "prompt_variant", "user_profile_id")
+RECORD_COLUMNS = CELL_COLUMNS + (
+    "interpretation_text", "model", "run_id", "seed", "prompt_hash", "template_hash", "data_hash", "api_key_alias"
+)
+
+
+class SupabaseTaskQueue:
+    """Tasks of the active experiment in Supabase."""
+
+    def __init__(self):
+        from db import get_supabase
+
+        self.client = get_supabase()
+
+    def register_run(self, seed: int, model: str, config: dict) -> str:
+        from runs import register_run
+
+        return register_run(seed, model, "worker", config)
+
+    def existing_keys(self) -> set[tuple]:
+        """(instrument, score, variant, profile) of cells with a non-empty interpretation or a pending task."""
+        from db import fetch_all, select_active
+        from generate_interpretations_parallel import get_existing_keys
+
+        # Both reads are paged (get_existing_keys too): a truncated set would queue cells twice
+        pending = fetch_all(lambda: select_active(
+            "generation_tasks", "id, instrument_code, score, prompt_variant, user_profile_id"
+        ).in_("status", ["queued", "leased"]).order("id"))
+        return get_existing_keys() | {
+            (r["instrument_code"], r["score"], r["prompt_variant"], r["user_profile_id"]) for r in pending
+        }
+
+    def enqueue(self, tasks: list[dict]):
+        """Insert tasks; cells already queued for the same run are skipped."""
+        for i in range(0, len(tasks), ENQUEUE_BATCH):
+            self.client.table("generation_tasks").upsert(
+                tasks[i:i + ENQUEUE_BATCH],
+                on_conflict="run_id,instrument_code,score,prompt_variant,user_profile_id",
+                ignore_duplicates=True,
+            ).execute()
+
+    def claim(self, worker: str, batch: int, lease_seconds: int) -> list[dict]:
+        return self.client.rpc("claim_generation_tasks", {
+            "worker_name": worker, "batch_size": batch, "lease_seconds": lease_seconds,
+        }).execute().data
+
+    def heartbeat(self, worker: str, task_ids: list[str], lease_seconds: int) -> list[str]:
+        """Extend leases; returns the ids this worker still holds."""
+        return self.client.rpc("heartbeat_generation_tasks", {
+            "worker_name": worker, "task_ids": task_ids, "lease_seconds": lease_seconds,
+        }).execute().data
+
+    def complete(self, task_id: str, record: dict) -> str:
+        from text_store import split_texts, write_texts
+
+        (record,), texts = split_texts(self.client, [record])
+        write_texts(self.client, texts)  # Compressed text (TEXT_STORAGE=zstd) before its row
+        return self.client.rpc("complete_generation_task", {"task_id": task_id, "record": record}).execute().data
+
+    def fail(self, task_id: str, worker: str, error: str):
+        self.client.rpc("fail_generation_task", {
+            "task_id": task_id, "worker_name": worker, "reason": error,
+        }).execute()
+
+    def counts(self) -> list[dict]:
+        """[{"run_id", "status", "tasks"}] of the active experiment."""
+        return self.client.rpc("generation_task_counts").execute().data
+
+    def finish_runs(self):
+        """Close the `runs` rows of runs with no queued or leased tasks left."""
+        from runs import finish_run
+
+        by_run = {}
+        for c in self.counts():
+            by_run.setdefault(c["run_id"], {})[c["status"]] = c["tasks"]
+        for run_id, statuses in by_run.items():
+            if set(statuses) <= set(TERMINAL_STATUSES):
+                failed = statuses.get("failed", 0)
+                finish_run(run_id, "partial" if failed else "done", statuses.get("done", 0), failed)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_tasks (
+    id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    instrument_code TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    prompt_variant TEXT NOT NULL,
+    user_profile_id INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_expires_at REAL,
+    interpretation_id TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE (run_id, instrument_code, score, prompt_variant, user_profile_id)
+);
+CREATE INDEX IF NOT EXISTS idx_generation_tasks_claim ON generation_tasks(status, lease_expires_at);
+CREATE TABLE IF NOT EXISTS interpretations (
+    id TEXT PRIMARY KEY,
+    instrument_code TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    prompt_variant TEXT NOT NULL,
+    user_profile_id INTEGER,
+    interpretation_text TEXT NOT NULL,
+    model TEXT,
+    run_id TEXT,
+    seed INTEGER,
+    prompt_hash TEXT,
+    template_hash TEXT,
+    data_hash TEXT,
+    api_key_alias TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteTaskQueue:
+    """
+    Local stand-in with the same semantics. SQLite allows one writer at a
+    time, so BEGIN IMMEDIATE plays the role of SKIP LOCKED: claims from
+    different processes are serialized and never overlap.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        if "api_key_alias" not in {r["name"] for r in self.conn.execute("PRAGMA table_info(interpretations)")}:
+            self.conn.execute("ALTER TABLE interpretations ADD COLUMN api_key_alias TEXT")  # Files from before key pools
+        self._lock = threading.Lock()  # One connection shared by the worker's threads
+
+    def _transaction(self, fn):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def register_run(self, seed: int, model: str, config: dict) -> str:
+        return str(uuid.uuid4())  # No runs table locally
+
+    def existing_keys(self) -> set[tuple]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT instrument_code, score, prompt_variant, user_profile_id FROM interpretations"
+                " WHERE TRIM(interpretation_text) != ''"
+                " UNION SELECT instrument_code, score, prompt_variant, user_profile_id FROM generation_tasks"
+                " WHERE status IN ('queued', 'leased')"
+            ).fetchall()
+        return {tuple(r) for r in rows}
+
+    def enqueue(self, tasks: list[dict]):
+        now = time.time()
+        columns = ("id", "run_id", "instrument_code", "score", "level", "prompt_variant", "user_profile_id",
+                   "seed", "max_attempts", "created_at")
+        rows = [(str(uuid.uuid4()), *(t[c] for c in columns[1:-1]), now) for t in tasks]
+        self._transaction(lambda conn: conn.executemany(
+            f"INSERT OR IGNORE INTO generation_tasks ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        ))
+
+    def claim(self, worker: str, batch: int, lease_seconds: int) -> list[dict]:
+        def claim(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE generation_tasks SET status = 'failed', error = COALESCE(error, 'lease expired')"
+                " WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now,),
+            )
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM generation_tasks"
+                " WHERE (status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))"
+                " AND attempts < max_attempts ORDER BY created_at, rowid LIMIT ?",
+                (now, batch),
+            )]
+            if not ids:
+                return []
+            marks = ", ".join("?" * len(ids))
+            conn.execute(
+                "UPDATE generation_tasks SET status = 'leased', worker = ?, attempts = attempts + 1,"
+                f" lease_expires_at = ? WHERE id IN ({marks})",
+                (worker, now + lease_seconds, *ids),
+            )
+            return [dict(r) for r in conn.execute(f"SELECT * FROM generation_tasks WHERE id IN ({marks})", ids)]
+
+        return self._transaction(claim)
+
+    def heartbeat(self, worker: str, task_ids: list[str], lease_seconds: int) -> list[str]:
+        def heartbeat(conn):
+            marks = ", ".join("?" * len(task_ids))
+            held = [r["id"] for r in conn.execute(
+                f"SELECT id FROM generation_tasks WHERE id IN ({marks}) AND worker = ? AND status = 'leased'",
+                (*task_ids, worker),
+            )]
+            conn.executemany(
+                "UPDATE generation_tasks SET lease_expires_at = ? WHERE id = ?",
+                [(time.time() + lease_seconds, i) for i in held],
+            )
+            return held
+
+        return self._transaction(heartbeat) if task_ids else []
+
+    def complete(self, task_id: str, record: dict) -> str:
+        def complete(conn):
+            task = conn.execute("SELECT status, interpretation_id FROM generation_tasks WHERE id = ?", (task_id,)).fetchone()
+            if task is None:
+                raise ValueError(f"Unknown task {task_id}")
+            if task["status"] == "done":
+                return task["interpretation_id"]  # Completed already (e.g. by a worker whose lease had expired)
+            interpretation_id = record.get("id") or str(uuid.uuid4())
+            conn.execute(
+                f"INSERT OR IGNORE INTO interpretations (id, {', '.join(RECORD_COLUMNS)}, created_at)"
+                f" VALUES (?, {', '.join('?' * len(RECORD_COLUMNS))}, ?)",
+                (interpretation_id, *(record[c] for c in RECORD_COLUMNS), time.time()),
+            )
+            conn.execute(
+                "UPDATE generation_tasks SET status = 'done', interpretation_id = ?, error = NULL WHERE id = ?",
+                (interpretation_id, task_id),
+            )
+            return interpretation_id
+
+        return self._transaction(complete)
+
+    def fail(self, task_id: str, worker: str, error: str):
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE generation_tasks SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,"
+            " worker = NULL, lease_expires_at = NULL, error = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (error, task_id, worker),
+        ))
+
+    def counts(self) -> list[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT run_id, status, COUNT(*) AS tasks FROM generation_tasks GROUP BY run_id, status"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def finish_runs(self):
+        pass  # No runs table locally
+
+
+def open_queue(url: str = None):
+    """SQLiteTaskQueue for sqlite:///path, the Supabase queue otherwise."""
+    if url and url.startswith("sqlite:///"):
+        return SQLiteTaskQueue(url[len("sqlite:///"):])
+    return SupabaseTaskQueue()
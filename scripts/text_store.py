@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Compressed storage and lazy loading of interpretation texts.
+Interpretations keep their metadata in `interpretations`. Each text is stored
+either inline (interpretation_text, text_storage='inline') or as a zstd frame in
+`interpretation_texts` (text_storage='zstd'; interpretation_text is then '').
+zstd frames are compressed with a dictionary trained on earlier outputs and
+shared by all rows (`text_dictionaries`). Outputs of one experiment repeat most
+of their phrasing, so the dictionary compresses even short texts several times.
+text_length is kept for every row, so hot paths (listing, existence checks,
+statistics) never need the text itself.
+
+Readers get text through TextLoader, which fetches missing texts in batches,
+decompresses them and keeps them in an LRU cache. The text is fetched only
+when it is displayed, validated or judged. A row's text_storage may be stale
+(the app caches row metadata across `compress` runs); the loader then finds
+the text in the other storage. Dictionaries trained by another process are
+fetched the first time a text needs them.
+
+New interpretations are written compressed when TEXT_STORAGE=zstd and a
+dictionary exists. Rows already stored are moved with `compress`.
+
+Usage:
+    python scripts/text_store.py stats                 # Rows and bytes per storage
+    python scripts/text_store.py train [--samples=2000]
+    python scripts/text_store.py compress              # Move inline texts to zstd
+    python scripts/text_store.py inline                # Move zstd texts back inline
+"""
+import base64
+import os
+import threading
+from collections import OrderedDict
+
+TEXT_STORAGE = os.environ.get("TEXT_STORAGE", "inline")  # How new interpretations are written: inline / zstd
+DICTIONARY_SIZE = 112_640  # zstd's default dictionary size (110 KB)
+TRAINING_SAMPLES = 2000
+COMPRESSION_LEVEL = 10  # Texts are written once and read many times
+TEXT_CACHE_ENTRIES = 500  # Decompressed texts kept per loader
+FETCH_BATCH = 100  # Ids per request (keeps the in.(...) filter within URL limits)
+MIGRATE_BATCH = 100
+
+METADATA_COLUMNS = (
+    "id, experiment_id, instrument_code, score, level, prompt_variant, user_profile_id, model, run_id, "
+    "text_length, text_storage, created_at"
+)
+
+_dictionaries = {}  # Dictionary id -> zstd.ZstdCompressionDict
+_dictionaries_lock = threading.Lock()
+
+
+def _load_dictionaries(client, needed: set = frozenset()) -> dict:
+    """Dictionary id -> dictionary. Ids in `needed` not loaded yet (e.g. trained by another process) are fetched."""
+    import zstandard as zstd
+
+    with _dictionaries_lock:
+        if not _dictionaries:
+            query = client.table("text_dictionaries").select("id, dictionary")
+        elif not needed <= _dictionaries.keys():
+            query = client.table("text_dictionaries").select("id, dictionary").in_(
+                "id", list(needed - _dictionaries.keys())
+            )
+        else:
+            return _dictionaries
+        for row in query.execute().data:
+            _dictionaries[row["id"]] = zstd.ZstdCompressionDict(base64.b64decode(row["dictionary"]))
+        return _dictionaries
+
+
+def newest_dictionary(client):
+    """(id, dictionary) of the newest trained dictionary, or None before the first `train`."""
+    dictionaries = _load_dictionaries(client)
+    if not dictionaries:
+        return None
+    dictionary_id = max(dictionaries)
+    return dictionary_id, dictionaries[dictionary_id]
+
+
+def compress(text: str, dictionary) -> str:
+    import zstandard as zstd
+
+    frame = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary).compress(text.encode())
+    return base64.b64encode(frame).decode()
+
+
+def decompress(data: str, dictionary) -> str:
+    import zstandard as zstd
+
+    return zstd.ZstdDecompressor(dict_data=dictionary).decompress(base64.b64decode(data)).decode()
+
+
+def text_length(text: str | None) -> int:
+    """Length of the text without surrounding whitespace; 0 means the row has no usable text."""
+    return len(text.strip()) if text else 0
+
+
+def split_texts(client, records: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    (interpretation records, interpretation_texts rows) to write. With
+    TEXT_STORAGE=zstd and a trained dictionary, texts move to compressed rows
+    and the records keep only text_length; otherwise records are unchanged.
+    Write the text rows first, so no reader sees a row whose text is missing.
+    """
+    newest = newest_dictionary(client) if TEXT_STORAGE == "zstd" else None
+    if not newest:
+        return records, []
+    dictionary_id, dictionary = newest
+    stored, texts = [], []
+    for record in records:
+        text = record["interpretation_text"]
+        texts.append({
+            "interpretation_id": record["id"],
+            "dictionary_id": dictionary_id,
+            "compressed": compress(text, dictionary),
+        })
+        stored.append({**record, "interpretation_text": "", "text_storage": "zstd", "text_length": text_length(text)})
+    return stored, texts
+
+
+def write_texts(client, texts: list[dict]):
+    if texts:
+        client.table("interpretation_texts").upsert(texts, on_conflict="interpretation_id").execute()
+
+
+class TextLoader:
+    """Fetches texts of interpretation rows on demand, with an LRU cache of decompressed texts."""
+
+    def __init__(self, get_client, cache_entries: int = TEXT_CACHE_ENTRIES):
+        self.get_client = get_client
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, interpretation_id: str) -> str | None:
+        with self._lock:
+            text = self._cache.get(interpretation_id)
+            if text is not None:
+                self._cache.move_to_end(interpretation_id)
+            return text
+
+    def _remember(self, texts: dict[str, str]):
+        with self._lock:
+            for interpretation_id, text in texts.items():
+                self._cache[interpretation_id] = text
+                self._cache.move_to_end(interpretation_id)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _fetch(self, rows: list[dict]) -> dict[str, str]:
+        """
+        Texts of rows (with id and text_storage) from the database. text_storage
+        is only where to look first: rows moved by `compress` or `inline` since
+        the caller read them are found in the other storage.
+        """
+        client = self.get_client()
+        compressed = [r["id"] for r in rows if r.get("text_storage") == "zstd"]
+        inline = [r["id"] for r in rows if r.get("text_storage") != "zstd"]
+        texts = self._fetch_inline(client, inline)
+        # Both migrations write the new storage before clearing the old one
+        texts.update(self._fetch_compressed(client, compressed + [i for i in inline if not texts.get(i)]))
+        texts.update(self._fetch_inline(client, [i for i in compressed if i not in texts]))
+        return texts
+
+    @staticmethod
+    def _fetch_inline(client, ids: list[str]) -> dict[str, str]:
+        texts = {}
+        for i in range(0, len(ids), FETCH_BATCH):
+            for r in client.table("interpretations").select("id, interpretation_text").in_(
+                "id", ids[i:i + FETCH_BATCH]
+            ).execute().data:
+                texts[r["id"]] = r["interpretation_text"] or ""
+        return texts
+
+    @staticmethod
+    def _fetch_compressed(client, ids: list[str]) -> dict[str, str]:
+        frames = []
+        for i in range(0, len(ids), FETCH_BATCH):
+            frames += client.table("interpretation_texts").select("interpretation_id, dictionary_id, compressed").in_(
+                "interpretation_id", ids[i:i + FETCH_BATCH]
+            ).execute().data
+        if not frames:
+            return {}
+        dictionaries = _load_dictionaries(client, {r["dictionary_id"] for r in frames})
+        return {r["interpretation_id"]: decompress(r["compressed"], dictionaries[r["dictionary_id"]]) for r in frames}
+
+    def texts(self, rows: list[dict], cache: bool = True) -> dict[str, str]:
+        """Id -> text of rows (dicts with id and text_storage). Bulk reads can skip the cache."""
+        found, missing = {}, []
+        for r in rows:
+            text = self._cached(r["id"])
+            if text is None:
+                missing.append(r)
+            else:
+                found[r["id"]] = text
+        if missing:
+            fetched = self._fetch(missing)
+            if cache:
+                self._remember(fetched)
+            found.update(fetched)
+        return found
+
+    def text(self, row: dict) -> str:
+        return self.texts([row]).get(row["id"], "")
+
+    def with_texts(self, rows: list[dict], cache: bool = False) -> list[dict]:
+        """Rows with interpretation_text filled in, for scripts that read every text once."""
+        texts = self.texts(rows, cache=cache)
+        return [{**r, "interpretation_text": texts.get(r["id"], "")} for r in rows]
+
+
+_loader = None
+
+
+def get_text_loader() -> TextLoader:
+    """Loader on the scripts' Supabase client (the app builds its own on its client)."""
+    global _loader
+    if _loader is None:
+        from db import get_supabase
+
+        _loader = TextLoader(get_supabase)
+    return _loader
+
+
+def train(samples: int = TRAINING_SAMPLES):
+    """Train a dictionary on texts of the active experiment and store it as the newest one."""
+    import random
+    import zstandard as zstd
+    from db import get_supabase, select_active
+
+    client = get_supabase()
+    rows = select_active("interpretations", "id, text_storage").gt("text_length", 0).execute().data
+    rows = random.Random(0).sample(rows, min(samples, len(rows)))
+    texts = [t.encode() for t in get_text_loader().texts(rows, cache=False).values()]
+    if len(texts) < 10:
+        print(f"❌ Za mało tekstów do trenowania słownika: {len(texts)}")
+        return
+
+    existing = client.table("text_dictionaries").select("id").execute().data
+    dictionary_id = max((r["id"] for r in existing), default=0) + 1
+    trained = zstd.train_dictionary(DICTIONARY_SIZE, texts, dict_id=dictionary_id, level=COMPRESSION_LEVEL)
+    client.table("text_dictionaries").insert({
+        "id": dictionary_id,
+        "dictionary": base64.b64encode(trained.as_bytes()).decode(),
+        "samples": len(texts),
+    }).execute()
+    _dictionaries.clear()
+
+    raw = sum(len(t) for t in texts)
+    packed = sum(len(zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=trained).compress(t)) for t in texts)
+    plain = sum(len(zstd.ZstdCompressor(level=COMPRESSION_LEVEL).compress(t)) for t in texts)
+    print(f"Słownik {dictionary_id}: {len(texts)} próbek, {len(trained.as_bytes()) / 1024:.0f} KB")
+    print(f"Kompresja próbek: {raw / packed:.1f}x ze słownikiem, {raw / plain:.1f}x bez")
+
+
+def migrate(to_storage: str):
+    """Move texts of the active experiment between inline and zstd storage, in batches."""
+    from db import get_supabase, select_active
+
+    client = get_supabase()
+    from_storage = "inline" if to_storage == "zstd" else "zstd"
+    newest = newest_dictionary(client)
+    if to_storage == "zstd" and not newest:
+        print("❌ Brak słownika; uruchom najpierw: python scripts/text_store.py train")
+        return
+
+    rows = select_active("interpretations", "id, text_storage").eq("text_storage", from_storage).gt(
+        "text_length", 0
+    ).execute().data
+    loader = get_text_loader()
+    for i in range(0, len(rows), MIGRATE_BATCH):
+        batch = rows[i:i + MIGRATE_BATCH]
+        texts = loader.texts(batch, cache=False)
+        ids = list(texts)
+        if to_storage == "zstd":
+            dictionary_id, dictionary = newest
+            write_texts(client, [
+                {"interpretation_id": interpretation_id, "dictionary_id": dictionary_id, "compressed": compress(text, dictionary)}
+                for interpretation_id, text in texts.items()
+            ])
+            # text_length stays as the trigger computed it from the inline text
+            client.table("interpretations").update({"interpretation_text": "", "text_storage": "zstd"}).in_(
+                "id", ids
+            ).execute()
+        else:
+            for interpretation_id, text in texts.items():
+                client.table("interpretations").update({"interpretation_text": text, "text_storage": "inline"}).eq(
+                    "id", interpretation_id
+                ).execute()
+            client.table("interpretation_texts").delete().in_("interpretation_id", ids).execute()
+        print(f"[{min(i + MIGRATE_BATCH, len(rows))}/{len(rows)}] {from_storage} -> {to_storage}")
+    print(f"✅ Przeniesiono {len(rows)} tekstów do {to_storage}")
+
+
+def stats():
+    from collections import Counter
+    from db import get_supabase, select_active
+
+    rows = select_active("interpretations", "id, text_storage, text_length").execute().data
+    counts = Counter(r["text_storage"] for r in rows)
+    chars = Counter()
+    for r in rows:
+        chars[r["text_storage"]] += r["text_length"] or 0
+    print(f"Tryb zapisu nowych interpretacji (TEXT_STORAGE): {TEXT_STORAGE}")
+    for storage in sorted(counts):
+        print(f"  {storage:<7} {counts[storage]:>6} interpretacji, {chars[storage] / 1e6:.1f} mln znaków")
+
+    compressed_ids = [r["id"] for r in rows if r["text_storage"] == "zstd"]
+    if compressed_ids:
+        packed = 0
+        for i in range(0, len(compressed_ids), FETCH_BATCH):
+            packed += sum(
+                len(r["compressed"]) * 3 // 4  # base64 -> bytes
+                for r in get_supabase().table("interpretation_texts").select("compressed").in_(
+                    "interpretation_id", compressed_ids[i:i + FETCH_BATCH]
+                ).execute().data
+            )
+        print(f"  zstd: {packed / 1e6:.2f} MB skompresowanych, ~{chars['zstd'] / max(packed, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--") and "=" in arg)
+    if command == "stats":
+        stats()
+    elif command == "train":
+        train(int(options.get("samples", TRAINING_SAMPLES)))
+    elif command == "compress":
+        migrate("zstd")
+    elif command == "inline":
+        migrate("inline")
+    else:
+        print(__doc__)
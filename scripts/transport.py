@@ -0,0 +1,82 @@
+"""
+Tuned HTTP transport for Supabase, shared by every client in a process
+(db.get_supabase and the Streamlit app pass it as ClientOptions.httpx_client).
+
+What differs from supabase-py's own httpx clients:
+  - one connection pool for PostgREST, RPC and auth calls instead of one per sub-client
+  - idle connections are kept for HTTP_KEEPALIVE_SECONDS: httpx drops them after
+    5 s, so every write after an LLM call paid a new TCP + TLS handshake
+  - HTTP/2 when h2 is installed, multiplexing concurrent calls (app sessions,
+    worker threads) over one connection
+  - a short connect timeout next to the overall one, so a dead host fails fast
+  - responses are gzip-compressed (httpx sends Accept-Encoding). Request bodies
+    over SUPABASE_GZIP_REQUEST_MIN_BYTES are gzip-compressed too. This is off by
+    default: PostgREST itself does not decode compressed bodies, so it only works
+    behind a gateway that does (and against postgrest_stub.py).
+
+While profiling (profiling.py), every request is timed as a stage
+"db <METHOD> <table>".
+
+Settings come from the environment: SUPABASE_TIMEOUT (seconds, default 30) and
+SUPABASE_GZIP_REQUEST_MIN_BYTES (default 0, off).
+"""
+import gzip
+import os
+from importlib.util import find_spec
+import httpx
+import profiling
+
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("SUPABASE_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT_SECONDS = 5.0
+HTTP_KEEPALIVE_SECONDS = 300.0  # Outlives the LLM calls between two writes
+HTTP_MAX_CONNECTIONS = 64  # App sessions and generator threads share one pool
+GZIP_REQUEST_MIN_BYTES = int(os.environ.get("SUPABASE_GZIP_REQUEST_MIN_BYTES", 0))
+GZIP_LEVEL = 5  # Fast; interpretation texts compress ~4x at any level
+
+
+def stage_name(request: httpx.Request) -> str:
+    """"db GET interpretations", "db POST rpc/current_experiment_id", ..."""
+    path = request.url.path
+    return f"db {request.method} {path.split('/rest/v1/', 1)[-1] if '/rest/v1/' in path else path}"
+
+
+class GzipRequestTransport(httpx.HTTPTransport):
+    """HTTPTransport that gzips request bodies of at least `min_bytes` (0 = never)."""
+
+    def __init__(self, min_bytes: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.min_bytes = min_bytes
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.min_bytes and request.method in ("POST", "PATCH", "PUT") and "content-encoding" not in request.headers:
+            body = request.read()
+            if len(body) >= self.min_bytes:
+                headers = {k: v for k, v in request.headers.items() if k.lower() != "content-length"}
+                request = httpx.Request(
+                    request.method, request.url, headers={**headers, "Content-Encoding": "gzip"},
+                    content=gzip.compress(body, GZIP_LEVEL), extensions=request.extensions,
+                )
+        if profiling.enabled():
+            with profiling.stage(stage_name(request)):
+                response = super().handle_request(request)
+                response.read()  # The body is part of the call; httpx does not read it twice
+            return response
+        return super().handle_request(request)
+
+
+def build_http_client(gzip_min_bytes: int = GZIP_REQUEST_MIN_BYTES, http2: bool = None) -> httpx.Client:
+    """Pooled keep-alive client; HTTP/2 if h2 is installed (unless http2=False)."""
+    transport = GzipRequestTransport(
+        min_bytes=gzip_min_bytes,
+        http2=find_spec("h2") is not None if http2 is None else http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+    )
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        follow_redirects=True,
+    )
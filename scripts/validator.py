@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Rule-based validation of generated interpretations.
+All patterns are compiled once from instruments_extended.json and the user
+profiles, so checking a completion costs a few regex scans. The generators
+run it on every completion and re-queue cells that fail.
+
+Checks:
+  - empty:          no text at all
+  - truncated:      the model stopped on the token limit (finish_reason == "length")
+  - wrong_language: text is not in the profile's language
+  - missing_crisis: score at or above specialist_thresholds.crisis_support
+                    but no crisis support number in the text
+  - wrong_name:     text mentions another test user's name
+  - wrong_level:    stored level differs from the level of the score in the
+                    instrument's scoring ranges (see levels.py)
+
+Usage:
+    python scripts/validator.py      # Validate all stored interpretations
+"""
+import re
+from functools import lru_cache
+from levels import UNRESOLVED, compile_scales
+
+CRISIS_PHONE_PATTERN = r"116[\s-]?123"
+
+# Frequent function words per language, used to tell languages apart
+LANGUAGE_MARKERS = {
+    "pl": ["i", "w", "na", "się", "nie", "to", "jest", "że", "z", "do", "jak", "czy", "może", "lub", "oraz", "ale", "twój", "twoje"],
+    "en": ["the", "and", "of", "is", "you", "your", "that", "with", "for", "this", "are", "can", "it", "be"],
+}
+MIN_LANGUAGE_MARKERS = 20  # Shorter texts are not checked for language
+
+# Polish case endings appended to a name stem (Tomk-a, Tomk-iem, Ani-ę, Magd-zie)
+NAME_ENDINGS = ["a", "ą", "ę", "e", "i", "o", "u", "y", "ie", "iu", "zie", "owi", "em", "iem"]
+
+
+def name_pattern(name: str) -> str:
+    """Regex matching a Polish first name and its declined forms (Tomek -> Tomka, Ania -> Anię).
+
+    The bare stem is not a match on its own: "Ani" (also the word "ani"), "Tomk", "Magd".
+    """
+    if name.endswith("ek"):
+        stem = name[:-2] + name[-1]
+    elif name[-1] in "aeiouy":
+        stem = name[:-1]
+    else:
+        stem = name
+    return rf"{re.escape(name)}|{re.escape(stem)}(?:{'|'.join(NAME_ENDINGS)})"
+
+
+class InterpretationValidator:
+    """Compiled validation rules for one set of instruments and profiles."""
+
+    def __init__(self, instruments: dict, profiles: list[dict]):
+        self.scales = compile_scales(instruments)
+        self.crisis_thresholds = {
+            code: data["specialist_thresholds"]["crisis_support"]
+            for code, data in instruments.items()
+            if "crisis_support" in data.get("specialist_thresholds", {})
+        }
+        self.crisis_re = re.compile(CRISIS_PHONE_PATTERN)
+
+        # One alternation per language, word-bounded
+        self.language_res = {
+            lang: re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE)
+            for lang, words in LANGUAGE_MARKERS.items()
+        }
+
+        # One automaton over all profile names; the named group tells which profile matched
+        self.profile_names = {f"p{p['id']}": p["name"] for p in profiles}
+        self.names_re = re.compile(
+            r"\b(?:" + "|".join(f"(?P<p{p['id']}>{name_pattern(p['name'])})" for p in profiles) + r")\b"
+        )
+
+    def detect_language(self, text: str) -> str | None:
+        counts = {lang: len(r.findall(text)) for lang, r in self.language_res.items()}
+        if sum(counts.values()) < MIN_LANGUAGE_MARKERS:
+            return None
+        return max(counts, key=counts.get)
+
+    def check_level(self, instrument_code: str, score: int, level: str) -> str | None:
+        """Problem with a stored level, or None if it is the level of the score."""
+        scale = self.scales.get((instrument_code, None))
+        if scale is None:
+            return None
+        index = scale.band_index(score)
+        if index == UNRESOLVED:
+            return "wrong_level:out_of_range"
+        if scale.bands[index]["level"] != level:
+            return f"wrong_level:{scale.bands[index]['level']}"
+        return None
+
+    def validate(self, text: str | None, instrument_code: str, score: int, profile: dict,
+                 finish_reason: str | None = None, level: str | None = None) -> list[str]:
+        """Return a list of problems; an empty list means the interpretation is valid."""
+        if not text or not text.strip():
+            return ["empty"]
+
+        problems = []
+
+        if level is not None:
+            level_problem = self.check_level(instrument_code, score, level)
+            if level_problem:
+                problems.append(level_problem)
+
+        if finish_reason == "length":
+            problems.append("truncated")
+
+        language = self.detect_language(text)
+        expected_language = profile.get("language", "pl")
+        if language and language != expected_language:
+            problems.append(f"wrong_language:{language}")
+
+        threshold = self.crisis_thresholds.get(instrument_code)
+        if threshold is not None and score >= threshold and not self.crisis_re.search(text):
+            problems.append("missing_crisis")
+
+        own_group = f"p{profile['id']}"
+        for match in self.names_re.finditer(text):
+            if match.lastgroup != own_group:
+                problems.append(f"wrong_name:{self.profile_names[match.lastgroup]}")
+                break
+
+        return problems
+
+
+@lru_cache(maxsize=None)
+def load_validator() -> InterpretationValidator:
+    """Validator built from the repo's data files (compiled once per process)."""
+    from experiment import instruments, user_profiles
+
+    return InterpretationValidator(instruments(), user_profiles())
+
+
+def main():
+    """Validate all stored interpretations and print the failing ones."""
+    from collections import Counter
+    from db import select_active
+    from experiment import user_profiles
+
+    validator = load_validator()
+    profiles = {p["id"]: p for p in user_profiles()}
+
+    from text_store import get_text_loader
+
+    rows = get_text_loader().with_texts(select_active("interpretations",
+        "id, instrument_code, score, level, prompt_variant, user_profile_id, text_storage"
+    ).execute().data)
+
+    failures = Counter()
+    invalid = 0
+    for r in rows:
+        problems = validator.validate(
+            r["interpretation_text"], r["instrument_code"], r["score"], profiles[r["user_profile_id"]],
+            level=r["level"]
+        )
+        if problems:
+            invalid += 1
+            failures.update(p.split(":")[0] for p in problems)
+            print(f"❌ {r['id']} {r['instrument_code']}/{r['prompt_variant']}/profile={r['user_profile_id']}/score={r['score']}: {', '.join(problems)}")
+
+    print(f"\nSprawdzono {len(rows)} interpretacji, niepoprawnych: {invalid}")
+    for problem, count in failures.most_common():
+        print(f"  - {problem}: {count}")
+
+
+if __name__ == "__main__":
+    main()
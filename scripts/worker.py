@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Distributed generation through the generation_tasks work queue (task_queue.py).
+`enqueue` registers a run and puts every matrix cell that has neither an
+interpretation nor a pending task in the queue.
+Then any number of `work` processes, on any number of hosts, each with its
+own OPENAI_API_KEY or key pool (OPENAI_KEY_POOL, see key_pool.py) if needed,
+claim leased batches, keep the leases alive with heartbeats and complete
+tasks idempotently. A worker that dies only
+delays its tasks until their leases expire. A worker exits once nothing is
+queued or leased.
+
+Rendering and validation run in a process pool, as in
+generate_interpretations_parallel.py.
+
+--queue=sqlite:///path (sqlite:////path for an absolute one) uses a local SQLite file instead of Supabase, e.g. to
+run several local workers. --simulate (SQLite only) replaces API calls with a
+short sleep and a placeholder text, to exercise the queue without spending.
+
+Usage:
+    python scripts/worker.py enqueue [--seed=123] [--max-attempts=3]
+    python scripts/worker.py work [--name=host-1] [--concurrency=20] [--batch=5] [--lease=120]
+    python scripts/worker.py status
+    python scripts/worker.py enqueue --queue=sqlite:///queue.db
+    python scripts/worker.py work --queue=sqlite:///queue.db --simulate
+"""
+import asyncio
+import os
+import socket
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from experiment import PROMPT_VARIANTS, cell_seed, level_for_score, test_scores, user_profiles
+from profiling import stage
+from task_queue import TERMINAL_STATUSES, SQLiteTaskQueue, open_queue
+
+DEFAULT_CONCURRENCY = 20  # Claiming slots per worker
+DEFAULT_BATCH = 5  # Tasks per claim
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+HEARTBEATS_PER_LEASE = 4  # A lease survives a few missed heartbeats
+POLL_SECONDS = 5.0  # Wait before claiming again while others hold leases
+SIMULATED_LATENCY = 0.2
+
+
+def enqueue(queue, seed: int = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+    """Register a run and queue every cell without an interpretation; returns the run id."""
+    from runs import new_run_seed
+    from generate_interpretations_parallel import MODEL
+
+    if seed is None:
+        seed = new_run_seed()
+    existing = queue.existing_keys()
+    run_id = queue.register_run(seed, MODEL, {"queue": True, "max_attempts": max_attempts})
+
+    tasks = []
+    for instrument_code, scores in test_scores().items():
+        for score_info in scores:
+            for variant in PROMPT_VARIANTS:
+                if instrument_code not in variant["instruments"]:
+                    continue
+                for profile in user_profiles():
+                    if (instrument_code, score_info["score"], variant["id"], profile["id"]) in existing:
+                        continue
+                    tasks.append({
+                        "run_id": run_id,
+                        "instrument_code": instrument_code,
+                        "score": score_info["score"],
+                        "level": score_info["level"],
+                        "prompt_variant": variant["id"],
+                        "user_profile_id": profile["id"],
+                        "seed": cell_seed(seed, instrument_code, score_info["score"], variant["id"], profile["id"]),
+                        "max_attempts": max_attempts,
+                    })
+
+    queue.enqueue(tasks)
+    print(f"Run: {run_id}, seed: {seed}")
+    print(f"Zakolejkowano {len(tasks)} zadań (pominięto {len(existing)} istniejących lub oczekujących)")
+    return run_id
+
+
+def task_from_row(row: dict) -> dict:
+    """Task in the shape the generator's stage functions take."""
+    return {
+        "instrument_code": row["instrument_code"],
+        "score_info": {
+            "score": row["score"],
+            "level": row["level"],
+            "label": level_for_score(row["instrument_code"], row["score"])["label"],
+        },
+        "variant": next(v for v in PROMPT_VARIANTS if v["id"] == row["prompt_variant"]),
+        "profile": next(p for p in user_profiles() if p["id"] == row["user_profile_id"]),
+        "seed": row["seed"],
+        "run_id": row["run_id"],
+    }
+
+
+def pending_tasks(queue) -> int:
+    return sum(c["tasks"] for c in queue.counts() if c["status"] not in TERMINAL_STATUSES)
+
+
+async def work(queue, name: str, concurrency: int = DEFAULT_CONCURRENCY, batch: int = DEFAULT_BATCH,
+               lease_seconds: int = DEFAULT_LEASE_SECONDS, workers: int = None, simulate: bool = False):
+    """Claim, generate and complete tasks until the queue is drained."""
+    # Import by module name so the pool pickles the stage functions by an importable reference
+    from generate_interpretations_parallel import MODEL, build_record, describe, render_prompt, validate_completion
+    from db import get_key_pool
+    from key_pool import print_pool_summary
+
+    loop = asyncio.get_running_loop()
+    held = {}  # Task id -> claimed row, for heartbeats
+    stats = Counter()
+
+    async def generate(pool, task: dict, rendered: dict) -> tuple[str, list[str], str]:
+        """(text, validation problems, key alias) of one completion."""
+        if simulate:
+            await asyncio.sleep(SIMULATED_LATENCY)
+            return f"[symulacja] {rendered['prompt_hash']}", [], "symulacja"
+        with stage("api"):
+            response, alias = await get_key_pool().chat(
+                MODEL, rendered["prompt"], max_completion_tokens=16000, temperature=0.7
+            )
+        choice = response.choices[0]
+        with stage("validate"):
+            problems = await loop.run_in_executor(
+                pool, validate_completion, task, choice.message.content, choice.finish_reason
+            )
+        return choice.message.content, problems, alias
+
+    async def process(pool, row: dict):
+        task = task_from_row(row)
+        try:
+            with stage("render"):
+                rendered = await loop.run_in_executor(pool, render_prompt, task)
+            text, problems, alias = await generate(pool, task, rendered)
+            if problems:
+                stats["invalid"] += 1
+                print(f"INVALID: {describe(task)}: {', '.join(problems)}")
+                await asyncio.to_thread(queue.fail, row["id"], name, f"Validation: {', '.join(problems)}")
+            else:
+                with stage("queue complete"):
+                    await asyncio.to_thread(queue.complete, row["id"], build_record(task, rendered, text, alias))
+                stats["done"] += 1
+                print(f"[{name}] {stats['done']} ✓ {describe(task)} | score={row['score']} (próba {row['attempts']})")
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"ERROR: {describe(task)}: {e}")
+            await asyncio.to_thread(queue.fail, row["id"], name, str(e))
+        finally:
+            held.pop(row["id"], None)
+
+    async def slot(pool):
+        while True:
+            with stage("queue claim"):
+                rows = await asyncio.to_thread(queue.claim, name, batch, lease_seconds)
+            if not rows:
+                # Leases held by other workers may still expire and come back; our own
+                # are finished by the slots holding them
+                if await asyncio.to_thread(pending_tasks, queue) <= len(held):
+                    return
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            held.update((r["id"], r) for r in rows)
+            for row in rows:
+                await process(pool, row)
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_seconds / HEARTBEATS_PER_LEASE)
+            if not held:
+                continue
+            ids = list(held)
+            kept = set(await asyncio.to_thread(queue.heartbeat, name, ids, lease_seconds))
+            for lost in set(ids) - kept:
+                # Another worker took it over after our lease expired; completing stays idempotent
+                print(f"⚠️  Utracona dzierżawa zadania {lost}")
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        beat = asyncio.create_task(heartbeat())
+        await asyncio.gather(*[slot(pool) for _ in range(concurrency)])
+        beat.cancel()
+
+    await asyncio.to_thread(queue.finish_runs)
+    elapsed = time.time() - start_time
+    print(f"\n✅ [{name}] Kolejka pusta po {elapsed:.1f}s: ukończone {stats['done']}, "
+          f"niepoprawne {stats['invalid']}, błędy {stats['errors']}")
+    if not simulate:
+        print_pool_summary(get_key_pool())
+
+
+def print_status(queue):
+    by_run = {}
+    for c in queue.counts():
+        by_run.setdefault(c["run_id"], Counter())[c["status"]] += c["tasks"]
+    if not by_run:
+        print("Kolejka jest pusta.")
+    for run_id, statuses in by_run.items():
+        print(f"Run {run_id}: " + ", ".join(f"{s}={n}" for s, n in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--") and "=" in arg)
+    queue = open_queue(options.get("queue"))
+    simulate = "--simulate" in sys.argv
+
+    if simulate and not isinstance(queue, SQLiteTaskQueue):
+        print("❌ --simulate działa tylko z lokalną kolejką (--queue=sqlite:///...)")
+        sys.exit(1)
+
+    if command == "enqueue":
+        enqueue(queue, seed=int(options["seed"]) if "seed" in options else None,
+                max_attempts=int(options.get("max-attempts", DEFAULT_MAX_ATTEMPTS)))
+    elif command == "work":
+        asyncio.run(work(
+            queue,
+            name=options.get("name", f"{socket.gethostname()}-{os.getpid()}"),
+            concurrency=int(options.get("concurrency", DEFAULT_CONCURRENCY)),
+            batch=int(options.get("batch", DEFAULT_BATCH)),
+            lease_seconds=int(options.get("lease", DEFAULT_LEASE_SECONDS)),
+            workers=int(options["workers"]) if "workers" in options else None,
+            simulate=simulate,
+        ))
+    elif command == "status":
+        print_status(queue)
+    else:
+        print(__doc__)